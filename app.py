@@ -1,191 +1,77 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, abort, stream_with_context
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
-import cv2
-import face_recognition
-import numpy as np
-import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import schedule
-import time
-import threading
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-import bcrypt
-import jwt
+import click
+import concurrent.futures
 from dotenv import load_dotenv
+from models import db, User, Attendance, Timetable, Salary, Notification, Procurement, AttendanceArchive
+from face_index import face_index, decode_encoding
+import face_pipeline
+from attendance import record_check_in, record_check_out, attendance_snapshot, invalidate_snapshot, AttendanceError
+from events import attendance_events, stream as event_stream
+from reports import (attendance_page, check_month, parse_date, parse_date_range, ReportError,
+                     MIN_YEAR, MAX_YEAR)
+from notifications import notification_dispatcher, broadcast, DELIVERABLE_TYPES
+from stats_cache import stats_cache
+from principals import load_principal
+import sqlite_profile
+import instrumentation
+from exports import (MIMETYPES as EXPORT_MIMETYPES, export_formats, attendance_export, performance_export,
+                     salary_export, csv_chunks, xlsx_file, pdf_file, file_chunks)
+from performance import compute_scores, empty_score, load_scores, months_between, rebuild_month
+from payroll import run_payroll
+from lateness import reclassify
+from archive import archive_year, restore_year, archivable_years, drop_archives, year_label, ArchiveError
+from ingest import ingest, issue_device_token, device_from_header, DeviceAuthError, max_events as ingest_max_events
+from sqlalchemy.exc import IntegrityError
 
 load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///staff_management.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///staff_management.db').replace(
+    'postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+
+db.init_app(app)
+sqlite_profile.init_app(app)
+instrumentation.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
-
-# Database Models
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
-    role = db.Column(db.String(20), nullable=False)  # student, teacher, headteacher, deputy, bursar
-    full_name = db.Column(db.String(100), nullable=False)
-    phone_number = db.Column(db.String(20))
-    face_encoding = db.Column(db.Text)  # Store face encoding as JSON string
-    fingerprint_data = db.Column(db.Text)  # Store fingerprint data
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
-
-class Attendance(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    time_in = db.Column(db.DateTime)
-    time_out = db.Column(db.DateTime)
-    method = db.Column(db.String(20))  # face, fingerprint
-    status = db.Column(db.String(20))  # present, absent, late
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Timetable(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    subject = db.Column(db.String(50), nullable=False)
-    day_of_week = db.Column(db.String(20), nullable=False)
-    start_time = db.Column(db.Time, nullable=False)
-    end_time = db.Column(db.Time, nullable=False)
-    room = db.Column(db.String(20))
-    class_name = db.Column(db.String(20))
-
-class Performance(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    month = db.Column(db.Integer, nullable=False)
-    year = db.Column(db.Integer, nullable=False)
-    attendance_score = db.Column(db.Float, default=0.0)
-    punctuality_score = db.Column(db.Float, default=0.0)
-    overall_score = db.Column(db.Float, default=0.0)
-    remarks = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Salary(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    month = db.Column(db.Integer, nullable=False)
-    year = db.Column(db.Integer, nullable=False)
-    base_salary = db.Column(db.Float, nullable=False)
-    attendance_bonus = db.Column(db.Float, default=0.0)
-    performance_bonus = db.Column(db.Float, default=0.0)
-    total_salary = db.Column(db.Float, nullable=False)
-    paid = db.Column(db.Boolean, default=False)
-    paid_date = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Notification(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    title = db.Column(db.String(100), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    type = db.Column(db.String(20))  # email, sms, system
-    sent = db.Column(db.Boolean, default=False)
-    sent_at = db.Column(db.DateTime)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Procurement(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    item_name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.Text)
-    quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
-    supplier = db.Column(db.String(100))
-    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    approved_by = db.Column(db.Integer, db.ForeignKey('user.id'))
-    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected, completed
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+notification_dispatcher.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_principal(user_id)
 
 # Utility Functions
-def send_email(to_email, subject, message):
-    """Send email notification"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = os.getenv('EMAIL_USER', 'noreply@school.com')
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(message, 'plain'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(os.getenv('EMAIL_USER'), os.getenv('EMAIL_PASSWORD'))
-        text = msg.as_string()
-        server.sendmail(os.getenv('EMAIL_USER'), to_email, text)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email error: {e}")
-        return False
-
-def send_sms(phone_number, message):
-    """Send SMS notification using Twilio"""
-    try:
-        from twilio.rest import Client
-        client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-        message = client.messages.create(
-            body=message,
-            from_=os.getenv('TWILIO_PHONE_NUMBER'),
-            to=phone_number
-        )
-        return True
-    except Exception as e:
-        print(f"SMS error: {e}")
-        return False
+def device_token_secret():
+    return os.getenv('DEVICE_TOKEN_SECRET') or app.config['SECRET_KEY']
 
 def calculate_performance_score(teacher_id, month, year):
     """Calculate teacher performance score"""
-    attendances = Attendance.query.filter_by(
-        user_id=teacher_id
-    ).filter(
-        db.extract('month', Attendance.date) == month,
-        db.extract('year', Attendance.date) == year
-    ).all()
-    
-    if not attendances:
-        return 0.0
-    
-    total_days = len(attendances)
-    present_days = len([a for a in attendances if a.status == 'present'])
-    on_time_days = len([a for a in attendances if a.status != 'late'])
-    
-    attendance_score = (present_days / total_days) * 10
-    punctuality_score = (on_time_days / total_days) * 10
-    
-    return (attendance_score + punctuality_score) / 2
+    scores = compute_scores(month, year, user_ids=[teacher_id])
+    return scores.get(teacher_id, empty_score(teacher_id)).score
 
 def generate_performance_report(month, year):
     """Generate performance report for all teachers"""
     teachers = User.query.filter_by(role='teacher').all()
+    scores = load_scores(month, year, roles=['teacher'])
     report_data = []
     
     for teacher in teachers:
-        score = calculate_performance_score(teacher.id, month, year)
+        score = scores.get(teacher.id, empty_score(teacher.id)).score
         report_data.append({
             'teacher_name': teacher.full_name,
             'score': score,
@@ -194,6 +80,46 @@ def generate_performance_report(month, year):
     
     return report_data
 
+def admin_dashboard_stats(today):
+    """Statistics shown on the headteacher/deputy dashboard"""
+    total_teachers = User.query.filter_by(role='teacher').count()
+    total_students = User.query.filter_by(role='student').count()
+    
+    # Get today's attendance
+    today_attendance = Attendance.query.filter_by(date=today).count()
+    
+    return {
+        'total_teachers': total_teachers,
+        'total_students': total_students,
+        'today_attendance': today_attendance
+    }
+
+def bursar_dashboard_stats(month, year):
+    """Salary statistics shown on the bursar dashboard"""
+    pending_salaries = Salary.query.filter_by(
+        month=month,
+        year=year,
+        paid=False
+    ).count()
+    
+    total_salary_budget = db.session.query(db.func.sum(Salary.total_salary)).filter_by(
+        month=month,
+        year=year
+    ).scalar() or 0
+    
+    return {
+        'pending_salaries': pending_salaries,
+        'total_salary_budget': total_salary_budget
+    }
+
+def cached_admin_dashboard_stats(today, ttl=None):
+    return stats_cache.get_or_compute(f'admin_dashboard:{today}', ['user', 'attendance'],
+                                      lambda: admin_dashboard_stats(today), ttl)
+
+def cached_bursar_dashboard_stats(month, year, ttl=None):
+    return stats_cache.get_or_compute(f'bursar_dashboard:{year}-{month}', ['salary'],
+                                      lambda: bursar_dashboard_stats(month, year), ttl)
+
 # Routes
 @app.route('/')
 def index():
@@ -273,18 +199,10 @@ def admin_dashboard():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    # Get statistics
-    total_teachers = User.query.filter_by(role='teacher').count()
-    total_students = User.query.filter_by(role='student').count()
-    
-    # Get today's attendance
     today = datetime.now().date()
-    today_attendance = Attendance.query.filter_by(date=today).count()
+    stats = cached_admin_dashboard_stats(today)
     
-    return render_template('admin/dashboard.html',
-                         total_teachers=total_teachers,
-                         total_students=total_students,
-                         today_attendance=today_attendance)
+    return render_template('admin/dashboard.html', **stats)
 
 @app.route('/bursar/dashboard')
 @login_required
@@ -293,24 +211,11 @@ def bursar_dashboard():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    # Get salary statistics
     current_month = datetime.now().month
     current_year = datetime.now().year
+    stats = cached_bursar_dashboard_stats(current_month, current_year)
     
-    pending_salaries = Salary.query.filter_by(
-        month=current_month,
-        year=current_year,
-        paid=False
-    ).count()
-    
-    total_salary_budget = db.session.query(db.func.sum(Salary.total_salary)).filter_by(
-        month=current_month,
-        year=current_year
-    ).scalar() or 0
-    
-    return render_template('bursar/dashboard.html',
-                         pending_salaries=pending_salaries,
-                         total_salary_budget=total_salary_budget)
+    return render_template('bursar/dashboard.html', **stats)
 
 # Attendance Routes
 @app.route('/attendance/check-in', methods=['GET', 'POST'])
@@ -319,33 +224,12 @@ def check_in():
     if request.method == 'POST':
         method = request.form.get('method', 'manual')
         
-        # Check if already checked in today
-        today = datetime.now().date()
-        existing_attendance = Attendance.query.filter_by(
-            user_id=current_user.id,
-            date=today
-        ).first()
-        
-        if existing_attendance and existing_attendance.time_in:
-            flash('Already checked in today!', 'error')
+        try:
+            record_check_in(current_user.id, method)
+        except AttendanceError as e:
+            flash(str(e), 'error')
             return redirect(url_for('dashboard'))
         
-        # Create attendance record
-        if existing_attendance:
-            existing_attendance.time_in = datetime.now()
-            existing_attendance.method = method
-            existing_attendance.status = 'present'
-        else:
-            attendance = Attendance(
-                user_id=current_user.id,
-                date=today,
-                time_in=datetime.now(),
-                method=method,
-                status='present'
-            )
-            db.session.add(attendance)
-        
-        db.session.commit()
         flash('Check-in successful!', 'success')
         return redirect(url_for('dashboard'))
     
@@ -355,22 +239,12 @@ def check_in():
 @login_required
 def check_out():
     if request.method == 'POST':
-        today = datetime.now().date()
-        attendance = Attendance.query.filter_by(
-            user_id=current_user.id,
-            date=today
-        ).first()
-        
-        if not attendance or not attendance.time_in:
-            flash('No check-in record found for today!', 'error')
-            return redirect(url_for('dashboard'))
-        
-        if attendance.time_out:
-            flash('Already checked out today!', 'error')
+        try:
+            record_check_out(current_user.id)
+        except AttendanceError as e:
+            flash(str(e), 'error')
             return redirect(url_for('dashboard'))
         
-        attendance.time_out = datetime.now()
-        db.session.commit()
         flash('Check-out successful!', 'success')
         return redirect(url_for('dashboard'))
     
@@ -381,9 +255,27 @@ def check_out():
 @login_required
 def register_face():
     if request.method == 'POST':
-        # Handle face registration
-        # This would typically involve capturing an image and encoding it
-        flash('Face registration feature will be implemented with camera integration', 'info')
+        image = request.files.get('image')
+        if not image:
+            flash('No image provided!', 'error')
+            return redirect(url_for('register_face'))
+        
+        # Encoding runs in the worker pool; this thread only waits for it
+        future = face_pipeline.submit(current_user.id, image.read())
+        try:
+            result = future.result(timeout=face_pipeline.encoding_timeout())
+        except concurrent.futures.TimeoutError:
+            flash('Face registration timed out, please try again', 'error')
+            return redirect(url_for('register_face'))
+        
+        if result.error:
+            flash(f'Face registration failed: {result.error}', 'error')
+            return redirect(url_for('register_face'))
+        
+        user = current_user.load()
+        user.face_encoding = result.encoding
+        db.session.commit()
+        flash('Face registered successfully!', 'success')
         return redirect(url_for('dashboard'))
     
     return render_template('face_recognition/register.html')
@@ -392,8 +284,29 @@ def register_face():
 @login_required
 def verify_face():
     if request.method == 'POST':
-        # Handle face verification
-        flash('Face verification feature will be implemented with camera integration', 'info')
+        image = request.files.get('image')
+        if not image:
+            flash('No image provided!', 'error')
+            return redirect(url_for('verify_face'))
+        
+        future = face_pipeline.submit(current_user.id, image.read())
+        try:
+            result = future.result(timeout=face_pipeline.encoding_timeout())
+        except concurrent.futures.TimeoutError:
+            flash('Face verification timed out, please try again', 'error')
+            return redirect(url_for('verify_face'))
+        
+        if result.error:
+            flash(f'Face verification failed: {result.error}', 'error')
+            return redirect(url_for('verify_face'))
+        
+        lookup = face_index.identify(decode_encoding(result.encoding))
+        if not lookup.matches:
+            flash('Face not recognized', 'error')
+            return redirect(url_for('verify_face'))
+        
+        user = db.session.get(User, lookup.matches[0].user_id)
+        flash(f'Face recognized: {user.full_name} ({lookup.latency_ms:.1f} ms)', 'success')
         return redirect(url_for('dashboard'))
     
     return render_template('face_recognition/verify.html')
@@ -408,6 +321,11 @@ def performance_report():
     
     month = request.args.get('month', datetime.now().month, type=int)
     year = request.args.get('year', datetime.now().year, type=int)
+    try:
+        check_month(month, year)
+    except ReportError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('performance_report'))
     
     report_data = generate_performance_report(month, year)
     
@@ -423,15 +341,79 @@ def attendance_report():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    start_date = request.args.get('start_date', datetime.now().date())
-    end_date = request.args.get('end_date', datetime.now().date())
+    today = datetime.now().date()
+    try:
+        start_date, end_date = parse_date_range(
+            request.args.get('start_date'),
+            request.args.get('end_date'),
+            today
+        )
+        page = attendance_page(start_date, end_date, cursor=request.args.get('cursor'))
+    except ReportError as e:
+        flash(str(e), 'error')
+        start_date = end_date = today
+        page = attendance_page(start_date, end_date)
+    
+    return render_template('reports/attendance.html',
+                         attendances=page.rows,
+                         next_cursor=page.next_cursor,
+                         start_date=start_date,
+                         end_date=end_date)
+
+@app.route('/reports/<report>/export/<fmt>')
+@login_required
+def export_report(report, fmt):
+    if current_user.role not in ['headteacher', 'deputy', 'bursar']:
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
     
-    attendances = Attendance.query.filter(
-        Attendance.date >= start_date,
-        Attendance.date <= end_date
-    ).all()
+    if report not in ['attendance', 'performance', 'salary'] or fmt not in export_formats():
+        abort(404)
     
-    return render_template('reports/attendance.html', attendances=attendances)
+    month = request.args.get('month', datetime.now().month, type=int)
+    year = request.args.get('year', datetime.now().year, type=int)
+    if report != 'attendance':
+        try:
+            check_month(month, year)
+        except ReportError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('performance_report' if report == 'performance' else 'dashboard'))
+    
+    if report == 'attendance':
+        today = datetime.now().date()
+        try:
+            start_date, end_date = parse_date_range(
+                request.args.get('start_date'),
+                request.args.get('end_date'),
+                today
+            )
+        except ReportError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('attendance_report'))
+        header, rows = attendance_export(start_date, end_date)
+        filename = f'attendance_{start_date}_{end_date}'
+        title = f'Attendance Report {start_date} to {end_date}'
+    elif report == 'performance':
+        header, rows = performance_export(month, year)
+        filename = f'performance_{year}_{month:02d}'
+        title = f'Performance Report {month}/{year}'
+    else:
+        header, rows = salary_export(month, year)
+        filename = f'salary_{year}_{month:02d}'
+        title = f'Salary Report {month}/{year}'
+    
+    if fmt == 'csv':
+        body = stream_with_context(csv_chunks(header, rows))
+    elif fmt == 'xlsx':
+        body = file_chunks(xlsx_file(title, header, rows))
+    else:
+        body = file_chunks(pdf_file(title, header, rows))
+    
+    return app.response_class(
+        body,
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
 
 # Salary Routes
 @app.route('/salary/calculate')
@@ -443,44 +425,23 @@ def calculate_salary():
     
     month = request.args.get('month', datetime.now().month, type=int)
     year = request.args.get('year', datetime.now().year, type=int)
+    dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        check_month(month, year)
+    except ReportError as e:
+        if dry_run:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'error')
+        return redirect(url_for('bursar_dashboard'))
     
     # Calculate salaries for all staff
-    users = User.query.filter(User.role.in_(['teacher', 'headteacher', 'deputy'])).all()
-    
-    for user in users:
-        # Check if salary already calculated
-        existing_salary = Salary.query.filter_by(
-            user_id=user.id,
-            month=month,
-            year=year
-        ).first()
-        
-        if not existing_salary:
-            # Calculate performance score
-            performance_score = calculate_performance_score(user.id, month, year)
-            
-            # Base salary (this would come from user profile)
-            base_salary = 50000  # Default base salary
-            
-            # Calculate bonuses
-            attendance_bonus = base_salary * 0.1 if performance_score >= 8 else 0
-            performance_bonus = base_salary * 0.05 if performance_score >= 7 else 0
-            
-            total_salary = base_salary + attendance_bonus + performance_bonus
-            
-            salary = Salary(
-                user_id=user.id,
-                month=month,
-                year=year,
-                base_salary=base_salary,
-                attendance_bonus=attendance_bonus,
-                performance_bonus=performance_bonus,
-                total_salary=total_salary
-            )
-            db.session.add(salary)
+    result = run_payroll(month, year, dry_run=dry_run)
     
-    db.session.commit()
-    flash('Salaries calculated successfully!', 'success')
+    if dry_run:
+        return jsonify(result._asdict())
+    
+    flash(f'Salaries calculated successfully! {len(result.rows)} created, {result.skipped} already calculated '
+          f'({result.timings["total_ms"]:.0f} ms)', 'success')
     return redirect(url_for('bursar_dashboard'))
 
 # Notification Routes
@@ -510,25 +471,83 @@ def send_notification():
             type=notification_type
         )
         db.session.add(notification)
+        db.session.commit()
         
-        # Send notification based on type
-        if notification_type == 'email' and user.email:
-            if send_email(user.email, title, message):
-                notification.sent = True
-                notification.sent_at = datetime.now()
-        
-        elif notification_type == 'sms' and user.phone_number:
-            if send_sms(user.phone_number, message):
-                notification.sent = True
-                notification.sent_at = datetime.now()
+        # Email and SMS are delivered by the background dispatcher
+        if notification_type in DELIVERABLE_TYPES:
+            notification_dispatcher.wake()
         
-        db.session.commit()
         flash('Notification sent successfully!', 'success')
         return redirect(url_for('send_notification'))
     
-    users = User.query.filter(User.role.in_(['teacher', 'student'])).all()
+    users = db.session.query(User.id, User.full_name, User.role).filter(
+        User.role.in_(['teacher', 'student'])
+    ).order_by(User.full_name).all()
     return render_template('notifications/send.html', users=users)
 
+@app.route('/notifications/broadcast', methods=['POST'])
+@login_required
+def broadcast_notification():
+    if current_user.role not in ['headteacher', 'deputy']:
+        if request.is_json:
+            return jsonify({'error': 'Access denied'}), 403
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        roles = data.get('roles') or []
+        class_names = data.get('class_names') or []
+        user_ids = data.get('user_ids') or []
+        for name, values in [('roles', roles), ('class_names', class_names), ('user_ids', user_ids)]:
+            if not isinstance(values, list) or not all(isinstance(value, (str, int, float)) for value in values):
+                return jsonify({'error': f'{name} must be a list of strings or numbers'}), 400
+    else:
+        data = request.form
+        roles = request.form.getlist('roles')
+        class_names = request.form.getlist('class_names')
+        user_ids = request.form.getlist('user_ids')
+    
+    title = data.get('title')
+    message = data.get('message')
+    notification_type = data.get('type', 'system')
+    
+    try:
+        user_ids = [int(user_id) for user_id in user_ids]
+    except (TypeError, ValueError):
+        user_ids = None
+    
+    error = None
+    if not title or not message:
+        error = 'Title and message are required!'
+    elif not isinstance(title, str) or not isinstance(message, str) or not isinstance(notification_type, str):
+        error = 'Title, message and type must be text!'
+    elif user_ids is None:
+        error = 'Invalid user ids!'
+    elif not (roles or class_names or user_ids):
+        error = 'Choose at least one role, class or user!'
+    elif notification_type not in DELIVERABLE_TYPES + ['system']:
+        error = 'Invalid notification type!'
+    
+    if error:
+        if request.is_json:
+            return jsonify({'error': error}), 400
+        flash(error, 'error')
+        return redirect(url_for('send_notification'))
+    
+    result = broadcast(title, message, notification_type,
+                       roles=roles, class_names=class_names, user_ids=user_ids)
+    rate = result.recipients / (result.total_ms / 1000) if result.total_ms else 0
+    
+    if request.is_json:
+        return jsonify(dict(result._asdict(), notifications_per_second=round(rate)))
+    
+    flash(f'Notification queued for {result.recipients} recipients '
+          f'({result.total_ms:.0f} ms, {rate:.0f}/s)', 'success')
+    return redirect(url_for('send_notification'))
+
 # Procurement Routes
 @app.route('/procurement')
 @login_required
@@ -565,20 +584,270 @@ def create_procurement():
 @login_required
 def api_today_attendance():
     today = datetime.now().date()
-    attendances = Attendance.query.filter_by(date=today).all()
-    
-    data = []
-    for attendance in attendances:
-        user = User.query.get(attendance.user_id)
-        data.append({
-            'user_name': user.full_name,
-            'role': user.role,
-            'time_in': attendance.time_in.strftime('%H:%M') if attendance.time_in else None,
-            'time_out': attendance.time_out.strftime('%H:%M') if attendance.time_out else None,
-            'status': attendance.status
-        })
+    etag, body = attendance_snapshot(today)
+    
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/attendance/stream')
+@login_required
+def api_attendance_stream():
+    if current_user.role not in ['headteacher', 'deputy', 'bursar']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    heartbeat = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    return app.response_class(
+        event_stream(attendance_events, last_event_id, heartbeat=heartbeat),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/stats/cache')
+@login_required
+def api_cache_stats():
+    if current_user.role not in ['headteacher', 'deputy']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(stats_cache.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Request and SQL metrics in the Prometheus text format"""
+    if not instrumentation.enabled():
+        abort(404)
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not current_user.is_authenticated or current_user.role not in ['headteacher', 'deputy']:
+        abort(403)
+    
+    return app.response_class(instrumentation.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/attendance/ingest', methods=['POST'])
+def api_attendance_ingest():
+    """Batch check-in/check-out events from kiosks and terminals (device JWT)"""
+    try:
+        device_id = device_from_header(request.headers.get('Authorization'), device_token_secret())
+    except DeviceAuthError as e:
+        return jsonify({'error': str(e)}), 401
+    
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected a JSON object with an events list'}), 400
+    if len(events) > ingest_max_events():
+        return jsonify({'error': f'At most {ingest_max_events()} events per request'}), 413
+    
+    try:
+        results = ingest(device_id, events)
+    except IntegrityError:
+        # The same batch is being uploaded concurrently; the retry will dedupe
+        return jsonify({'error': 'Conflicting concurrent upload, retry the batch'}), 409
     
-    return jsonify(data)
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return jsonify({'device_id': device_id, 'counts': counts, 'results': results})
+
+@app.route('/api/face/identify', methods=['POST'])
+@login_required
+def api_identify_face():
+    image = request.files.get('image')
+    if not image:
+        return jsonify({'error': 'No image provided'}), 400
+    
+    future = face_pipeline.submit(current_user.id, image.read())
+    try:
+        result = future.result(timeout=face_pipeline.encoding_timeout())
+    except concurrent.futures.TimeoutError:
+        return jsonify({'error': 'Face encoding timed out'}), 503
+    
+    if result.error:
+        return jsonify({'error': result.error}), 422
+    
+    k = request.args.get('k', 1, type=int)
+    lookup = face_index.identify(decode_encoding(result.encoding), k=max(1, min(k, 10)))
+    users = {user.id: user for user in User.query.filter(User.id.in_([m.user_id for m in lookup.matches]))}
+    
+    return jsonify({
+        'matches': [{
+            'user_id': match.user_id,
+            'user_name': users[match.user_id].full_name,
+            'role': users[match.user_id].role,
+            'distance': round(match.distance, 4)
+        } for match in lookup.matches if match.user_id in users],
+        'latency_ms': round(lookup.latency_ms, 3)
+    })
+
+# CLI Commands
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema and data migrations"""
+    import migrations
+    
+    db.create_all()
+    if not migrations.upgrade():
+        print('Database is up to date')
+
+@app.cli.command('explain-queries')
+def explain_queries_command():
+    """Print the query plans of the hot queries to verify index usage"""
+    import migrations
+    
+    migrations.explain_hot_queries()
+
+@app.cli.command('enroll-faces')
+@click.argument('source')
+@click.option('--batch-size', default=200, help='Encodings written per commit')
+@click.option('--model', default=None, help='hog or cnn (defaults to FACE_RECOGNITION_MODEL)')
+def enroll_faces_command(source, batch_size, model):
+    """Bulk-enroll faces from a directory or zip of photos named by username"""
+    def progress(done, total):
+        if done == total or done % 50 == 0:
+            print(f'{done}/{total} images processed')
+    
+    report = face_pipeline.bulk_enroll(source, batch_size=batch_size, model=model, progress=progress)
+    face_pipeline.shutdown_pool()
+    
+    print(f'Enrolled {report.enrolled} of {report.total} images in {report.elapsed:.1f}s')
+    for name, reason in report.failures:
+        print(f'  {name}: {reason}')
+
+@app.cli.command('rebuild-performance')
+@click.option('--month', type=click.IntRange(1, 12), default=lambda: datetime.now().month)
+@click.option('--year', type=click.IntRange(MIN_YEAR, MAX_YEAR), default=lambda: datetime.now().year)
+@click.option('--all', 'all_months', is_flag=True, help='Rebuild every month that has attendance')
+def rebuild_performance_command(month, year, all_months):
+    """Backfill or repair the monthly Performance summary"""
+    months = [(month, year)]
+    if all_months:
+        first, last = db.session.query(db.func.min(Attendance.date), db.func.max(Attendance.date)).one()
+        months = list(months_between(first, last)) if first else []
+    
+    for month, year in months:
+        users = rebuild_month(month, year)
+        print(f'Rebuilt {month}/{year}: {users} users')
+
+@app.cli.command('reclassify-attendance')
+@click.option('--start', 'start_value', default=None, help='First day (YYYY-MM-DD, default: first attendance)')
+@click.option('--end', 'end_value', default=None, help='Last day (YYYY-MM-DD, default: today)')
+def reclassify_attendance_command(start_value, end_value):
+    """Recompute present/late for past check-ins from the current timetable"""
+    try:
+        start_date = parse_date(start_value) or db.session.query(db.func.min(Attendance.date)).scalar()
+        end_date = parse_date(end_value, datetime.now().date())
+    except ReportError as e:
+        raise click.BadParameter(str(e))
+    if start_date is None:
+        print('No attendance recorded')
+        return
+    
+    checked, changed, months = reclassify(start_date, end_date)
+    for month, year in sorted(months, key=lambda period: (period[1], period[0])):
+        rebuild_month(month, year, commit=False)
+    db.session.commit()
+    invalidate_snapshot()
+    print(f'Checked {checked} check-ins from {start_date} to {end_date}: {changed} reclassified, '
+          f'{len(months)} monthly summaries rebuilt')
+
+@app.cli.command('seed-data')
+@click.option('--teachers', default=200, help='Number of teachers')
+@click.option('--students', default=2000, help='Number of students')
+@click.option('--days', default=365, help='Days of attendance history ending today')
+@click.option('--seed', default=42, help='Random seed')
+@click.option('--reset', is_flag=True, help='Drop and recreate every table first')
+def seed_data_command(teachers, students, days, seed, reset):
+    """Fill the database with a synthetic school for development and benchmarks"""
+    from seed import seed_school
+    
+    if reset:
+        # Archive tables are not in the ORM metadata; drop them while the catalog lists them
+        drop_archives()
+        db.drop_all()
+    db.create_all()
+    if User.query.first() is not None:
+        raise click.ClickException('Database is not empty; use --reset to replace its contents')
+    
+    result = seed_school(teachers=teachers, students=students, days=days, seed=seed, verbose=True)
+    print(', '.join(f'{count} {name}' for name, count in result.counts.items()) + f' in {result.seconds:.1f}s')
+    print('Every generated user has the password password123')
+
+@app.cli.command('send-notifications')
+def send_notifications_command():
+    """Deliver all queued email/SMS notifications"""
+    sent = notification_dispatcher.drain()
+    notification_dispatcher.smtp.close()
+    print(f'Sent {sent} notifications, {notification_dispatcher.failed} failed attempts')
+
+@app.cli.command('run-payroll')
+@click.option('--month', type=click.IntRange(1, 12), default=lambda: datetime.now().month)
+@click.option('--year', type=click.IntRange(MIN_YEAR, MAX_YEAR), default=lambda: datetime.now().year)
+@click.option('--dry-run', is_flag=True, help='Print the computed salaries without saving them')
+def run_payroll_command(month, year, dry_run):
+    """Calculate salaries for all staff for a month"""
+    result = run_payroll(month, year, dry_run=dry_run)
+    
+    for row in result.rows:
+        print(f"{row['user_id']:>6}  {row['full_name']:<30} {row['performance_score']:>5.2f} "
+              f"{row['base_salary']:>10.2f} {row['attendance_bonus']:>9.2f} "
+              f"{row['performance_bonus']:>9.2f} {row['total_salary']:>10.2f}")
+    
+    action = 'Computed' if dry_run else 'Created'
+    print(f'{action} {len(result.rows)} salaries for {month}/{year}, {result.skipped} already calculated')
+    print(', '.join(f'{name} {value:.1f}' for name, value in result.timings.items()))
+
+@app.cli.command('issue-device-token')
+@click.argument('device_id')
+@click.option('--days', type=int, default=None, help='Token lifetime in days (default: no expiry)')
+def issue_device_token_command(device_id, days):
+    """Issue a JWT for a kiosk or terminal to upload attendance events"""
+    print(issue_device_token(device_id, device_token_secret(), days))
+
+@app.cli.command('archive-attendance')
+@click.option('--year', 'years', type=int, multiple=True,
+              help='Academic year to archive, by the year it starts in (default: every closed year)')
+@click.option('--keep', default=1, help='Academic years to keep online when --year is not given')
+@click.option('--list', 'list_only', is_flag=True, help='List archived years and exit')
+def archive_attendance_command(years, keep, list_only):
+    """Move closed academic years out of the attendance table"""
+    if list_only:
+        for archive in AttendanceArchive.query.order_by(AttendanceArchive.academic_year):
+            print(f'{year_label(archive.academic_year):<8} {archive.first_day} to {archive.last_day}  '
+                  f'{archive.rows:>9} rows in {archive.table_name}')
+        return
+    
+    for year in years or archivable_years(keep):
+        try:
+            result = archive_year(year)
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
+        print(f'Archived {year_label(year)}: {result.rows} rows to {result.table_name}, '
+              f'{result.months} monthly summaries rebuilt')
+    invalidate_snapshot()
+    if db.engine.dialect.name == 'sqlite':
+        print('Run VACUUM on the database file to return the freed space')
+
+@app.cli.command('restore-attendance')
+@click.option('--year', type=int, required=True, help='Archived academic year, by the year it starts in')
+def restore_attendance_command(year):
+    """Move an archived academic year back into the attendance table"""
+    try:
+        result = restore_year(year)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    print(f'Restored {result.rows} rows of {year_label(year)} from {result.table_name}')
 
 if __name__ == '__main__':
     with app.app_context():
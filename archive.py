@@ -0,0 +1,196 @@
+"""
+Attendance archival by academic year
+
+Closed academic years are moved out of the attendance table into one
+attendance_archive_<year> table per year, recorded in AttendanceArchive.
+The monthly Performance rows of the year are rebuilt first and stay
+online as its rollup. That keeps the live table, and the indexes behind
+check-ins and the dashboards, at the size of the current year.
+
+Queries that may reach back into archived years select from
+attendance_source(start_date, end_date) instead of Attendance: an alias
+over a UNION ALL of the live table and the overlapping archive tables,
+with the date range applied to each. Ranges inside the current academic
+year resolve to Attendance itself without a query.
+
+ACADEMIC_YEAR_START_MONTH sets the month an academic year begins in
+(September by default). An archived year is read-only: check-ins, kiosk
+events and absences cannot be recorded for its dates.
+"""
+
+import os
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import aliased
+
+from models import db, Attendance, AttendanceArchive, IngestedEvent
+
+ArchiveResult = namedtuple('ArchiveResult', ['academic_year', 'table_name', 'rows', 'months'])
+
+archive_metadata = db.MetaData()
+
+
+class ArchiveError(ValueError):
+    """Raised when a year cannot be archived or restored"""
+
+
+def start_month():
+    return int(os.getenv('ACADEMIC_YEAR_START_MONTH', 9))
+
+
+def academic_year(day):
+    """Calendar year in which the academic year containing day starts"""
+    return day.year if day.month >= start_month() else day.year - 1
+
+
+def year_range(year):
+    """First and last day of an academic year"""
+    first_day = date(year, start_month(), 1)
+    return first_day, first_day.replace(year=year + 1) - timedelta(days=1)
+
+
+def year_label(year):
+    return str(year) if start_month() == 1 else f'{year}/{(year + 1) % 100:02d}'
+
+
+def archive_table(year):
+    """The archive table of an academic year, with the attendance columns"""
+    name = f'attendance_archive_{int(year)}'
+    table = archive_metadata.tables.get(name)
+    if table is None:
+        columns = [db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+                   for column in Attendance.__table__.columns]
+        table = db.Table(
+            name, archive_metadata, *columns,
+            db.Index(f'ix_{name}_date_id', 'date', 'id'),  # Report pages
+            db.Index(f'ix_{name}_user_date', 'user_id', 'date')  # Monthly scores
+        )
+    return table
+
+
+def archived_years(start_date=None, end_date=None):
+    """Archived academic years overlapping a date range, oldest first"""
+    if start_date is not None and start_date >= year_range(academic_year(date.today()))[0]:
+        # The current academic year is never archived
+        return []
+    query = db.session.query(AttendanceArchive.academic_year)
+    if start_date is not None:
+        query = query.filter(AttendanceArchive.last_day >= start_date)
+    if end_date is not None:
+        query = query.filter(AttendanceArchive.first_day <= end_date)
+    return [year for (year,) in query.order_by(AttendanceArchive.academic_year)]
+
+
+def is_archived(day):
+    return bool(archived_years(day, day))
+
+
+def attendance_source(start_date=None, end_date=None):
+    """Attendance, or an alias of it over the live and archived rows in a range
+
+    Use the result wherever Attendance would be used in a read-only query,
+    e.g. ``source.date``; only read columns from the alias, not entities.
+    """
+    years = archived_years(start_date, end_date)
+    if not years:
+        return Attendance
+
+    parts = []
+    for table in [Attendance.__table__] + [archive_table(year) for year in years]:
+        part = db.select(*table.columns)
+        if start_date is not None:
+            part = part.where(table.c.date >= start_date)
+        if end_date is not None:
+            part = part.where(table.c.date <= end_date)
+        parts.append(part)
+    return aliased(Attendance, db.union_all(*parts).subquery('attendance_all'))
+
+
+def archivable_years(keep=1, today=None):
+    """Closed academic years with live attendance, leaving the last keep years online"""
+    first = db.session.query(db.func.min(Attendance.date)).scalar()
+    if first is None:
+        return []
+    return list(range(academic_year(first), academic_year(today or date.today()) - keep + 1))
+
+
+def archive_year(year):
+    """Move a closed academic year's attendance into its archive table
+
+    Rebuilds the year's Performance rows, copies the rows with one
+    INSERT ... SELECT and deletes them from the live table, committed
+    together. Kiosk events keep their idempotency record but lose the
+    link to the moved row.
+    """
+    from performance import months_between, rebuild_month
+
+    first_day, last_day = year_range(year)
+    if year >= academic_year(date.today()):
+        raise ArchiveError(f'{year_label(year)} is not closed yet')
+    if db.session.get(AttendanceArchive, year) is not None:
+        raise ArchiveError(f'{year_label(year)} is already archived')
+
+    months = list(months_between(first_day, last_day))
+    table = archive_table(year)
+    live = Attendance.__table__
+    in_year = live.c.date.between(first_day, last_day)
+    try:
+        for month, month_year in months:
+            rebuild_month(month, month_year, commit=False)
+        table.create(db.session.connection(), checkfirst=True)
+        rows = db.session.execute(
+            db.insert(table).from_select([column.name for column in live.columns],
+                                         db.select(*live.columns).where(in_year))
+        ).rowcount
+        db.session.execute(
+            db.update(IngestedEvent).where(
+                IngestedEvent.attendance_id.in_(db.select(live.c.id).where(in_year))
+            ).values(attendance_id=None),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            db.delete(Attendance).where(Attendance.date.between(first_day, last_day)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.add(AttendanceArchive(academic_year=year, table_name=table.name,
+                                         first_day=first_day, last_day=last_day, rows=rows))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ArchiveResult(year, table.name, rows, len(months))
+
+
+def restore_year(year):
+    """Move an archived academic year back into the live table and drop its archive"""
+    archive = db.session.get(AttendanceArchive, year)
+    if archive is None:
+        raise ArchiveError(f'{year_label(year)} is not archived')
+
+    table = archive_table(year)
+    try:
+        rows = db.session.execute(
+            db.insert(Attendance).from_select([column.name for column in table.columns], db.select(*table.columns))
+        ).rowcount
+        db.session.delete(archive)
+        table.drop(db.session.connection(), checkfirst=True)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ArchiveResult(year, table.name, rows, 0)
+
+
+def drop_archives():
+    """Drop every archived year's table and catalog entry, e.g. before db.drop_all()"""
+    connection = db.session.connection()
+    if not inspect(connection).has_table(AttendanceArchive.__tablename__):
+        return []
+    years = [year for (year,) in db.session.query(AttendanceArchive.academic_year)]
+    for year in years:
+        archive_table(year).drop(connection, checkfirst=True)
+    db.session.execute(db.delete(AttendanceArchive))
+    db.session.commit()
+    return years
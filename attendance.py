@@ -0,0 +1,220 @@
+"""
+Attendance recording shared by the web routes and the face recognizer
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Attendance
+from performance import record_attendance, rebuild_month
+from lateness import classify
+from archive import is_archived
+from events import attendance_events
+from sqlite_profile import write_queue
+
+# Serialized daily attendance feed keyed by date: (etag, body, built_at)
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+
+class AttendanceError(Exception):
+    """Raised when a check-in or check-out is not allowed"""
+
+
+def stage_check_in(user_id, method='manual', when=None):
+    """Add a check-in to the current transaction without committing"""
+    when = when or datetime.now()
+    today = when.date()
+    if is_archived(today):
+        raise AttendanceError(f'{today} belongs to an archived academic year')
+
+    # Check if already checked in today
+    attendance = Attendance.query.filter_by(user_id=user_id, date=today).first()
+    if attendance and attendance.time_in:
+        raise AttendanceError('Already checked in today!')
+
+    # Create attendance record
+    is_new = attendance is None
+    previous_status = None if is_new else attendance.status
+    status = classify(user_id, when)
+    if attendance:
+        attendance.time_in = when
+        attendance.method = method
+        attendance.status = status
+    else:
+        attendance = Attendance(
+            user_id=user_id,
+            date=today,
+            time_in=when,
+            method=method,
+            status=status
+        )
+        db.session.add(attendance)
+
+    record_attendance(attendance, previous_status, is_new)
+    return attendance
+
+
+def stage_check_out(user_id, when=None):
+    """Add a check-out to the current transaction without committing"""
+    when = when or datetime.now()
+    attendance = Attendance.query.filter_by(user_id=user_id, date=when.date()).first()
+
+    if not attendance or not attendance.time_in:
+        raise AttendanceError('No check-in record found for today!')
+    if attendance.time_out:
+        raise AttendanceError('Already checked out today!')
+
+    attendance.time_out = when
+    return attendance
+
+
+def _commit(stage, *args):
+    """Run a staged attendance write and commit it; returns the attendance row"""
+    if write_queue.enabled:
+        def job():
+            attendance = stage(*args)
+            db.session.flush()
+            return attendance.id
+        attendance_id = write_queue.run(job)
+        # End this session's read snapshot (as the direct path's commit
+        # would) so the row written by the writer is visible
+        db.session.commit()
+        return db.session.get(Attendance, attendance_id)
+
+    for attempt in range(2):
+        try:
+            attendance = stage(*args)
+            db.session.commit()
+            return attendance
+        except IntegrityError:
+            # A concurrent check-in wrote today's record (or this month's
+            # performance rows) first; retry once against the committed state
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def record_check_in(user_id, method='manual', when=None):
+    """Check a user in for the day (one record per user per day)"""
+    attendance = _commit(stage_check_in, user_id, method, when or datetime.now())
+    invalidate_snapshot(attendance.date)
+    publish_event('check_in', attendance)
+    return attendance
+
+
+def record_check_out(user_id, when=None):
+    """Check a user out for the day"""
+    attendance = _commit(stage_check_out, user_id, when or datetime.now())
+    invalidate_snapshot(attendance.date)
+    publish_event('check_out', attendance)
+    return attendance
+
+
+def mark_absent(day):
+    """Record every active user without attendance on day as absent
+
+    Costs one INSERT ... SELECT and a rebuild of the month's Performance
+    rows, committed together. A user who checks in later that day keeps
+    the row, which becomes a normal check-in. Returns the number of users
+    marked absent.
+    """
+    if is_archived(day):
+        raise AttendanceError(f'{day} belongs to an archived academic year')
+    end_of_day = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    missing = db.select(User.id, db.literal(day), db.literal('absent'), db.literal(datetime.utcnow())).where(
+        User.is_active.isnot(False),
+        db.or_(User.created_at.is_(None), User.created_at < end_of_day),
+        ~db.exists().where(Attendance.user_id == User.id, Attendance.date == day)
+    )
+    for attempt in range(2):
+        try:
+            marked = db.session.execute(
+                db.insert(Attendance).from_select(['user_id', 'date', 'status', 'created_at'], missing)
+            ).rowcount
+            rebuild_month(day.month, day.year, commit=False)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # Someone checked in between the SELECT and the INSERT
+            db.session.rollback()
+            if attempt:
+                raise
+    invalidate_snapshot(day)
+    return marked
+
+
+def event_payload(attendance, full_name, role):
+    """Live dashboard representation of an attendance row"""
+    return {
+        'user_id': attendance.user_id,
+        'user_name': full_name,
+        'role': role,
+        'date': attendance.date.isoformat(),
+        'time_in': attendance.time_in.strftime('%H:%M') if attendance.time_in else None,
+        'time_out': attendance.time_out.strftime('%H:%M') if attendance.time_out else None,
+        'method': attendance.method,
+        'status': attendance.status
+    }
+
+
+def publish_event(event, attendance):
+    """Push a check-in/check-out delta to live dashboards"""
+    full_name, role = db.session.query(User.full_name, User.role).filter(User.id == attendance.user_id).one()
+    attendance_events.publish(event, event_payload(attendance, full_name, role))
+
+
+def snapshot_ttl():
+    return float(os.getenv('ATTENDANCE_SNAPSHOT_TTL', 5))
+
+
+def invalidate_snapshot(day=None):
+    """Drop the cached feed for a day (or every day)"""
+    with _snapshot_lock:
+        if day is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(day, None)
+
+
+def attendance_snapshot(day):
+    """(etag, JSON body) for a day's attendance feed
+
+    Built from one joined query and cached until a check-in/check-out
+    invalidates it. The short TTL bounds staleness when other processes
+    write attendance.
+    """
+    with _snapshot_lock:
+        cached = _snapshots.get(day)
+    if cached and time.monotonic() - cached[2] < snapshot_ttl():
+        return cached[0], cached[1]
+
+    rows = db.session.query(
+        User.full_name,
+        User.role,
+        Attendance.time_in,
+        Attendance.time_out,
+        Attendance.status
+    ).join(User, User.id == Attendance.user_id).filter(
+        Attendance.date == day
+    ).order_by(Attendance.id)
+
+    data = [{
+        'user_name': full_name,
+        'role': role,
+        'time_in': time_in.strftime('%H:%M') if time_in else None,
+        'time_out': time_out.strftime('%H:%M') if time_out else None,
+        'status': status
+    } for full_name, role, time_in, time_out, status in rows]
+
+    body = json.dumps(data, separators=(',', ':')).encode()
+    etag = hashlib.sha1(body).hexdigest()
+    with _snapshot_lock:
+        _snapshots[day] = (etag, body, time.monotonic())
+    return etag, body
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Load test: morning check-in burst against a file-backed SQLite database
+
+Seeds N users, then checks them all in from T concurrent threads (one app
+context per check-in, like a threaded web server) and reports latency
+percentiles, throughput and failed check-ins. Run with --compare to measure
+the default engine and SQLITE_PROFILE=production side by side, each in a
+fresh process and database.
+
+    python benchmarks/checkin_burst.py --compare --users 2000 --threads 32
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def create_app(path):
+    from flask import Flask
+    from models import db
+    import sqlite_profile
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    sqlite_profile.init_app(app)
+    return app
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args):
+    from models import db, User
+    from attendance import record_check_in
+    from sqlite_profile import write_queue
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(os.path.join(directory, 'burst.db'))
+        with app.app_context():
+            db.create_all()
+            db.session.execute(db.insert(User), [{
+                'username': f'user{i}',
+                'email': f'user{i}@school.com',
+                'password_hash': 'x',
+                'role': 'teacher' if i % 10 == 0 else 'student',
+                'full_name': f'User {i}'
+            } for i in range(args.users)])
+            db.session.commit()
+            user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def check_in(user_id):
+            started = time.perf_counter()
+            try:
+                with app.app_context():
+                    record_check_in(user_id, 'face')
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            list(pool.map(check_in, user_ids))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        profile = os.getenv('SQLITE_PROFILE') or 'default'
+        print(f'{profile:<12} p50 {percentile(latencies, 0.50) * 1000:8.1f} ms'
+              f'  p95 {percentile(latencies, 0.95) * 1000:8.1f} ms'
+              f'  p99 {percentile(latencies, 0.99) * 1000:8.1f} ms'
+              f'  {len(user_ids) / elapsed:8.1f} check-ins/s'
+              f'  {len(errors)} failed {sorted(set(errors))}'
+              + (f'  {write_queue.batches} commits' if write_queue.enabled else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--compare', action='store_true', help='Run the default and production profiles')
+    args = parser.parse_args()
+
+    if not args.compare:
+        run(args)
+        return
+
+    print(f'{args.users} check-ins from {args.threads} threads')
+    for profile in ('', 'production'):
+        subprocess.run(
+            [sys.executable, __file__, '--users', str(args.users), '--threads', str(args.threads)],
+            env=dict(os.environ, SQLITE_PROFILE=profile),
+            check=True
+        )
+
+
+if __name__ == '__main__':
+    main()
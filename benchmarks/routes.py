@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the hot routes
+
+Seeds a synthetic school (see seed.py) unless --database points at an
+already seeded one, then drives the hot routes through the Flask test
+client as logged-in users. For every route it records latency
+percentiles, SQL statements per request and the peak memory allocated
+while serving one request, and writes them to a JSON baseline. With
+--compare it reports the change against a previous baseline and exits
+non-zero when a route regressed beyond --tolerance.
+
+    python benchmarks/routes.py --output benchmarks/baseline.json
+    python benchmarks/routes.py --compare benchmarks/baseline.json
+
+Missing page templates are replaced by an empty stub so the suite
+measures the data work of each route.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'password123'
+
+
+def routes(today):
+    """(name, username, path) for every benchmarked route"""
+    month_ago = today - timedelta(days=30)
+    return [
+        ('api_today_attendance', 'teacher0001', '/api/attendance/today'),
+        ('admin_dashboard', 'headteacher0001', '/admin/dashboard'),
+        ('bursar_dashboard', 'bursar0001', '/bursar/dashboard'),
+        ('teacher_dashboard', 'teacher0001', '/teacher/dashboard'),
+        ('performance_report', 'headteacher0001', '/reports/performance'),
+        ('attendance_report', 'headteacher0001', f'/reports/attendance?start_date={month_ago}&end_date={today}'),
+        ('calculate_salary', 'bursar0001', '/salary/calculate?dry_run=1'),
+    ]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def install_template_stub(app):
+    from jinja2 import ChoiceLoader, FunctionLoader
+
+    app.jinja_env.loader = ChoiceLoader([
+        app.jinja_env.loader,
+        FunctionLoader(lambda name: f'{{# benchmark stub for {name} #}}')
+    ])
+
+
+def measure(client, path, requests, warmup, counter):
+    for _ in range(warmup):
+        client.get(path)
+
+    latencies = []
+    queries = []
+    status = None
+    for _ in range(requests):
+        counter[0] = 0
+        started = time.perf_counter()
+        response = client.get(path)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter[0])
+        status = response.status_code
+
+    tracemalloc.start()
+    client.get(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    queries.sort()
+    return {
+        'status': status,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries': queries[len(queries) // 2],
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, slack_ms=2.0):
+    """Print the change against a baseline; returns the regressed routes
+
+    Sub-millisecond routes are noisy, so p95 must also grow by slack_ms.
+    """
+    regressions = []
+    print(f"\n{'route':<24} {'p95 ms':>18} {'queries':>12} {'peak KB':>20}")
+    for name, current in results.items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            print(f'{name:<24} (new)')
+            continue
+        regressed = (current['p95_ms'] > max(previous['p95_ms'] * (1 + tolerance), previous['p95_ms'] + slack_ms)
+                     or current['queries'] > previous['queries']
+                     or current['peak_kb'] > previous['peak_kb'] * (1 + tolerance))
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<24} {previous['p95_ms']:>8.1f} -> {current['p95_ms']:<7.1f}"
+              f" {previous['queries']:>4} -> {current['queries']:<4}"
+              f" {previous['peak_kb']:>8.0f} -> {current['peak_kb']:<8.0f}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help='Existing seeded SQLite file (default: seed a temporary one)')
+    parser.add_argument('--teachers', type=int, default=100)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--requests', type=int, default=100, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95/memory growth (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    path = args.database or os.path.join(directory.name, 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'
+    os.environ.setdefault('NOTIFICATION_WORKER', 'False')
+
+    from sqlalchemy import event
+    from app import app, db, User
+    from seed import seed_school
+
+    install_template_stub(app)
+    counter = [0]
+    with app.app_context():
+        db.create_all()
+        if User.query.first() is None:
+            print(f'Seeding {args.teachers} teachers, {args.students} students, {args.days} days...')
+            result = seed_school(teachers=args.teachers, students=args.students, days=args.days)
+            print(', '.join(f'{count} {name}' for name, count in result.counts.items())
+                  + f' in {result.seconds:.1f}s')
+        users = db.session.query(User.id).count()
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: counter.__setitem__(0, counter[0] + 1))
+
+    clients = {}
+    results = {}
+    print(f"{'route':<24} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'peak KB':>9}")
+    for name, username, route in routes(date.today()):
+        if username not in clients:
+            clients[username] = app.test_client()
+            response = clients[username].post('/login', data={'username': username, 'password': PASSWORD})
+            if response.status_code != 302:
+                sys.exit(f'Could not log in as {username}; was the database seeded by seed.py?')
+        results[name] = measure(clients[username], route, args.requests, args.warmup, counter)
+        row = results[name]
+        print(f"{name:<24} {row['status']:>6} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+              f" {row['queries']:>8} {row['peak_kb']:>9.0f}")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'users': users,
+        'requests': args.requests,
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f'Wrote {args.output}')
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            sys.exit(f"Regressed: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
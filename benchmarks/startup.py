@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Startup report: import time broken down by package
+
+Imports a module (app by default) in a fresh interpreter with
+`python -X importtime`, then prints the wall time, peak RSS, the
+packages that cost the most self time and whether any of the heavy
+optional subsystems were loaded eagerly.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --module recognizer --top 30
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed for face recognition, exports or scheduling
+HEAVY_MODULES = ['cv2', 'face_recognition', 'dlib', 'pandas', 'reportlab', 'openpyxl', 'bcrypt', 'schedule',
+                 'twilio', 'PIL']
+
+PROBE = '''
+import sys, time, resource
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print('wall', elapsed)
+print('rss', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print('loaded', ' '.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+
+def parse_importtime(stderr):
+    """(module, self microseconds, cumulative microseconds) per imported module"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=20, help='Packages to list')
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=args.module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode:
+        sys.exit(result.stderr)
+
+    report = dict(line.split(' ', 1) if ' ' in line else (line, '') for line in result.stdout.splitlines())
+    packages = {}
+    for name, self_us, _ in parse_importtime(result.stderr):
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    total_us = sum(packages.values())
+
+    # Under -X importtime the wall time includes the tracing overhead
+    print(f"import {args.module}: {float(report['wall']) * 1000:.0f} ms wall (traced), "
+          f"{total_us / 1000:.0f} ms in imports, peak RSS {int(report['rss']) / 1024:.0f} MB")
+    print(f"{'package':<30} {'ms':>8} {'share':>7}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{package:<30} {self_us / 1000:>8.1f} {self_us / total_us:>7.1%}')
+    loaded = report.get('loaded', '').split()
+    print(f"heavy modules loaded at import: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == '__main__':
+    main()
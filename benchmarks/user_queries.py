@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: User queries with and without the deferred biometric columns
+
+Seeds an in-memory SQLite database with N users carrying a face encoding
+and fingerprint template, then compares loading full User rows with the
+biometric columns (the old behaviour), the default deferred load, and the
+id/name/role selection used by the notification recipient picker.
+
+    python benchmarks/user_queries.py --users 10000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import db, User
+
+ROLES = ['teacher', 'student']
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    return app
+
+
+def seed(count, fingerprint_bytes):
+    rows = [{
+        'username': f'user{i}',
+        'email': f'user{i}@school.com',
+        'password_hash': 'x' * 102,
+        'role': ROLES[i % len(ROLES)],
+        'full_name': f'User {i}',
+        'face_encoding': os.urandom(512),
+        'fingerprint_data': os.urandom(fingerprint_bytes // 2).hex()
+    } for i in range(count)]
+    db.session.execute(db.insert(User), rows)
+    db.session.commit()
+
+
+def measure(name, query, repeat):
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        db.session.expunge_all()
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = query()
+        timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del rows
+    timings.sort()
+    print(f'{name:<28} {timings[len(timings) // 2] * 1000:>10.1f} {peak / 1024 / 1024:>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--fingerprint-bytes', type=int, default=2048, help='Size of each fingerprint template')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        db.create_all()
+        seed(args.users, args.fingerprint_bytes)
+        recipients = User.role.in_(ROLES)
+
+        print(f'{args.users} users, median of {args.repeat} runs')
+        print(f'{"query":<28} {"latency ms":>10} {"peak MB":>12}')
+        measure('full rows with biometrics',
+                lambda: User.query.options(db.undefer_group('biometric')).filter(recipients).all(),
+                args.repeat)
+        measure('full rows (deferred)', lambda: User.query.filter(recipients).all(), args.repeat)
+        measure('id/name/role columns',
+                lambda: db.session.query(User.id, User.full_name, User.role).filter(recipients).all(),
+                args.repeat)
+
+
+if __name__ == '__main__':
+    main()
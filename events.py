@@ -0,0 +1,130 @@
+"""
+In-process publish/subscribe for live attendance events
+
+Check-in/check-out writes publish small delta events which are streamed
+to admin dashboards as server-sent events. Every subscriber gets its own
+bounded buffer, so a slow client only ever loses its own backlog, and a
+short history allows reconnecting clients to resume from Last-Event-ID.
+
+Events are only delivered within one process; dashboards connected to a
+different worker see the change through /api/attendance/today instead.
+Writers in other processes, such as the face recognizer, post to
+/api/attendance/ingest so that the web process publishes their events.
+"""
+
+import json
+import threading
+from collections import deque
+
+RESET = 'reset'
+
+
+class Subscription:
+    """One client's bounded event buffer"""
+
+    def __init__(self, broker, buffer_size):
+        self._broker = broker
+        self._buffer = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self.overflowed = False
+        self.closed = False
+
+    def push(self, item):
+        with self._condition:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.overflowed = True
+            self._buffer.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Wait for events; returns [] on timeout"""
+        with self._condition:
+            if not self._buffer and not self.closed:
+                self._condition.wait(timeout)
+            items = list(self._buffer)
+            self._buffer.clear()
+            overflowed, self.overflowed = self.overflowed, False
+        if overflowed:
+            # Deltas were lost; tell the client to reload the full feed
+            items.insert(0, (None, RESET, {}))
+        return items
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+        self._broker.unsubscribe(self)
+
+
+class EventBroker:
+    def __init__(self, history_size=1000, buffer_size=256):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._next_id = 1
+        self.buffer_size = buffer_size
+        self.published = 0
+
+    def publish(self, event, data):
+        with self._lock:
+            item = (self._next_id, event, data)
+            self._next_id += 1
+            self._history.append(item)
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.push(item)
+        return item[0]
+
+    def subscribe(self, last_event_id=None):
+        """New subscription, replaying history after last_event_id if given"""
+        subscription = Subscription(self, self.buffer_size)
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._history[0][0] if self._history else self._next_id
+                if last_event_id < oldest - 1 or last_event_id >= self._next_id:
+                    subscription.push((None, RESET, {}))
+                else:
+                    for item in self._history:
+                        if item[0] > last_event_id:
+                            subscription.push(item)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+
+def format_event(event_id, event, data):
+    message = f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+    return message if event_id is None else f'id: {event_id}\n{message}'
+
+
+def stream(broker, last_event_id=None, heartbeat=15):
+    """Server-sent event stream of broker's events, with comment heartbeats
+
+    The subscription is made once the response starts streaming and closed
+    when it ends, so a client that goes away before the first chunk never
+    leaves a subscriber behind.
+    """
+    subscription = None
+    try:
+        subscription = broker.subscribe(last_event_id)
+        yield 'retry: 3000\n\n'
+        while True:
+            items = subscription.get(timeout=heartbeat)
+            if not items:
+                yield ': heartbeat\n\n'
+                continue
+            yield ''.join(format_event(*item) for item in items)
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+
+attendance_events = EventBroker()
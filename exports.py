@@ -0,0 +1,226 @@
+"""
+Streaming report exports (CSV, XLSX, PDF)
+
+Every report is a header plus a generator of row tuples read from the
+database in batches. CSV is streamed as it is generated; XLSX uses an
+openpyxl write-only workbook and PDF builds its table one page-sized chunk
+at a time, both spooled to a temporary file and streamed from there.
+openpyxl and reportlab are imported on first use of their writer.
+"""
+
+import io
+import os
+import csv
+import tempfile
+from datetime import date, datetime
+
+from models import db, User, Performance, Salary
+from performance import compute_scores, empty_score, is_materialized
+from reports import iter_attendance
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+}
+
+BATCH_SIZE = 1000
+PDF_ROWS_PER_CHUNK = 40
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def export_formats():
+    formats = os.getenv('EXPORT_FORMATS', 'xlsx,pdf,csv')
+    return [fmt.strip().lower() for fmt in formats.split(',') if fmt.strip().lower() in MIMETYPES]
+
+
+# Report row sources
+def attendance_export(start_date, end_date):
+    header = ['Date', 'Name', 'Role', 'Time In', 'Time Out', 'Method', 'Status']
+    rows = (
+        (row.date, row.user_name, row.role, row.time_in, row.time_out, row.method, row.status)
+        for row in iter_attendance(start_date, end_date, batch_size=BATCH_SIZE)
+    )
+    return header, rows
+
+
+def _score_rows(users, scores):
+    for user_id, full_name in users:
+        score = scores.get(user_id, empty_score(user_id))
+        yield (full_name, score.days, score.present, score.late,
+               score.attendance_score, score.punctuality_score, score.score)
+
+
+def performance_export(month, year):
+    header = ['Name', 'Days', 'Present', 'Late', 'Attendance Score', 'Punctuality Score', 'Overall Score']
+    if not is_materialized(month, year):
+        # Score from raw attendance rather than writing the summary from a report
+        scores = compute_scores(month, year, roles=['teacher'])
+        teachers = db.session.query(User.id, User.full_name).filter(
+            User.role == 'teacher'
+        ).order_by(User.full_name).yield_per(BATCH_SIZE)
+        return header, _score_rows(teachers, scores)
+
+    query = db.session.query(
+        User.full_name,
+        Performance.days,
+        Performance.present_days,
+        Performance.late_days,
+        Performance.attendance_score,
+        Performance.punctuality_score,
+        Performance.overall_score
+    ).outerjoin(Performance, db.and_(
+        Performance.teacher_id == User.id,
+        Performance.month == month,
+        Performance.year == year
+    )).filter(User.role == 'teacher').order_by(User.full_name).yield_per(BATCH_SIZE)
+    rows = (tuple(0 if value is None else value for value in row) for row in query)
+    return header, rows
+
+
+def salary_export(month, year):
+    header = ['Name', 'Role', 'Month', 'Year', 'Base Salary', 'Attendance Bonus',
+              'Performance Bonus', 'Total Salary', 'Paid', 'Paid Date']
+    query = db.session.query(
+        User.full_name,
+        User.role,
+        Salary.month,
+        Salary.year,
+        Salary.base_salary,
+        Salary.attendance_bonus,
+        Salary.performance_bonus,
+        Salary.total_salary,
+        Salary.paid,
+        Salary.paid_date
+    ).join(User, User.id == Salary.user_id).filter(
+        Salary.month == month,
+        Salary.year == year
+    ).order_by(Salary.id).yield_per(BATCH_SIZE)
+    return header, (tuple(row) for row in query)
+
+
+# Writers
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+
+def csv_chunks(header, rows, chunk_rows=BATCH_SIZE):
+    """Yield the CSV output a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow([_text(value) for value in row])
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def sheet_title(title):
+    """title as a valid worksheet name: no []:*?/\\ and at most 31 characters"""
+    cleaned = ''.join('-' if character in '[]:*?/\\' else character for character in title)
+    return cleaned[:31].strip() or 'Report'
+
+
+def xlsx_file(title, header, rows):
+    """Write rows to a write-only workbook; returns a spooled file at offset 0"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title(title))
+    header_cells = []
+    for name in header:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True, color='FFFFFF')
+        cell.fill = PatternFill('solid', fgColor='4F81BD')
+        header_cells.append(cell)
+    sheet.append(header_cells)
+    for row in rows:
+        sheet.append(list(row))
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+class _ChunkedStory(list):
+    """Flowable list for doc.build that pulls the next table chunk on demand
+
+    SimpleDocTemplate.build consumes flowables from the front of the list
+    and checks len() before each one, so only the chunk being laid out is
+    ever held in memory.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._pending = iter(flowables)
+
+    def __len__(self):
+        if not list.__len__(self):
+            flowable = next(self._pending, None)
+            if flowable is not None:
+                self.append(flowable)
+        return list.__len__(self)
+
+
+def _pdf_flowables(title, header, rows, rows_per_chunk):
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Table, TableStyle, Paragraph
+
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4F81BD')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F2F2F2')]),
+    ])
+    yield Paragraph(title, getSampleStyleSheet()['Title'])
+
+    chunk = []
+    for row in rows:
+        chunk.append([_text(value) for value in row])
+        if len(chunk) == rows_per_chunk:
+            yield Table([header] + chunk, repeatRows=1, style=style)
+            chunk = []
+    if chunk:
+        yield Table([header] + chunk, repeatRows=1, style=style)
+
+
+def pdf_file(title, header, rows, rows_per_chunk=PDF_ROWS_PER_CHUNK):
+    """Render rows as page-sized table chunks; returns a spooled file at offset 0"""
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    document = SimpleDocTemplate(output, pagesize=landscape(letter), title=title)
+    document.build(_ChunkedStory(_pdf_flowables(title, header, rows, rows_per_chunk)))
+    output.seek(0)
+    return output
+
+
+def file_chunks(output, chunk_size=64 * 1024):
+    try:
+        while True:
+            data = output.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        output.close()
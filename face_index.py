@@ -0,0 +1,294 @@
+"""
+In-memory face encoding index for 1:N identification
+
+Every active user's face encoding is held in one contiguous N x 128 float32
+matrix so that "who is this?" is a single batched distance computation
+instead of a Python loop over face_recognition.compare_faces.
+
+Commits in this process update the index as they happen. Enrollments made
+by other processes (other web workers, `flask enroll-faces`) are picked up
+by reloading the whole index once it is FACE_INDEX_RELOAD_SECONDS old.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User
+
+ENCODING_DIM = 128
+
+Match = namedtuple('Match', ['user_id', 'distance'])
+Lookup = namedtuple('Lookup', ['matches', 'latency_ms'])
+
+
+ENCODING_BYTES = ENCODING_DIM * np.dtype(np.float32).itemsize
+
+
+def decode_encoding(value):
+    """Convert a stored face encoding into a float32 vector"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        encoding = np.frombuffer(value, dtype=np.float32)
+    else:
+        if isinstance(value, str):
+            # Rows written before migration 1 still hold JSON text
+            value = json.loads(value)
+        encoding = np.asarray(value, dtype=np.float32).reshape(-1)
+    if encoding.shape[0] != ENCODING_DIM:
+        raise ValueError(f'Face encoding must have {ENCODING_DIM} values, got {encoding.shape[0]}')
+    return encoding
+
+
+def serialize_encoding(encoding):
+    """Convert a face encoding into the float32 blob stored on User.face_encoding"""
+    return np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM).tobytes()
+
+
+def face_recognition_model():
+    return os.getenv('FACE_RECOGNITION_MODEL', 'hog')
+
+
+def face_recognition_tolerance():
+    return float(os.getenv('FACE_RECOGNITION_TOLERANCE', 0.6))
+
+
+def reload_interval():
+    return float(os.getenv('FACE_INDEX_RELOAD_SECONDS', 60))
+
+
+class FaceIndex:
+    """Contiguous matrix of face encodings keyed by user id"""
+
+    def __init__(self, tolerance=None, initial_capacity=1024):
+        self._tolerance = tolerance
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((initial_capacity, ENCODING_DIM), dtype=np.float32)
+        self._norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._rows = {}  # user_id -> row in the matrix
+        self._size = 0
+        self.loaded = False
+        self.loaded_at = None
+        self.lookups = 0
+        self.total_latency_ms = 0.0
+        self.last_latency_ms = None
+
+    @property
+    def tolerance(self):
+        if self._tolerance is not None:
+            return self._tolerance
+        return face_recognition_tolerance()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    def load(self):
+        """(Re)build the matrix from every active user with a registered face"""
+        rows = db.session.query(User.id, User.face_encoding).filter(
+            User.is_active.is_(True),
+            User.face_encoding.isnot(None)
+        ).all()
+
+        # Well-formed blobs are viewed in place with a single frombuffer;
+        # anything else (legacy JSON text) goes through decode_encoding.
+        ids = []
+        blobs = []
+        for user_id, value in rows:
+            if isinstance(value, (bytes, bytearray, memoryview)) and len(value) == ENCODING_BYTES:
+                ids.append(user_id)
+                blobs.append(value)
+            else:
+                try:
+                    blobs.append(decode_encoding(value).tobytes())
+                except ValueError:
+                    continue
+                ids.append(user_id)
+        encodings = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(-1, ENCODING_DIM)
+
+        with self._lock:
+            capacity = max(len(ids) * 2, 1024)
+            self._matrix = np.zeros((capacity, ENCODING_DIM), dtype=np.float32)
+            self._norms = np.zeros(capacity, dtype=np.float32)
+            self._ids = np.zeros(capacity, dtype=np.int64)
+            if ids:
+                self._matrix[:len(ids)] = encodings
+                self._ids[:len(ids)] = ids
+                self._norms[:len(ids)] = np.einsum('ij,ij->i', self._matrix[:len(ids)], self._matrix[:len(ids)])
+            self._rows = {user_id: row for row, user_id in enumerate(ids)}
+            self._size = len(ids)
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+        return self._size
+
+    def ensure_loaded(self):
+        """Load the index on first use and reload it once it is older than reload_interval()"""
+        interval = reload_interval()
+        if not self.loaded or (interval and time.monotonic() - self.loaded_at >= interval):
+            self.load()
+
+    def _grow(self):
+        capacity = self._matrix.shape[0] * 2
+        matrix = np.zeros((capacity, ENCODING_DIM), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        norms[:self._size] = self._norms[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._norms, self._ids = matrix, norms, ids
+
+    def upsert(self, user_id, encoding):
+        """Add or replace the encoding for a user"""
+        encoding = decode_encoding(encoding)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                if self._size == self._matrix.shape[0]:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[user_id] = row
+                self._ids[row] = user_id
+            self._matrix[row] = encoding
+            self._norms[row] = float(encoding @ encoding)
+
+    def remove(self, user_id):
+        """Drop a user from the index, filling the hole with the last row"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._norms[row] = self._norms[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._size = last
+            return True
+
+    def distances(self, probes):
+        """Euclidean distance from each probe (P x 128) to every indexed encoding (P x N)"""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            matrix = self._matrix[:self._size]
+            norms = self._norms[:self._size]
+            ids = self._ids[:self._size].copy()
+            squared = norms[None, :] - 2.0 * (probes @ matrix.T) + np.einsum('ij,ij->i', probes, probes)[:, None]
+        np.maximum(squared, 0.0, out=squared)
+        return ids, np.sqrt(squared)
+
+    def identify_many(self, probes, k=1, tolerance=None):
+        """Top-k matches within tolerance for a batch of probe encodings"""
+        self.ensure_loaded()
+        started = time.perf_counter()
+        tolerance = self.tolerance if tolerance is None else tolerance
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+
+        results = []
+        if self._size and len(probes):
+            ids, distances = self.distances(probes)
+            k = min(k, len(ids))
+            candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            for probe_row, columns in enumerate(candidates):
+                scores = distances[probe_row, columns]
+                order = np.argsort(scores)
+                results.append([
+                    Match(int(ids[columns[i]]), float(scores[i]))
+                    for i in order if scores[i] <= tolerance
+                ])
+        else:
+            results = [[] for _ in range(len(probes))]
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.lookups += 1
+        self.total_latency_ms += latency_ms
+        self.last_latency_ms = latency_ms
+        return [Lookup(matches, latency_ms) for matches in results]
+
+    def identify(self, encoding, k=1, tolerance=None):
+        """Top-k matches within tolerance for a single probe encoding"""
+        return self.identify_many([encoding], k=k, tolerance=tolerance)[0]
+
+    def stats(self):
+        return {
+            'size': self._size,
+            'lookups': self.lookups,
+            'last_latency_ms': self.last_latency_ms,
+            'avg_latency_ms': self.total_latency_ms / self.lookups if self.lookups else None,
+        }
+
+
+face_index = FaceIndex()
+
+
+def encode_face(image_file, model=None):
+    """Detect the largest face in an uploaded image and return its encoding"""
+    import face_recognition
+
+    image = face_recognition.load_image_file(image_file)
+    locations = face_recognition.face_locations(image, model=model or face_recognition_model())
+    if not locations:
+        return None
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    return face_recognition.face_encodings(image, known_face_locations=[largest])[0]
+
+
+# Keep the index in step with committed User changes
+def _queue_change(target, encoding):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('face_index_changes', []).append((target.id, encoding))
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+def _user_written(mapper, connection, target):
+    state = db.inspect(target)
+    if not (state.attrs.face_encoding.history.has_changes() or state.attrs.is_active.history.has_changes()):
+        return
+    if target.is_active is False:
+        _queue_change(target, None)
+    elif 'face_encoding' in state.unloaded:
+        # Only is_active changed and the deferred encoding was never loaded
+        _queue_change(target, connection.scalar(
+            db.select(User.face_encoding).where(User.id == target.id)
+        ))
+    else:
+        _queue_change(target, target.face_encoding)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    _queue_change(target, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('face_index_changes', None)
+    if not changes or not face_index.loaded:
+        return
+    for user_id, encoding in changes:
+        if encoding is None:
+            face_index.remove(user_id)
+        else:
+            try:
+                face_index.upsert(user_id, encoding)
+            except ValueError:
+                face_index.remove(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('face_index_changes', None)
@@ -0,0 +1,191 @@
+"""
+Process-pool face encoding pipeline
+
+Face detection and encoding with dlib is CPU-bound (hundreds of ms per
+image), so it runs in a pool of worker processes rather than in Flask
+request threads. Used by face registration and by bulk enrollment of a
+directory or zip of photos named after each user's username.
+"""
+
+import os
+import io
+import time
+import zipfile
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from models import db, User
+from face_index import face_index, encode_face, serialize_encoding, face_recognition_model
+
+EncodingResult = namedtuple('EncodingResult', ['key', 'encoding', 'error'])
+EnrollmentReport = namedtuple('EnrollmentReport', ['total', 'enrolled', 'failures', 'elapsed'])
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def image_extensions():
+    extensions = os.getenv('ALLOWED_EXTENSIONS', 'jpg,jpeg,png,gif')
+    return {'.' + ext.strip().lower() for ext in extensions.split(',') if ext.strip()}
+
+
+def worker_count():
+    return int(os.getenv('FACE_ENCODING_WORKERS', 0)) or os.cpu_count() or 1
+
+
+def encoding_timeout():
+    """Seconds a request waits for its image to be encoded"""
+    return int(os.getenv('FACE_ENCODING_TIMEOUT', 30))
+
+
+def get_pool():
+    """Shared worker pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never fork the (threaded) web process itself: workers come from
+            # a clean forkserver where available, otherwise they are spawned.
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['face_recognition'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=context)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def encode_image(key, image, model):
+    """Worker entry point: encode the largest face in an image
+
+    image is a file path, raw bytes or a (zip path, member name) pair.
+    """
+    try:
+        if isinstance(image, tuple):
+            with zipfile.ZipFile(image[0]) as archive:
+                image = archive.read(image[1])
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        encoding = encode_face(image, model=model)
+        if encoding is None:
+            return EncodingResult(key, None, 'no face detected')
+        return EncodingResult(key, serialize_encoding(encoding), None)
+    except Exception as e:
+        return EncodingResult(key, None, str(e))
+
+
+def submit(key, image, model=None):
+    """Queue one image for encoding and return its future"""
+    return get_pool().submit(encode_image, key, image, model or face_recognition_model())
+
+
+def iter_photos(source):
+    """Yield (username, image) pairs from a directory or a zip of photos
+
+    Images are references (paths or zip members), not file contents.
+    """
+    extensions = image_extensions()
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                name, ext = os.path.splitext(os.path.basename(info.filename))
+                if info.is_dir() or ext.lower() not in extensions or name.startswith('.'):
+                    continue
+                yield name, (source, info.filename)
+    elif os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda e: e.name):
+            name, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext.lower() in extensions and not name.startswith('.'):
+                yield name, entry.path
+    else:
+        raise ValueError(f'{source} is neither a directory nor a zip file')
+
+
+def _save_batch(updates, active_ids):
+    if not updates:
+        return
+    db.session.execute(db.update(User), updates)
+    db.session.commit()
+    # Bulk updates bypass the ORM events that normally feed the index;
+    # like FaceIndex.load, leave inactive users out of it
+    if face_index.loaded:
+        for row in updates:
+            if row['id'] in active_ids:
+                face_index.upsert(row['id'], row['face_encoding'])
+
+
+def bulk_enroll(source, batch_size=200, model=None, progress=None):
+    """Encode every photo in source and store the encodings on matching users
+
+    Photos are named after usernames (``jdoe.jpg``). Results are written in
+    batched commits; progress(done, total) is called as images complete.
+    """
+    started = time.perf_counter()
+    photos = list(iter_photos(source))
+    failures = []
+
+    user_ids = {}
+    active_ids = set()
+    usernames = [name for name, _ in photos]
+    for start in range(0, len(usernames), 500):
+        chunk = usernames[start:start + 500]
+        for username, user_id, is_active in db.session.query(User.username, User.id, User.is_active).filter(
+            User.username.in_(chunk)
+        ):
+            user_ids[username] = user_id
+            if is_active:
+                active_ids.add(user_id)
+
+    pending = []
+    for name, image in photos:
+        if name in user_ids:
+            pending.append((name, image))
+        else:
+            failures.append((name, 'unknown username'))
+
+    total = len(photos)
+    done = len(failures)
+    enrolled = 0
+    updates = []
+    pool = get_pool()
+    model = model or face_recognition_model()
+    # Keep only a few images per worker queued so progress and batched
+    # commits follow the encoding rather than the submission.
+    max_in_flight = worker_count() * 4
+    in_flight = set()
+    queue = iter(pending)
+
+    while True:
+        for name, image in queue:
+            in_flight.add(pool.submit(encode_image, name, image, model))
+            if len(in_flight) >= max_in_flight:
+                break
+        if not in_flight:
+            break
+
+        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            result = future.result()
+            done += 1
+            if result.error:
+                failures.append((result.key, result.error))
+            else:
+                updates.append({'id': user_ids[result.key], 'face_encoding': result.encoding})
+                enrolled += 1
+        if len(updates) >= batch_size:
+            _save_batch(updates, active_ids)
+            updates = []
+        if progress:
+            progress(done, total)
+
+    _save_batch(updates, active_ids)
+    return EnrollmentReport(total, enrolled, failures, time.perf_counter() - started)
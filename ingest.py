@@ -0,0 +1,239 @@
+"""
+Batch attendance ingestion for kiosks and biometric terminals
+
+Devices authenticate with a JWT issued by `flask --app app issue-device-token`
+and upload check-in/check-out events in batches, including events buffered
+while offline. Each (device, event id) is applied at most once, so a device
+can simply resend a batch whose response it never received.
+
+A batch costs a fixed number of statements whatever its size: one query
+each for already ingested event ids, users and existing attendance rows,
+bulk inserts for new rows, batched updates for existing ones and a
+Performance refresh, committed once. Lateness comes from the in-memory
+schedule index in lateness.py.
+"""
+
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from models import db, User, Attendance, IngestedEvent
+from attendance import event_payload, invalidate_snapshot
+from events import attendance_events
+from performance import refresh_users
+from lateness import classify
+from archive import is_archived
+from sqlite_profile import write_queue
+
+DEVICE_SCOPE = 'attendance:ingest'
+EVENT_TYPES = ('check_in', 'check_out')
+
+
+class IngestError(ValueError):
+    """Raised for an invalid ingestion request or event"""
+
+
+class DeviceAuthError(IngestError):
+    """Raised when a device token is missing or invalid"""
+
+
+def max_events():
+    return int(os.getenv('INGEST_MAX_EVENTS', 1000))
+
+
+# Device tokens
+def issue_device_token(device_id, secret, days=None):
+    now = datetime.now(timezone.utc)
+    claims = {'sub': str(device_id), 'scope': DEVICE_SCOPE, 'iat': now}
+    if days:
+        claims['exp'] = now + timedelta(days=days)
+    return jwt.encode(claims, secret, algorithm='HS256')
+
+
+def device_from_header(authorization, secret):
+    """Device id from an 'Authorization: Bearer <token>' header"""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise DeviceAuthError('Missing bearer token')
+    try:
+        claims = jwt.decode(token.strip(), secret, algorithms=['HS256'])
+    except jwt.InvalidTokenError as e:
+        raise DeviceAuthError(f'Invalid device token: {e}') from None
+    if claims.get('scope') != DEVICE_SCOPE or not claims.get('sub'):
+        raise DeviceAuthError('Token is not a device token')
+    return claims['sub']
+
+
+# Events
+Event = namedtuple('Event', ['index', 'event_id', 'user_id', 'type', 'timestamp', 'method'])
+
+
+def parse_timestamp(value):
+    try:
+        timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise IngestError(f'Invalid timestamp: {value}') from None
+    if timestamp.tzinfo is not None:
+        # Attendance is stored in naive server-local time
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def parse_event(index, raw):
+    if not isinstance(raw, dict):
+        raise IngestError('Event must be an object')
+    event_id = str(raw.get('event_id') or '').strip()
+    if not event_id or len(event_id) > 64:
+        raise IngestError('event_id is required (at most 64 characters)')
+    if raw.get('type') not in EVENT_TYPES:
+        raise IngestError(f'type must be one of {", ".join(EVENT_TYPES)}')
+    try:
+        user_id = int(raw.get('user_id'))
+    except (TypeError, ValueError):
+        raise IngestError('user_id must be an integer') from None
+    return Event(index, event_id, user_id, raw['type'], parse_timestamp(raw.get('timestamp')),
+                 str(raw.get('method') or 'terminal')[:20])
+
+
+def _result(event_id, status, error=None):
+    result = {'event_id': event_id, 'status': status}
+    if error:
+        result['error'] = error
+    return result
+
+
+def stage_events(device_id, raw_events):
+    """Apply a batch of events to the current transaction without committing
+
+    Returns (per-event results, live events to publish, days touched).
+    """
+    results = [None] * len(raw_events)
+    events = []
+    for index, raw in enumerate(raw_events):
+        try:
+            events.append(parse_event(index, raw))
+        except IngestError as e:
+            event_id = raw.get('event_id') if isinstance(raw, dict) else None
+            results[index] = _result(event_id, 'invalid', str(e))
+
+    # Drop events this device already delivered, in earlier batches or this one
+    seen = {event_id for (event_id,) in db.session.query(IngestedEvent.event_id).filter(
+        IngestedEvent.device_id == device_id,
+        IngestedEvent.event_id.in_({event.event_id for event in events})
+    )} if events else set()
+    fresh = []
+    for event in events:
+        if event.event_id in seen:
+            results[event.index] = _result(event.event_id, 'duplicate')
+        else:
+            seen.add(event.event_id)
+            fresh.append(event)
+
+    user_ids = {event.user_id for event in fresh}
+    users = {user_id: (full_name, role) for user_id, full_name, role in db.session.query(
+        User.id, User.full_name, User.role
+    ).filter(User.id.in_(user_ids), User.is_active.isnot(False))} if fresh else {}
+
+    # Existing rows for every (user, day) in the batch in one query
+    days = {event.timestamp.date() for event in fresh}
+    archived = {day for day in days if is_archived(day)}
+    rows = {(row.user_id, row.date): row for row in Attendance.query.filter(
+        Attendance.user_id.in_(list(users)),
+        Attendance.date.in_(days)
+    )} if users else {}
+
+    applied = []
+    ingested = []
+    created = []
+    # Buffered events may arrive out of order; apply them in time order
+    for event in sorted(fresh, key=lambda event: event.timestamp):
+        if event.user_id not in users:
+            results[event.index] = _result(event.event_id, 'rejected', 'Unknown or inactive user')
+            continue
+
+        day = event.timestamp.date()
+        if day in archived:
+            results[event.index] = _result(event.event_id, 'rejected', 'Date belongs to an archived academic year')
+            continue
+        row = rows.get((event.user_id, day))
+        status = 'ignored'
+        if event.type == 'check_in':
+            if row is None:
+                # Kept out of the session and bulk inserted below
+                row = rows[(event.user_id, day)] = Attendance(user_id=event.user_id, date=day)
+                created.append(row)
+            if row.time_in is None or event.timestamp < row.time_in:
+                row.time_in = event.timestamp
+                row.method = event.method
+                row.status = classify(event.user_id, event.timestamp)
+                status = 'applied'
+        else:
+            if row is None or row.time_in is None or event.timestamp < row.time_in:
+                results[event.index] = _result(event.event_id, 'rejected', 'No check-in before this check-out')
+                continue
+            if row.time_out is None or event.timestamp > row.time_out:
+                row.time_out = event.timestamp
+                status = 'applied'
+
+        results[event.index] = _result(event.event_id, status)
+        ingested.append((event, row, status))
+        if status == 'applied':
+            applied.append((event, row))
+
+    created_at = datetime.utcnow()
+    if created:
+        db.session.execute(db.insert(Attendance), [{
+            'user_id': row.user_id,
+            'date': row.date,
+            'time_in': row.time_in,
+            'time_out': row.time_out,
+            'method': row.method,
+            'status': row.status,
+            'created_at': created_at
+        } for row in created])
+        for attendance_id, user_id, day in db.session.query(Attendance.id, Attendance.user_id, Attendance.date).filter(
+            Attendance.user_id.in_({row.user_id for row in created}),
+            Attendance.date.in_({row.date for row in created})
+        ):
+            row = rows.get((user_id, day))
+            if row is not None and row.id is None:
+                row.id = attendance_id
+
+    if ingested:
+        db.session.execute(db.insert(IngestedEvent), [{
+            'device_id': device_id,
+            'event_id': event.event_id,
+            'attendance_id': row.id,
+            'result': status,
+            'received_at': created_at
+        } for event, row, status in ingested])
+
+    months = {}
+    for event, row in applied:
+        months.setdefault((row.date.month, row.date.year), set()).add(row.user_id)
+    for (month, year), month_user_ids in months.items():
+        refresh_users(month, year, month_user_ids)
+
+    published = [(event.type, event_payload(row, *users[row.user_id])) for event, row in applied]
+    return results, published, {row.date for event, row in applied}
+
+
+def ingest(device_id, raw_events):
+    """Apply and commit a batch of device events; returns per-event results"""
+    if write_queue.enabled:
+        results, published, days = write_queue.run(lambda: stage_events(device_id, raw_events))
+    else:
+        try:
+            results, published, days = stage_events(device_id, raw_events)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    for day in days:
+        invalidate_snapshot(day)
+    for event, payload in published:
+        attendance_events.publish(event, payload)
+    return results
@@ -0,0 +1,242 @@
+"""
+Opt-in request instrumentation
+
+With INSTRUMENTATION=true every request records its latency in a
+per-endpoint histogram, counts the SQL statements it ran and the time
+spent in them, and answers with a Server-Timing header that browser
+devtools display. Statements slower than SLOW_QUERY_MS are logged with
+their parameters to the 'instrumentation' logger, as is a request that
+runs the same SELECT N_PLUS_ONE_THRESHOLD or more times (the usual sign
+of a query in a loop). /metrics exposes the counters in the Prometheus
+text format.
+
+Counters live in plain dicts per process, so scrape every worker. The
+cost per statement is two perf_counter() calls and a few dict updates.
+Statements run outside a request (CLI commands, the notification worker,
+the SQLite writer thread) are only checked against the slow-query log.
+"""
+
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MAX_LOGGED_PARAMETERS = 500  # characters of repr(parameters) in the slow-query log
+
+
+def enabled():
+    return os.getenv('INSTRUMENTATION', 'False').lower() in ('1', 'true', 'yes')
+
+
+def slow_query_seconds():
+    return float(os.getenv('SLOW_QUERY_MS', 200)) / 1000
+
+
+def n_plus_one_threshold():
+    return int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """SQL statements run while serving the current request"""
+
+    __slots__ = ('started', 'statements', 'db_seconds', 'by_statement')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0
+        self.by_statement = Counter()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # (endpoint, method, status) -> requests
+            self.latency = {}  # endpoint -> Histogram of seconds
+            self.queries = {}  # endpoint -> Histogram of statements per request
+            self.db_seconds = Counter()  # endpoint -> seconds spent in SQL
+            self.slow_queries = Counter()  # endpoint -> statements over SLOW_QUERY_MS
+            self.n_plus_one = Counter()  # endpoint -> requests flagged as N+1
+
+    def record_request(self, endpoint, method, status, seconds, stats):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.queries[endpoint] = Histogram(QUERY_BUCKETS)
+            self.latency[endpoint].observe(seconds)
+            self.queries[endpoint].observe(stats.statements)
+            self.db_seconds[endpoint] += stats.db_seconds
+
+    def record_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries[endpoint] += 1
+
+    def record_n_plus_one(self, endpoint):
+        with self._lock:
+            self.n_plus_one[endpoint] += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total Requests served, by endpoint, method and status',
+                '# TYPE http_requests_total counter'
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+
+            for name, help_text, histograms in [
+                ('http_request_duration_seconds', 'Request latency by endpoint', self.latency),
+                ('http_request_queries', 'SQL statements per request by endpoint', self.queries),
+            ]:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{_labels(endpoint=endpoint, le=bound)}}} {cumulative}')
+                    lines.append(f'{name}_sum{{{_labels(endpoint=endpoint)}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{_labels(endpoint=endpoint)}}} {histogram.count}')
+
+            for name, help_text, counter in [
+                ('http_request_db_seconds_total', 'Time spent in SQL statements by endpoint', self.db_seconds),
+                ('db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS by endpoint', self.slow_queries),
+                ('db_n_plus_one_total', 'Requests repeating one SELECT N_PLUS_ONE_THRESHOLD or more times',
+                 self.n_plus_one),
+            ]:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, value in sorted(counter.items()):
+                    lines.append(f'{name}{{{_labels(endpoint=endpoint)}}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def current_stats():
+    """Stats of the request being served, or None outside an instrumented request"""
+    if has_request_context():
+        return g.get('instrumentation')
+    return None
+
+
+# Request hooks
+def _start_request():
+    g.instrumentation = RequestStats()
+
+
+def _check_n_plus_one(stats):
+    threshold = n_plus_one_threshold()
+    repeated = [(count, statement) for statement, count in stats.by_statement.items()
+                if count >= threshold and statement.lstrip()[:6].upper() == 'SELECT']
+    if repeated:
+        metrics.record_n_plus_one(_endpoint())
+        count, statement = max(repeated)
+        logger.warning('Possible N+1 in %s %s: %d statements, one SELECT ran %d times: %s',
+                       request.method, request.path, stats.statements, count, statement)
+
+
+def _finish_request(response):
+    stats = g.pop('instrumentation', None)
+    if stats is None:
+        return response
+    seconds = time.perf_counter() - stats.started
+    metrics.record_request(_endpoint(), request.method, response.status_code, seconds, stats)
+    _check_n_plus_one(stats)
+    response.headers.add(
+        'Server-Timing',
+        f'app;dur={seconds * 1000:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} queries"'
+    )
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped when an exception propagates (debug and testing)
+    stats = g.pop('instrumentation', None)
+    if stats is not None:
+        metrics.record_request(_endpoint(), request.method, 500, time.perf_counter() - stats.started, stats)
+
+
+# Engine hooks
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instrumentation_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['instrumentation_started'].pop()
+    elapsed = time.perf_counter() - started
+    stats = current_stats()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+        stats.by_statement[statement] += 1
+
+    if elapsed >= slow_query_seconds():
+        endpoint = _endpoint() if stats is not None else None
+        metrics.record_slow_query(endpoint or 'background')
+        logger.warning('Slow query (%.1f ms) in %s: %s; parameters %s', elapsed * 1000,
+                       f'{request.method} {request.path}' if endpoint else 'background', statement,
+                       repr(parameters)[:MAX_LOGGED_PARAMETERS])
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('instrumentation_started') \
+        if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def init_app(app):
+    if not enabled():
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
@@ -0,0 +1,165 @@
+"""
+Timetable-aware lateness
+
+A check-in is late when it comes more than LATE_THRESHOLD_MINUTES after
+the start of the user's first lesson that weekday. The first lesson of
+every teacher on every weekday is kept in an in-memory index built with one
+grouped query, so classifying a check-in is two dict lookups. Committed
+Timetable writes in this process drop the index; other processes rebuild
+it after LATENESS_INDEX_TTL seconds.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Attendance, Timetable
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def late_threshold():
+    return timedelta(minutes=int(os.getenv('LATE_THRESHOLD_MINUTES', 15)))
+
+
+class ScheduleIndex:
+    """Start of each teacher's first lesson, by day_of_week"""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._days = None  # day name -> {teacher id: first start time}
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else float(os.getenv('LATENESS_INDEX_TTL', 300))
+
+    def build(self):
+        days = {day: {} for day in WEEKDAYS}
+        rows = db.session.query(
+            Timetable.day_of_week,
+            Timetable.teacher_id,
+            db.func.min(Timetable.start_time)
+        ).group_by(Timetable.day_of_week, Timetable.teacher_id)
+        for day, teacher_id, start in rows:
+            days.setdefault(day.strip().capitalize(), {})[teacher_id] = start
+        return days
+
+    def days(self):
+        days = self._days
+        if days is None or time.monotonic() - self._built_at > self.ttl:
+            with self._lock:
+                if self._days is days:
+                    self._days = self.build()
+                    self._built_at = time.monotonic()
+                days = self._days
+        return days
+
+    def invalidate(self):
+        self._days = None
+
+    def first_lesson(self, user_id, day):
+        """Start time of the user's first lesson on a date, or None"""
+        return self.days()[WEEKDAYS[day.weekday()]].get(user_id)
+
+    def classify(self, user_id, when):
+        """'late' or 'present' for a check-in at when"""
+        first_lesson = self.first_lesson(user_id, when.date())
+        if first_lesson is None:
+            return 'present'
+        if when > datetime.combine(when.date(), first_lesson) + late_threshold():
+            return 'late'
+        return 'present'
+
+
+schedule_index = ScheduleIndex()
+
+
+def classify(user_id, when):
+    return schedule_index.classify(user_id, when)
+
+
+def reclassify(start_date, end_date, batch_size=1000):
+    """Recompute present/late for checked-in attendance in a date range
+
+    Rows are scanned in id order batch_size at a time and only the ids
+    whose status changes are written, with one UPDATE per status per batch.
+    Rows are classified in Python with the schedule index rather than in
+    one correlated UPDATE: weekday-of-date and time arithmetic differ
+    between SQLite and PostgreSQL, and day_of_week names need the same
+    normalisation as the index.
+    Absent rows and archived years are left alone. Does not commit; returns
+    (rows checked, rows changed, (month, year) pairs changed).
+    """
+    schedule_index.invalidate()
+    query = db.session.query(
+        Attendance.id,
+        Attendance.user_id,
+        Attendance.date,
+        Attendance.time_in,
+        Attendance.status
+    ).filter(
+        Attendance.date.between(start_date, end_date),
+        Attendance.time_in.isnot(None),
+        Attendance.status.in_(['present', 'late'])
+    ).order_by(Attendance.id)
+
+    checked = 0
+    changed = 0
+    months = set()
+    last_id = 0
+    while True:
+        rows = query.filter(Attendance.id > last_id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        checked += len(rows)
+
+        changes = {'present': [], 'late': []}
+        for attendance_id, user_id, day, time_in, status in rows:
+            new_status = schedule_index.classify(user_id, time_in)
+            if new_status != status:
+                changes[new_status].append(attendance_id)
+                months.add((day.month, day.year))
+        for status, ids in changes.items():
+            if ids:
+                db.session.execute(
+                    db.update(Attendance).where(Attendance.id.in_(ids)).values(status=status),
+                    execution_options={'synchronize_session': False}
+                )
+                changed += len(ids)
+    return checked, changed, months
+
+
+# Invalidation hooks: drop the index once timetable changes commit
+@event.listens_for(Timetable, 'after_insert')
+@event.listens_for(Timetable, 'after_update')
+@event.listens_for(Timetable, 'after_delete')
+def _timetable_written(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['timetable_changed'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _timetable_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Timetable:
+            orm_execute_state.session.info['timetable_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    if session.info.pop('timetable_changed', False):
+        schedule_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('timetable_changed', None)
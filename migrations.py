@@ -0,0 +1,254 @@
+"""
+Schema and data migrations for existing databases
+
+db.create_all() only creates missing tables, so changes to existing tables
+are applied here as numbered, idempotent steps. The applied version is kept
+in the schema_version table.
+"""
+
+import json
+import logging
+from datetime import date
+
+import numpy as np
+import sqlalchemy as sa
+
+from models import db, User, Attendance, Timetable, Performance, Salary, Notification, IngestedEvent, AttendanceArchive
+from performance import STAFF_ROLES
+
+MIGRATIONS = []
+
+logger = logging.getLogger(__name__)
+
+
+def migration(version, description):
+    """Register a migration step"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return func
+    return decorator
+
+
+def _version_table():
+    return sa.table('schema_version', sa.column('version', sa.Integer))
+
+
+def current_version(connection):
+    if not sa.inspect(connection).has_table('schema_version'):
+        connection.execute(sa.text('CREATE TABLE schema_version (version INTEGER NOT NULL)'))
+        connection.execute(sa.insert(_version_table()).values(version=0))
+        return 0
+    return connection.execute(sa.select(_version_table().c.version)).scalar() or 0
+
+
+def upgrade(verbose=True):
+    """Apply every pending migration, each in its own transaction"""
+    with db.engine.begin() as connection:
+        version = current_version(connection)
+
+    applied = 0
+    for step_version, description, func in MIGRATIONS:
+        if step_version <= version:
+            continue
+        with db.engine.begin() as connection:
+            result = func(connection)
+            connection.execute(sa.update(_version_table()).values(version=step_version))
+        applied += 1
+        if verbose:
+            suffix = f' ({result})' if result else ''
+            print(f'Applied migration {step_version}: {description}{suffix}')
+    return applied
+
+
+def _columns(connection, table):
+    return {column['name']: column for column in sa.inspect(connection).get_columns(table)}
+
+
+def _create_indexes(connection, *names):
+    """Create the named model indexes that do not exist yet"""
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def _dedupe(connection, table, keys, order_by, batch_size=1000):
+    """Delete all but the first row (by order_by) of every group sharing keys"""
+    key_columns = [table.c[key] for key in keys]
+    duplicates = sa.select(*key_columns).group_by(*key_columns).having(sa.func.count() > 1).subquery()
+    rows = connection.execute(
+        sa.select(table.c.id, *key_columns).select_from(
+            table.join(duplicates, sa.and_(*(table.c[key] == duplicates.c[key] for key in keys)))
+        ).order_by(*key_columns, *order_by)
+    ).all()
+
+    doomed = []
+    previous = None
+    for row in rows:
+        if tuple(row[1:]) == previous:
+            doomed.append(row.id)
+        previous = tuple(row[1:])
+    for start in range(0, len(doomed), batch_size):
+        connection.execute(sa.delete(table).where(table.c.id.in_(doomed[start:start + batch_size])))
+    return len(doomed)
+
+
+@migration(1, 'store face encodings as float32 blobs instead of JSON text')
+def convert_face_encodings(connection, batch_size=1000):
+    user = sa.table('user', sa.column('id'), sa.column('face_encoding'))
+    column = _columns(connection, 'user')['face_encoding']
+    target = 'face_encoding'
+
+    # SQLite columns accept blobs whatever their declared type; other
+    # databases get a new binary column that replaces the text one.
+    if connection.dialect.name != 'sqlite' and not isinstance(column['type'], sa.LargeBinary):
+        target = 'face_encoding_blob'
+        connection.execute(sa.text(
+            f'ALTER TABLE {connection.dialect.identifier_preparer.quote("user")} '
+            f'ADD COLUMN {target} {sa.LargeBinary().compile(dialect=connection.dialect)}'
+        ))
+    user_target = sa.table('user', sa.column('id'), sa.column(target))
+
+    rows = connection.execute(
+        sa.select(user.c.id, user.c.face_encoding).where(user.c.face_encoding.isnot(None))
+    ).all()
+
+    # Malformed encodings are not converted. SQLite keeps them in place for
+    # review (the face index skips them); the replacement binary column on
+    # other databases cannot hold them, so they are cleared. Either way the
+    # users are logged so they can enroll again.
+    updates = []
+    malformed = []
+    for user_id, value in rows:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            continue
+        try:
+            encoding = np.asarray(json.loads(value), dtype=np.float32)
+        except (TypeError, ValueError):
+            encoding = None
+        if encoding is None or encoding.shape != (128,):
+            malformed.append(user_id)
+            continue
+        updates.append({'b_id': user_id, 'b_value': encoding.tobytes()})
+
+    statement = sa.update(user_target).where(user_target.c.id == sa.bindparam('b_id')).values(
+        {target: sa.bindparam('b_value')}
+    )
+    for start in range(0, len(updates), batch_size):
+        connection.execute(statement, updates[start:start + batch_size])
+
+    if target != 'face_encoding':
+        quote = connection.dialect.identifier_preparer.quote
+        connection.execute(sa.text(f'ALTER TABLE {quote("user")} DROP COLUMN face_encoding'))
+        connection.execute(sa.text(f'ALTER TABLE {quote("user")} RENAME COLUMN {target} TO face_encoding'))
+
+    result = f'{len(updates)} encodings converted'
+    if malformed:
+        action = 'left for review' if target == 'face_encoding' else 'cleared'
+        logger.warning('Malformed face encodings %s for users %s', action, ', '.join(map(str, malformed)))
+        result += f', {len(malformed)} malformed {action}'
+    return result
+
+
+@migration(2, 'add per-user base salary')
+def add_user_base_salary(connection):
+    if 'base_salary' not in _columns(connection, 'user'):
+        quote = connection.dialect.identifier_preparer.quote
+        connection.execute(sa.text(f'ALTER TABLE {quote("user")} ADD COLUMN base_salary FLOAT'))
+
+
+@migration(3, 'add monthly attendance counters to performance')
+def add_performance_counters(connection):
+    columns = _columns(connection, 'performance')
+    for name in ('days', 'present_days', 'late_days'):
+        if name not in columns:
+            connection.execute(sa.text(f'ALTER TABLE performance ADD COLUMN {name} INTEGER DEFAULT 0'))
+    return 'run `flask --app app rebuild-performance --all` to backfill'
+
+
+@migration(4, 'add indexes for hot queries and one attendance/salary/performance row per period')
+def add_indexes(connection):
+    attendance = Attendance.__table__
+    salary = Salary.__table__
+    performance = Performance.__table__
+
+    # Unique indexes fail on existing duplicates: keep the earliest check-in,
+    # the paid salary and the most recent (rebuildable) performance row.
+    removed = _dedupe(connection, attendance, ['user_id', 'date'],
+                      [attendance.c.time_in.is_(None), attendance.c.time_in, attendance.c.id])
+    removed += _dedupe(connection, salary, ['user_id', 'month', 'year'], [salary.c.paid.desc(), salary.c.id])
+    removed += _dedupe(connection, performance, ['teacher_id', 'month', 'year'], [performance.c.id.desc()])
+
+    _create_indexes(
+        connection,
+        'uq_attendance_user_date',
+        'ix_attendance_date',
+        'ix_timetable_teacher',
+        'uq_performance_period_teacher',
+        'uq_salary_user_period',
+        'ix_salary_period',
+        'ix_notification_sent'
+    )
+    return f'{removed} duplicate rows removed' if removed else None
+
+
+@migration(5, 'add the kiosk event log and the attendance archive catalog')
+def add_ingest_and_archive_tables(connection):
+    for model in (IngestedEvent, AttendanceArchive):
+        model.__table__.create(connection, checkfirst=True)
+
+
+@migration(6, 'drop monthly performance rows of users who are not staff')
+def drop_non_staff_performance(connection):
+    removed = connection.execute(sa.delete(Performance).where(
+        Performance.teacher_id.not_in(sa.select(User.id).where(User.role.in_(STAFF_ROLES)))
+    )).rowcount
+    return f'{removed} rows removed' if removed else None
+
+
+@migration(7, 'record failed notification deliveries')
+def add_notification_failures(connection):
+    columns = _columns(connection, 'notification')
+    for name, column_type in [('attempts', 'INTEGER DEFAULT 0'), ('failed_at', 'TIMESTAMP'),
+                              ('error', 'VARCHAR(255)')]:
+        if name not in columns:
+            connection.execute(sa.text(f'ALTER TABLE notification ADD COLUMN {name} {column_type}'))
+
+
+# Query plan verification
+def hot_queries(day=None):
+    """(name, statement) for the queries the indexes above are meant to serve"""
+    day = day or date.today()
+    return [
+        ('attendance for user and day', sa.select(Attendance).where(
+            Attendance.user_id == 1, Attendance.date == day)),
+        ('attendance for a day', sa.select(Attendance).where(Attendance.date == day)),
+        ('attendance report page', sa.select(Attendance).where(
+            Attendance.date.between(day.replace(day=1), day)
+        ).order_by(Attendance.date, Attendance.id).limit(21)),
+        ('timetable for teacher', sa.select(Timetable).where(Timetable.teacher_id == 1)),
+        ('performance for month', sa.select(Performance).where(
+            Performance.month == day.month, Performance.year == day.year)),
+        ('salary for user and month', sa.select(Salary).where(
+            Salary.user_id == 1, Salary.month == day.month, Salary.year == day.year)),
+        ('salaries for month', sa.select(sa.func.sum(Salary.total_salary)).where(
+            Salary.month == day.month, Salary.year == day.year)),
+        ('unsent notifications', sa.select(Notification).where(
+            Notification.sent.is_(False), Notification.id > 0).order_by(Notification.id).limit(50)),
+    ]
+
+
+def explain(connection, statement):
+    """Lines of the database's query plan for a statement"""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(sa.text(f'EXPLAIN QUERY PLAN {sql}'))]
+    return [' | '.join(str(value) for value in row) for row in connection.execute(sa.text(f'EXPLAIN {sql}'))]
+
+
+def explain_hot_queries():
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries():
+            print(f'{name}:')
+            for line in explain(connection, statement):
+                print(f'    {line}')
@@ -0,0 +1,143 @@
+"""
+Database models for the Staff Management System
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from datetime import datetime
+
+db = SQLAlchemy()
+
+# Database Models
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(120), nullable=False)
+    role = db.Column(db.String(20), nullable=False)  # student, teacher, headteacher, deputy, bursar
+    full_name = db.Column(db.String(100), nullable=False)
+    phone_number = db.Column(db.String(20))
+    # Biometric columns are deferred; load them with .options(db.undefer_group('biometric'))
+    face_encoding = db.deferred(db.Column(db.LargeBinary), group='biometric')  # 128 float32 values (512 bytes), see face_index
+    fingerprint_data = db.deferred(db.Column(db.Text), group='biometric')  # Store fingerprint data
+    base_salary = db.Column(db.Float)  # Monthly base salary, DEFAULT_BASE_SALARY when unset
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    is_active = db.Column(db.Boolean, default=True)
+
+class Attendance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time_in = db.Column(db.DateTime)
+    time_out = db.Column(db.DateTime)
+    method = db.Column(db.String(20))  # face, fingerprint
+    status = db.Column(db.String(20))  # present, absent, late
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_attendance_user_date', 'user_id', 'date', unique=True),  # One record per user per day
+        db.Index('ix_attendance_date', 'date'),
+    )
+
+class Timetable(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subject = db.Column(db.String(50), nullable=False)
+    day_of_week = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    room = db.Column(db.String(20))
+    class_name = db.Column(db.String(20))
+
+    __table_args__ = (
+        db.Index('ix_timetable_teacher', 'teacher_id'),
+    )
+
+class Performance(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    attendance_score = db.Column(db.Float, default=0.0)
+    punctuality_score = db.Column(db.Float, default=0.0)
+    overall_score = db.Column(db.Float, default=0.0)
+    # Running attendance counters for the month, see performance.py
+    days = db.Column(db.Integer, default=0)
+    present_days = db.Column(db.Integer, default=0)
+    late_days = db.Column(db.Integer, default=0)
+    remarks = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_performance_period_teacher', 'year', 'month', 'teacher_id', unique=True),
+    )
+
+class Salary(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    base_salary = db.Column(db.Float, nullable=False)
+    attendance_bonus = db.Column(db.Float, default=0.0)
+    performance_bonus = db.Column(db.Float, default=0.0)
+    total_salary = db.Column(db.Float, nullable=False)
+    paid = db.Column(db.Boolean, default=False)
+    paid_date = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_salary_user_period', 'user_id', 'month', 'year', unique=True),
+        db.Index('ix_salary_period', 'year', 'month'),
+    )
+
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    type = db.Column(db.String(20))  # email, sms, system
+    sent = db.Column(db.Boolean, default=False)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, default=0)  # Failed delivery attempts
+    failed_at = db.Column(db.DateTime)  # Set when delivery is given up after NOTIFICATION_MAX_ATTEMPTS
+    error = db.Column(db.String(255))  # Last delivery error
+
+    __table_args__ = (
+        db.Index('ix_notification_sent', 'sent', 'id'),  # Dispatcher scans unsent rows by id
+    )
+
+# Events accepted from kiosks and terminals, kept so retried uploads are idempotent
+class IngestedEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(64), nullable=False)
+    event_id = db.Column(db.String(64), nullable=False)
+    attendance_id = db.Column(db.Integer, db.ForeignKey('attendance.id'))
+    result = db.Column(db.String(20))  # applied, ignored, rejected
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_ingested_event_device_event', 'device_id', 'event_id', unique=True),
+    )
+
+# Closed academic years moved out of the attendance table (see archive.py)
+class AttendanceArchive(db.Model):
+    academic_year = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Calendar year it starts in
+    table_name = db.Column(db.String(64), nullable=False)
+    first_day = db.Column(db.Date, nullable=False)
+    last_day = db.Column(db.Date, nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Procurement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    item_name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    supplier = db.Column(db.String(100))
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    approved_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected, completed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
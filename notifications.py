@@ -0,0 +1,348 @@
+"""
+Background notification delivery
+
+Requests only create Notification rows. A dispatcher thread picks up unsent
+email/SMS rows in batches, delivers them over one reused SMTP session and
+a single rate-limited Twilio client, retries failures with exponential
+backoff and marks delivered rows sent in one UPDATE per batch. Failed
+attempts are counted on the row; after NOTIFICATION_MAX_ATTEMPTS the row
+gets failed_at and is no longer picked up.
+
+The dispatcher starts with the app, delivering anything left unsent by a
+previous run. Run it in exactly one process (NOTIFICATION_WORKER=False on
+the others), otherwise two processes may deliver the same row. Apps
+loaded by a flask command start it on their first request, so that only
+`flask run` delivers.
+"""
+
+import os
+import time
+import logging
+import smtplib
+import threading
+from collections import namedtuple
+from datetime import datetime
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+import click
+
+from models import db, User, Notification, Timetable
+
+logger = logging.getLogger(__name__)
+
+DELIVERABLE_TYPES = ['email', 'sms']
+
+BroadcastResult = namedtuple('BroadcastResult', ['recipients', 'resolve_ms', 'insert_ms', 'total_ms'])
+
+
+def _env_flag(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+class SMTPSession:
+    """One SMTP connection reused across messages, reconnected when dropped"""
+
+    def __init__(self, host=None, port=None, username=None, password=None, use_tls=None, timeout=30):
+        self.host = host or os.getenv('EMAIL_SERVER', 'smtp.gmail.com')
+        self.port = int(port or os.getenv('EMAIL_PORT', 587))
+        self.username = username if username is not None else os.getenv('EMAIL_USER')
+        self.password = password if password is not None else os.getenv('EMAIL_PASSWORD')
+        self.use_tls = _env_flag('EMAIL_USE_TLS', True) if use_tls is None else use_tls
+        self.timeout = timeout
+        self.sender = self.username or 'noreply@school.com'
+        self._server = None
+        self._lock = threading.Lock()
+        self.connections = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.connections += 1
+        return server
+
+    def send(self, to_email, subject, message):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message, 'plain'))
+
+        with self._lock:
+            for attempt in range(2):
+                if self._server is None:
+                    self._server = self._connect()
+                try:
+                    self._server.sendmail(self.sender, to_email, msg.as_string())
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    # Idle connections get dropped by the server; retry once fresh
+                    self._server = None
+                    if attempt:
+                        raise
+
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except smtplib.SMTPException:
+                    pass
+                self._server = None
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts of `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+class SMSClient:
+    """Lazily created Twilio client behind a rate limiter"""
+
+    def __init__(self, rate=None):
+        self.rate_limiter = RateLimiter(float(rate or os.getenv('TWILIO_RATE_LIMIT', 1)))
+        self._client = None
+
+    def send(self, phone_number, message):
+        if self._client is None:
+            from twilio.rest import Client
+            self._client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+        self.rate_limiter.acquire()
+        self._client.messages.create(
+            body=message,
+            from_=os.getenv('TWILIO_PHONE_NUMBER'),
+            to=phone_number
+        )
+
+
+class NotificationDispatcher:
+    def __init__(self, batch_size=50, poll_interval=None, max_attempts=None, backoff=2.0):
+        self.app = None
+        self.batch_size = batch_size
+        self.poll_interval = float(poll_interval or os.getenv('NOTIFICATION_POLL_SECONDS', 30))
+        self.max_attempts = int(max_attempts or os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+        self.backoff = backoff
+        self.smtp = SMTPSession()
+        self.sms = SMSClient()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._next_attempt = {}  # notification id -> monotonic time of the next retry
+        self.sent = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.app = app
+        if not self.enabled:
+            return
+        if click.get_current_context(silent=True) is None:
+            self.start()
+        else:
+            app.before_request(self._start_on_request)
+
+    def _start_on_request(self):
+        if self._thread is None:
+            self.start()
+
+    @property
+    def enabled(self):
+        return _env_flag('NOTIFICATION_WORKER', True)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+                # Deliver whatever is already waiting without a poll interval's delay
+                self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.smtp.close()
+
+    def wake(self):
+        """Signal that new notifications are waiting, starting the worker if needed"""
+        if not self.enabled:
+            return
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception as e:
+                logger.exception("Notification dispatcher error: %s", e)
+            finally:
+                # Connections idle between bursts are likely to be dropped anyway
+                self.smtp.close()
+
+    def _ready(self, notification_id, now):
+        return self._next_attempt.get(notification_id, 0) <= now
+
+    def _deliver(self, row):
+        if row.type == 'email':
+            if not row.email:
+                raise ValueError('user has no email address')
+            self.smtp.send(row.email, row.title, row.message)
+        else:
+            if not row.phone_number:
+                raise ValueError('user has no phone number')
+            self.sms.send(row.phone_number, row.message)
+
+    def process_batch(self, after_id=0):
+        """Deliver one batch of unsent notifications after after_id
+
+        Returns the last id looked at, or None when there is nothing left.
+        """
+        rows = db.session.query(
+            Notification.id,
+            Notification.type,
+            Notification.title,
+            Notification.message,
+            Notification.attempts,
+            User.email,
+            User.phone_number
+        ).join(User, User.id == Notification.user_id).filter(
+            Notification.sent.is_(False),
+            Notification.failed_at.is_(None),
+            Notification.type.in_(DELIVERABLE_TYPES),
+            Notification.id > after_id
+        ).order_by(Notification.id).limit(self.batch_size).all()
+        db.session.rollback()
+        if not rows:
+            return None
+
+        now = time.monotonic()
+        delivered = []
+        failures = []
+        for row in rows:
+            if not self._ready(row.id, now):
+                continue
+            try:
+                self._deliver(row)
+            except Exception as e:
+                attempts = (row.attempts or 0) + 1
+                self.failed += 1
+                failure = {'attempts': attempts, 'error': str(e)[:255]}
+                if attempts >= self.max_attempts:
+                    failure['failed_at'] = datetime.now()
+                    self._next_attempt.pop(row.id, None)
+                    logger.error("Giving up on %s notification %s after %s attempts: %s",
+                                 row.type, row.id, attempts, e)
+                else:
+                    self._next_attempt[row.id] = time.monotonic() + self.backoff ** attempts
+                    logger.warning("%s error (notification %s, attempt %s): %s", row.type.upper(), row.id, attempts, e)
+                failures.append((row.id, failure))
+                continue
+            self._next_attempt.pop(row.id, None)
+            delivered.append(row.id)
+
+        for notification_id, failure in failures:
+            db.session.execute(db.update(Notification).where(Notification.id == notification_id).values(**failure))
+        if delivered:
+            db.session.execute(
+                db.update(Notification).where(Notification.id.in_(delivered)).values(
+                    sent=True, sent_at=datetime.now()
+                )
+            )
+            self.sent += len(delivered)
+        if failures or delivered:
+            db.session.commit()
+        return rows[-1].id
+
+    def drain(self):
+        """Deliver everything currently due; returns the number sent"""
+        with self._drain_lock:
+            sent_before = self.sent
+            after_id = 0
+            while after_id is not None and not self._stop.is_set():
+                after_id = self.process_batch(after_id)
+            return self.sent - sent_before
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+def broadcast_recipients(roles=None, class_names=None, user_ids=None):
+    """Ids of active users matching any of the targets
+
+    Classes are resolved through Timetable.class_name, i.e. to the teachers
+    of those classes; students are not linked to classes in the schema.
+    """
+    conditions = []
+    if roles:
+        conditions.append(User.role.in_(roles))
+    if class_names:
+        conditions.append(User.id.in_(
+            db.select(Timetable.teacher_id).where(Timetable.class_name.in_(class_names))
+        ))
+    if user_ids:
+        conditions.append(User.id.in_(user_ids))
+    if not conditions:
+        return []
+
+    return [user_id for (user_id,) in db.session.query(User.id).filter(
+        User.is_active.isnot(False),
+        db.or_(*conditions)
+    ).order_by(User.id)]
+
+
+def broadcast(title, message, notification_type='system', roles=None, class_names=None, user_ids=None,
+              batch_size=1000):
+    """Create one notification per recipient with bulk inserts and queue delivery"""
+    started = time.perf_counter()
+    recipients = broadcast_recipients(roles, class_names, user_ids)
+    resolved = time.perf_counter()
+
+    created_at = datetime.utcnow()
+    for start in range(0, len(recipients), batch_size):
+        db.session.execute(db.insert(Notification), [{
+            'user_id': user_id,
+            'title': title,
+            'message': message,
+            'type': notification_type,
+            'sent': False,
+            'created_at': created_at
+        } for user_id in recipients[start:start + batch_size]])
+    db.session.commit()
+    finished = time.perf_counter()
+
+    if recipients and notification_type in DELIVERABLE_TYPES:
+        notification_dispatcher.wake()
+
+    return BroadcastResult(
+        len(recipients),
+        (resolved - started) * 1000,
+        (finished - resolved) * 1000,
+        (finished - started) * 1000
+    )
@@ -0,0 +1,104 @@
+"""
+Batch payroll engine
+
+One query for the staff list, one for salaries already calculated this
+month, one read of the month's materialized performance scores and a
+single bulk insert for the new Salary rows, all in one transaction.
+Staff whose salary a concurrent run inserted first are reported as
+skipped.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Salary
+from performance import STAFF_ROLES, load_scores, empty_score
+
+PayrollResult = namedtuple('PayrollResult', ['month', 'year', 'rows', 'skipped', 'dry_run', 'timings'])
+
+
+def default_base_salary():
+    return float(os.getenv('DEFAULT_BASE_SALARY', 50000))
+
+
+def performance_threshold():
+    return float(os.getenv('PERFORMANCE_THRESHOLD', 7.0))
+
+
+def attendance_bonus_threshold():
+    return float(os.getenv('ATTENDANCE_BONUS_THRESHOLD', 8.0))
+
+
+def compute_salary(base_salary, performance_score):
+    """Bonuses and total for one staff member"""
+    attendance_bonus = base_salary * 0.1 if performance_score >= attendance_bonus_threshold() else 0
+    performance_bonus = base_salary * 0.05 if performance_score >= performance_threshold() else 0
+    return attendance_bonus, performance_bonus, base_salary + attendance_bonus + performance_bonus
+
+
+def existing_salaries(month, year):
+    return {user_id for (user_id,) in db.session.query(Salary.user_id).filter_by(month=month, year=year)}
+
+
+def run_payroll(month, year, dry_run=False, retries=2):
+    """Calculate salaries for every staff member without one for the month"""
+    timings = {}
+    started = time.perf_counter()
+
+    staff = db.session.query(User.id, User.full_name, User.base_salary).filter(
+        User.role.in_(STAFF_ROLES)
+    ).all()
+    existing = existing_salaries(month, year)
+    scores = load_scores(month, year, roles=STAFF_ROLES)
+    timings['query_ms'] = (time.perf_counter() - started) * 1000
+
+    rows = []
+    skipped = 0
+    compute_started = time.perf_counter()
+    for user_id, full_name, base_salary in staff:
+        if user_id in existing:
+            skipped += 1
+            continue
+        base_salary = base_salary if base_salary is not None else default_base_salary()
+        score = scores.get(user_id, empty_score(user_id)).score
+        attendance_bonus, performance_bonus, total_salary = compute_salary(base_salary, score)
+        rows.append({
+            'user_id': user_id,
+            'full_name': full_name,
+            'performance_score': round(score, 2),
+            'month': month,
+            'year': year,
+            'base_salary': base_salary,
+            'attendance_bonus': attendance_bonus,
+            'performance_bonus': performance_bonus,
+            'total_salary': total_salary
+        })
+    timings['compute_ms'] = (time.perf_counter() - compute_started) * 1000
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        insert_started = time.perf_counter()
+        columns = ('user_id', 'month', 'year', 'base_salary', 'attendance_bonus',
+                   'performance_bonus', 'total_salary')
+        for attempt in range(retries + 1):
+            try:
+                if rows:
+                    db.session.execute(db.insert(Salary), [{name: row[name] for name in columns} for row in rows])
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Another run inserted some of these salaries since they were checked
+                db.session.rollback()
+                if attempt == retries:
+                    raise
+                existing = existing_salaries(month, year)
+                skipped += sum(1 for row in rows if row['user_id'] in existing)
+                rows = [row for row in rows if row['user_id'] not in existing]
+        timings['insert_ms'] = (time.perf_counter() - insert_started) * 1000
+
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+    return PayrollResult(month, year, rows, skipped, dry_run, timings)
@@ -0,0 +1,224 @@
+"""
+Set-based attendance and punctuality scoring
+
+Scores for every user in a month come from one grouped aggregate over
+Attendance restricted by a date range, which can use an index on date,
+instead of one extract('month')/extract('year') query per teacher.
+
+The Performance table holds the same counters as a materialized monthly
+summary for staff (STAFF_ROLES). Attendance writes update it incrementally
+and reports read it in O(staff) rather than re-aggregating raw attendance.
+"""
+
+import calendar
+from collections import namedtuple
+from datetime import date
+
+from models import db, User, Performance
+from archive import attendance_source
+
+STAFF_ROLES = ['teacher', 'headteacher', 'deputy']
+
+
+class Score(namedtuple('Score', ['user_id', 'days', 'present', 'late'])):
+    """Attendance counts for one user and month, with the derived 0-10 scores"""
+
+    @property
+    def attendance_score(self):
+        return (self.present / self.days) * 10 if self.days else 0.0
+
+    @property
+    def punctuality_score(self):
+        return ((self.days - self.late) / self.days) * 10 if self.days else 0.0
+
+    @property
+    def score(self):
+        if not self.days:
+            return 0.0
+        return (self.attendance_score + self.punctuality_score) / 2
+
+
+def month_range(month, year):
+    """First and last day of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def months_between(first_day, last_day):
+    """(month, year) of every month from first_day's through last_day's"""
+    month, year = first_day.month, first_day.year
+    while (year, month) <= (last_day.year, last_day.month):
+        yield month, year
+        month, year = (1, year + 1) if month == 12 else (month + 1, year)
+
+
+def compute_scores(month, year, user_ids=None, roles=None):
+    """Scores for every user with attendance in the month, keyed by user id
+
+    Users without attendance rows are absent from the result; use
+    ``scores.get(user_id, empty_score(user_id))`` to get a zero score.
+    """
+    first_day, last_day = month_range(month, year)
+    source = attendance_source(first_day, last_day)
+    present = db.func.sum(db.case((source.status == 'present', 1), else_=0))
+    late = db.func.sum(db.case((source.status == 'late', 1), else_=0))
+
+    query = db.session.query(
+        source.user_id,
+        db.func.count(source.id),
+        present,
+        late
+    ).filter(
+        source.date.between(first_day, last_day)
+    ).group_by(source.user_id)
+
+    if user_ids is not None:
+        query = query.filter(source.user_id.in_(user_ids))
+    if roles is not None:
+        query = query.join(User, User.id == source.user_id).filter(User.role.in_(roles))
+
+    return {
+        user_id: Score(user_id, days, int(present or 0), int(late or 0))
+        for user_id, days, present, late in query
+    }
+
+
+def empty_score(user_id):
+    return Score(user_id, 0, 0, 0)
+
+
+def _apply_score(row, score):
+    row.days = score.days
+    row.present_days = score.present
+    row.late_days = score.late
+    row.attendance_score = score.attendance_score
+    row.punctuality_score = score.punctuality_score
+    row.overall_score = score.score
+
+
+def is_materialized(month, year):
+    return db.session.query(Performance.id).filter_by(month=month, year=year).first() is not None
+
+
+def is_staff(user_id):
+    return db.session.query(User.role).filter_by(id=user_id).scalar() in STAFF_ROLES
+
+
+def _store_scores(month, year, scores, rows):
+    """Write scores over the existing Performance rows (teacher_id -> row)"""
+    new_rows = []
+    for user_id, score in scores.items():
+        row = rows.pop(user_id, None)
+        if row is not None:
+            _apply_score(row, score)
+        else:
+            new_rows.append({
+                'teacher_id': user_id,
+                'month': month,
+                'year': year,
+                'days': score.days,
+                'present_days': score.present,
+                'late_days': score.late,
+                'attendance_score': score.attendance_score,
+                'punctuality_score': score.punctuality_score,
+                'overall_score': score.score
+            })
+    # Users whose attendance for the month has gone away
+    for row in rows.values():
+        _apply_score(row, empty_score(row.teacher_id))
+
+    if new_rows:
+        db.session.execute(db.insert(Performance), new_rows)
+
+
+def rebuild_month(month, year, commit=True):
+    """Recompute every staff Performance row for a month from raw attendance"""
+    scores = compute_scores(month, year, roles=STAFF_ROLES)
+    staff = db.select(User.id).where(User.role.in_(STAFF_ROLES))
+    # Rows of users who are no longer staff
+    db.session.execute(
+        db.delete(Performance).where(Performance.month == month, Performance.year == year,
+                                     Performance.teacher_id.not_in(staff)),
+        execution_options={'synchronize_session': False}
+    )
+    rows = {row.teacher_id: row for row in Performance.query.filter_by(month=month, year=year)}
+    _store_scores(month, year, scores, rows)
+    if commit:
+        db.session.commit()
+    return len(scores)
+
+
+def refresh_users(month, year, user_ids):
+    """Recompute the Performance rows of some users after a batch of writes
+
+    Pending attendance changes are flushed first; like record_attendance
+    the update joins the current transaction.
+    """
+    db.session.flush()
+    if not is_materialized(month, year):
+        rebuild_month(month, year, commit=False)
+        return
+
+    scores = compute_scores(month, year, user_ids=user_ids, roles=STAFF_ROLES)
+    rows = {row.teacher_id: row for row in Performance.query.filter(
+        Performance.month == month,
+        Performance.year == year,
+        Performance.teacher_id.in_(user_ids)
+    )}
+    _store_scores(month, year, scores, rows)
+
+
+def record_attendance(attendance, previous_status=None, is_new=False):
+    """Fold one attendance write into the user's monthly Performance row
+
+    Call before committing the attendance change; the update joins the
+    same transaction.
+    """
+    month, year = attendance.date.month, attendance.date.year
+
+    # A month nobody has summarized yet is built in full once
+    if not is_materialized(month, year):
+        db.session.flush()
+        rebuild_month(month, year, commit=False)
+        return
+
+    row = Performance.query.filter_by(teacher_id=attendance.user_id, month=month, year=year).first()
+    if row is None:
+        if not is_staff(attendance.user_id):
+            return
+        db.session.flush()
+        score = compute_scores(month, year, user_ids=[attendance.user_id]).get(
+            attendance.user_id, empty_score(attendance.user_id))
+        row = Performance(teacher_id=attendance.user_id, month=month, year=year)
+        _apply_score(row, score)
+        db.session.add(row)
+        return
+
+    counted = not is_new
+    days = (row.days or 0) + (1 if is_new else 0)
+    present = (row.present_days or 0) + (attendance.status == 'present') - (counted and previous_status == 'present')
+    late = (row.late_days or 0) + (attendance.status == 'late') - (counted and previous_status == 'late')
+    _apply_score(row, Score(attendance.user_id, days, int(present), int(late)))
+
+
+def load_scores(month, year, roles=None):
+    """Scores for the month from the materialized Performance rows
+
+    A month without rows is scored from raw attendance instead; reads never
+    write the summary, that is left to attendance writes and rebuild_month.
+    """
+    if not is_materialized(month, year):
+        return compute_scores(month, year, roles=STAFF_ROLES if roles is None else roles)
+
+    query = db.session.query(
+        Performance.teacher_id,
+        Performance.days,
+        Performance.present_days,
+        Performance.late_days
+    ).filter_by(month=month, year=year)
+    if roles is not None:
+        query = query.join(User, User.id == Performance.teacher_id).filter(User.role.in_(roles))
+
+    return {
+        user_id: Score(user_id, days or 0, present or 0, late or 0)
+        for user_id, days, present, late in query
+    }
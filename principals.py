@@ -0,0 +1,152 @@
+"""
+Cached login principals
+
+Flask-Login calls the user loader on every authenticated request. Instead
+of loading the full User row (including biometric columns) each time, the
+loader returns a lightweight Principal from a bounded LRU cache with a TTL.
+Committed changes to a user drop its entry; bulk UPDATE/DELETE statements
+on the user table clear the cache. Other processes see changes once the
+TTL expires.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User
+
+PRINCIPAL_COLUMNS = ('id', 'username', 'role', 'full_name', 'is_active')
+
+
+class Principal(UserMixin):
+    """The fields of a User needed to authenticate and authorize a request"""
+
+    __slots__ = PRINCIPAL_COLUMNS
+
+    def __init__(self, id, username, role, full_name, is_active):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.full_name = full_name
+        self.is_active = is_active is not False
+
+    def load(self):
+        """The full User row, for code paths that need more than the principal"""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<Principal {self.id} {self.role}>'
+
+
+class PrincipalCache:
+    def __init__(self, maxsize=None, ttl=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()  # user id -> (principal, expires)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize if self._maxsize is not None else int(os.getenv('AUTH_CACHE_SIZE', 1024))
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else float(os.getenv('AUTH_CACHE_TTL', 300))
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] >= now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+
+        self.misses += 1
+        row = db.session.query(*(getattr(User, column) for column in PRINCIPAL_COLUMNS)).filter(
+            User.id == user_id
+        ).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+
+        principal = Principal(*row)
+        with self._lock:
+            self._entries[user_id] = (principal, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+        }
+
+
+principal_cache = PrincipalCache()
+
+
+def load_principal(user_id):
+    try:
+        return principal_cache.get(int(user_id))
+    except (TypeError, ValueError):
+        return None
+
+
+# Invalidation hooks: drop principals of users changed in a transaction
+# once it commits, so a concurrent request cannot re-cache the old row.
+def _changed_users(session):
+    return session.info.setdefault('principal_changes', set())
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        _changed_users(session).add(target.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bulk_user_change(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is User:
+            _changed_users(orm_execute_state.session).add(None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('principal_changes', None)
+    if not changes:
+        return
+    if None in changes:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate(*changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('principal_changes', None)
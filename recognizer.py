@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Headless Multi-Camera Attendance Recognizer
+
+Reads frames from one or more video sources (device index, RTSP URL or a
+video file), recognizes faces against the in-memory face index and records
+check-ins with method='face'.
+
+Check-ins are posted to the web process's /api/attendance/ingest endpoint
+(RECOGNIZER_INGEST_URL) so that it publishes them to live dashboards; the
+recognizer signs its own device token with DEVICE_TOKEN_SECRET. When the
+web process cannot be reached the check-in is written to the database
+directly and only shows up on dashboards through /api/attendance/today.
+
+    python recognizer.py 0 rtsp://gate-camera/stream
+    python recognizer.py entrance.mp4 --scale 0.5 --stats-interval 5
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# Notifications are delivered by the web process, not by a dispatcher here
+os.environ['NOTIFICATION_WORKER'] = 'False'
+
+from app import app, device_token_secret  # noqa: E402
+from ingest import issue_device_token  # noqa: E402
+from face_index import face_index, face_recognition_model  # noqa: E402
+from attendance import record_check_in, AttendanceError  # noqa: E402
+from models import db, Attendance  # noqa: E402
+
+
+def default_ingest_url():
+    return os.getenv('RECOGNIZER_INGEST_URL', f"http://localhost:{os.getenv('PORT', 5000)}/api/attendance/ingest")
+
+
+class IngestClient:
+    """Posts check-ins to the web process, which stores and publishes them"""
+
+    def __init__(self, url, token, timeout=5):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def check_in(self, user_id, when, camera):
+        """Ingestion status of the check-in (applied, ignored, duplicate or rejected)"""
+        event = {
+            # One event per user and day, so a resent check-in is deduplicated
+            'event_id': f'face-{camera}-{user_id}-{when.date().isoformat()}',
+            'user_id': user_id,
+            'type': 'check_in',
+            'timestamp': when.isoformat(),
+            'method': 'face'
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'events': [event]}).encode(),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.load(response)['results'][0]
+        return result['status'], result.get('error')
+
+
+class CameraStats:
+    """Counters for one camera, reset each time they are reported"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.read = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.processed = 0
+        self.faces = 0
+        self.latency_ms = []
+        self.since = time.perf_counter()
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.perf_counter() - self.since, 1e-9)
+            latency = sorted(self.latency_ms)
+            report = {
+                'read_fps': self.read / elapsed,
+                'processed_fps': self.processed / elapsed,
+                'skipped': self.skipped,
+                'dropped': self.dropped,
+                'faces': self.faces,
+                'latency_p50_ms': latency[len(latency) // 2] if latency else None,
+                'latency_max_ms': latency[-1] if latency else None,
+            }
+            self.reset()
+        return report
+
+
+class CameraReader(threading.Thread):
+    """Reads, downscales and de-duplicates frames from one video source
+
+    Frames go into this camera's own bounded queue; when the recognizer falls
+    behind, the oldest frame is dropped so a slow camera never blocks others.
+    """
+
+    def __init__(self, name, source, scale=0.25, queue_size=4, diff_threshold=4.0):
+        super().__init__(name=f'camera-{name}', daemon=True)
+        self.camera = name
+        self.source = int(source) if str(source).isdigit() else source
+        self.scale = scale
+        self.diff_threshold = diff_threshold
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.stats = CameraStats()
+        self.stopped = threading.Event()
+        self.finished = False
+        self._last_thumbnail = None
+
+    def is_file(self):
+        return isinstance(self.source, str) and os.path.isfile(self.source)
+
+    def is_duplicate(self, frame):
+        """Compare a tiny grayscale thumbnail with the last accepted frame"""
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self._last_thumbnail is not None:
+            if np.abs(thumbnail - self._last_thumbnail).mean() < self.diff_threshold:
+                return True
+        self._last_thumbnail = thumbnail
+        return False
+
+    def enqueue(self, item):
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.stats.add(dropped=1)
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        backoff = 1
+        while not self.stopped.is_set():
+            capture = cv2.VideoCapture(self.source)
+            if not capture.isOpened():
+                print(f'[{self.camera}] cannot open {self.source}, retrying in {backoff}s')
+                self.stopped.wait(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+
+            while not self.stopped.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                captured_at = time.perf_counter()
+                self.stats.add(read=1)
+
+                small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale)
+                if self.is_duplicate(small):
+                    self.stats.add(skipped=1)
+                    continue
+                self.enqueue((captured_at, cv2.cvtColor(small, cv2.COLOR_BGR2RGB)))
+            capture.release()
+
+            # A video file is played once; live sources are reopened
+            if self.is_file():
+                break
+        self.finished = True
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Recognizer:
+    """Batches frames from every camera and turns matches into check-ins"""
+
+    def __init__(self, cameras, model=None, reload_interval=300, ingest=None):
+        self.cameras = cameras
+        self.ingest = ingest
+        self.model = model or face_recognition_model()
+        self.reload_interval = reload_interval
+        self.checked_in = set()
+        self.day = None
+        self.last_reload = time.monotonic()
+
+    def refresh_day(self):
+        today = datetime.now().date()
+        if today != self.day:
+            # Users already checked in today never need another DB round trip
+            self.day = today
+            self.checked_in = {
+                user_id for (user_id,) in
+                Attendance.query.with_entities(Attendance.user_id).filter(
+                    Attendance.date == today,
+                    Attendance.time_in.isnot(None)
+                )
+            }
+
+    def collect(self, timeout=0.1):
+        """Take at most one frame from each camera queue"""
+        batch = []
+        for camera in self.cameras:
+            try:
+                captured_at, frame = camera.frames.get_nowait()
+                batch.append((camera, captured_at, frame))
+            except queue.Empty:
+                continue
+        if not batch:
+            time.sleep(timeout)
+        return batch
+
+    def detect(self, frames):
+        import face_recognition
+
+        if self.model == 'cnn' and len({frame.shape for frame in frames}) == 1:
+            return face_recognition.batch_face_locations(frames, batch_size=len(frames))
+        return [face_recognition.face_locations(frame, model=self.model) for frame in frames]
+
+    def process(self, batch):
+        import face_recognition
+
+        frames = [frame for _, _, frame in batch]
+        locations = self.detect(frames)
+
+        owners = []
+        encodings = []
+        for (camera, captured_at, frame), boxes in zip(batch, locations):
+            camera.stats.add(processed=1, faces=len(boxes))
+            if boxes:
+                for encoding in face_recognition.face_encodings(frame, known_face_locations=boxes):
+                    owners.append((camera, captured_at))
+                    encodings.append(encoding)
+
+        if not encodings:
+            return
+
+        # One matrix computation for every face found in this round
+        lookups = face_index.identify_many(encodings)
+        for (camera, captured_at), lookup in zip(owners, lookups):
+            with camera.stats.lock:
+                camera.stats.latency_ms.append((time.perf_counter() - captured_at) * 1000)
+            if lookup.matches:
+                self.check_in(camera, lookup.matches[0])
+
+    def check_in(self, camera, match):
+        if match.user_id in self.checked_in:
+            return
+        if self.ingest is not None:
+            try:
+                status, error = self.ingest.check_in(match.user_id, datetime.now(), camera.camera)
+            except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+                print(f'[{camera.camera}] ingest unavailable ({e}); writing check-in for user {match.user_id} '
+                      f'directly, live dashboards will not see it')
+            else:
+                if status == 'applied':
+                    print(f'[{camera.camera}] checked in user {match.user_id} (distance {match.distance:.3f})')
+                elif status == 'rejected':
+                    print(f'[{camera.camera}] check-in rejected for user {match.user_id}: {error}')
+                self.checked_in.add(match.user_id)
+                return
+        try:
+            record_check_in(match.user_id, 'face')
+            print(f'[{camera.camera}] checked in user {match.user_id} (distance {match.distance:.3f})')
+        except AttendanceError:
+            pass
+        except Exception as e:
+            db.session.rollback()
+            print(f'[{camera.camera}] check-in failed for user {match.user_id}: {e}')
+            return
+        self.checked_in.add(match.user_id)
+
+    def run(self, stats_interval=10):
+        face_index.load()
+        print(f'Face index loaded with {len(face_index)} encodings')
+        last_report = time.monotonic()
+
+        while not all(camera.finished and camera.frames.empty() for camera in self.cameras):
+            self.refresh_day()
+            batch = self.collect()
+            if batch:
+                self.process(batch)
+
+            now = time.monotonic()
+            if self.reload_interval and now - self.last_reload >= self.reload_interval:
+                face_index.load()
+                self.last_reload = now
+            if now - last_report >= stats_interval:
+                self.report()
+                last_report = now
+        self.report()
+
+    def report(self):
+        for camera in self.cameras:
+            stats = camera.stats.snapshot()
+            latency = f"{stats['latency_p50_ms']:.0f}/{stats['latency_max_ms']:.0f} ms" \
+                if stats['latency_p50_ms'] is not None else '-'
+            print(f"[{camera.camera}] read {stats['read_fps']:.1f} fps, processed {stats['processed_fps']:.1f} fps, "
+                  f"skipped {stats['skipped']}, dropped {stats['dropped']}, faces {stats['faces']}, "
+                  f"latency p50/max {latency}")
+        index = face_index.stats()
+        if index['avg_latency_ms'] is not None:
+            print(f"[index] {index['lookups']} lookups, avg {index['avg_latency_ms']:.2f} ms")
+
+
+def main():
+    """Main recognizer function"""
+    parser = argparse.ArgumentParser(description='Headless face recognition attendance service')
+    parser.add_argument('sources', nargs='+', help='Camera index, RTSP URL or video file')
+    parser.add_argument('--scale', type=float, default=0.25, help='Downscale factor applied to frames')
+    parser.add_argument('--queue-size', type=int, default=4, help='Frames buffered per camera')
+    parser.add_argument('--diff-threshold', type=float, default=4.0,
+                        help='Mean pixel difference below which a frame is a near-duplicate')
+    parser.add_argument('--model', choices=['hog', 'cnn'], default=None,
+                        help='Face detection model (defaults to FACE_RECOGNITION_MODEL)')
+    parser.add_argument('--stats-interval', type=float, default=10, help='Seconds between counter reports')
+    parser.add_argument('--reload-interval', type=float, default=300,
+                        help='Seconds between face index reloads (0 disables)')
+    parser.add_argument('--ingest-url', default=None,
+                        help='Ingestion endpoint of the web process (defaults to RECOGNIZER_INGEST_URL; '
+                             'empty writes check-ins to the database directly)')
+    args = parser.parse_args()
+
+    ingest_url = default_ingest_url() if args.ingest_url is None else args.ingest_url
+    ingest = None
+    if ingest_url:
+        token = issue_device_token(f'recognizer-{socket.gethostname()}', device_token_secret())
+        ingest = IngestClient(ingest_url, token)
+
+    cameras = [
+        CameraReader(str(i), source, scale=args.scale, queue_size=args.queue_size,
+                     diff_threshold=args.diff_threshold)
+        for i, source in enumerate(args.sources)
+    ]
+
+    print("=" * 50)
+    print("Staff Management System - Face Recognizer")
+    print("=" * 50)
+    for camera in cameras:
+        print(f'Camera {camera.camera}: {camera.source}')
+        camera.start()
+    print(f"Check-ins: {ingest_url or 'written to the database directly'}")
+
+    with app.app_context():
+        recognizer = Recognizer(cameras, model=args.model, reload_interval=args.reload_interval, ingest=ingest)
+        try:
+            recognizer.run(stats_interval=args.stats_interval)
+        except KeyboardInterrupt:
+            print('\nStopping recognizer')
+        finally:
+            for camera in cameras:
+                camera.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
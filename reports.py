@@ -0,0 +1,109 @@
+"""
+Attendance report queries
+
+Reports page through attendance with keyset pagination on (date, id) so
+each page costs the same no matter how far into a long range it is, and
+exports iterate with yield_per so memory stays flat for any date range.
+"""
+
+import os
+from collections import namedtuple
+from datetime import datetime
+
+from models import db, User
+from archive import attendance_source
+
+Page = namedtuple('Page', ['rows', 'next_cursor'])
+
+MIN_YEAR = 1900
+MAX_YEAR = 2999
+
+
+class ReportError(ValueError):
+    """Raised for invalid report parameters"""
+
+
+def parse_date(value, default=None):
+    """Parse a YYYY-MM-DD query parameter"""
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ReportError(f'Invalid date: {value} (expected YYYY-MM-DD)') from None
+
+
+def check_month(month, year):
+    """Validate month and year query parameters (None when missing or not a number)"""
+    if month is None or not 1 <= month <= 12:
+        raise ReportError('Month must be a number from 1 to 12')
+    if year is None or not MIN_YEAR <= year <= MAX_YEAR:
+        raise ReportError(f'Year must be a number from {MIN_YEAR} to {MAX_YEAR}')
+    return month, year
+
+
+def parse_date_range(start_value, end_value, default):
+    start_date = parse_date(start_value, default)
+    end_date = parse_date(end_value, default)
+    if start_date > end_date:
+        raise ReportError('Start date must be on or before end date')
+    return start_date, end_date
+
+
+def encode_cursor(row):
+    return f'{row.date.isoformat()}_{row.id}'
+
+
+def decode_cursor(cursor):
+    try:
+        day, row_id = cursor.split('_')
+        return datetime.strptime(day, '%Y-%m-%d').date(), int(row_id)
+    except ValueError:
+        raise ReportError('Invalid page cursor') from None
+
+
+def reports_per_page():
+    return int(os.getenv('REPORTS_PER_PAGE', 20))
+
+
+def attendance_query(start_date, end_date, after=None):
+    """Attendance rows in a date range with user names, ordered by (date, id)
+
+    Archived academic years in the range are included. after is a
+    (date, id) position to continue from.
+    """
+    source = attendance_source(start_date, end_date)
+    query = db.session.query(
+        source.id,
+        source.user_id,
+        source.date,
+        source.time_in,
+        source.time_out,
+        source.method,
+        source.status,
+        User.full_name.label('user_name'),
+        User.role
+    ).join(User, User.id == source.user_id).filter(
+        source.date.between(start_date, end_date)
+    )
+    if after:
+        after_date, after_id = after
+        query = query.filter(db.or_(
+            source.date > after_date,
+            db.and_(source.date == after_date, source.id > after_id)
+        ))
+    return query.order_by(source.date, source.id)
+
+
+def attendance_page(start_date, end_date, cursor=None, per_page=None):
+    """One page of the attendance report, starting after cursor"""
+    per_page = per_page or reports_per_page()
+    query = attendance_query(start_date, end_date, decode_cursor(cursor) if cursor else None)
+    rows = query.limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return Page(rows[:per_page], next_cursor)
+
+
+def iter_attendance(start_date, end_date, batch_size=1000):
+    """Stream every attendance row in the range, batch_size rows at a time"""
+    return attendance_query(start_date, end_date).yield_per(batch_size)
@@ -5,7 +5,9 @@ Staff Management System Startup Script
 
 import os
 import sys
+import logging
 from app import app, db
+import migrations
 
 def create_sample_data():
     """Create sample data for demonstration"""
@@ -53,6 +55,10 @@ def create_sample_data():
 
 def main():
     """Main startup function"""
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
     print("=" * 50)
     print("Staff Management System")
     print("=" * 50)
@@ -65,6 +71,10 @@ def main():
             create_sample_data()
         print("Database created successfully!")
     
+    # Bring existing databases up to the current schema
+    with app.app_context():
+        migrations.upgrade()
+    
     print("\nStarting the application...")
     print("Access the system at: http://localhost:5000")
     print("Default admin login: admin / admin123")
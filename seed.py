@@ -0,0 +1,202 @@
+"""
+Synthetic school data for development and benchmarks
+
+Generates staff, teachers and students with timetables, a period of daily
+attendance (late arrivals classified against the generated timetable,
+plus some absences), monthly Performance summaries, salaries, notifications
+and procurement requests. Everything is written with bulk inserts in
+batches; a year for about 2,000 users (half a million attendance rows)
+takes around half a minute on SQLite.
+"""
+
+import time
+import random
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Attendance, Timetable, Salary, Notification, Procurement
+from lateness import WEEKDAYS, late_threshold
+from performance import months_between, rebuild_month
+from payroll import run_payroll
+
+SeedResult = namedtuple('SeedResult', ['counts', 'seconds'])
+
+SUBJECTS = ['Mathematics', 'English', 'Physics', 'Chemistry', 'Biology', 'History', 'Geography',
+            'Computer Science', 'French', 'Art', 'Music', 'Physical Education']
+FIRST_NAMES = ['Amina', 'Brian', 'Chen', 'Diana', 'Emeka', 'Fatima', 'George', 'Hannah', 'Ibrahim', 'Joy',
+               'Kevin', 'Linda', 'Moses', 'Nadia', 'Omar', 'Priya', 'Quentin', 'Rose', 'Samuel', 'Tendai']
+LAST_NAMES = ['Achieng', 'Banda', 'Carter', 'Dlamini', 'Evans', 'Fofana', 'Garcia', 'Hassan', 'Ito', 'Johnson',
+              'Kamau', 'Lee', 'Mensah', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Smith', 'Tanaka', 'Wanjiru']
+ITEMS = ['Exercise books', 'Whiteboard markers', 'Projector', 'Lab glassware', 'Football kit', 'Printer toner',
+         'Textbooks', 'Desks', 'Chairs', 'Microscope', 'Laptop', 'Cleaning supplies']
+STAFF = [('headteacher', 1), ('deputy', 2), ('bursar', 2)]
+LESSON_STARTS = [(7, 30), (8, 0), (8, 40), (9, 20), (10, 30), (11, 10), (12, 0), (14, 0)]
+
+
+def _insert(model, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(model), rows[start:start + batch_size])
+
+
+def seed_school(teachers=200, students=2000, days=365, end_date=None, notifications_per_user=5,
+                procurements=300, password='password123', seed=42, batch_size=5000, verbose=False):
+    """Populate an empty database with a synthetic school"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    end_date = end_date or date.today()
+    first_day = end_date - timedelta(days=days - 1)
+    created_at = datetime.combine(first_day, datetime.min.time())
+    password_hash = generate_password_hash(password)
+    counts = {}
+
+    def log(message):
+        if verbose:
+            print(f'{time.perf_counter() - started:7.1f}s  {message}')
+
+    # Users
+    users = []
+    roles = STAFF + [('teacher', teachers), ('student', students)]
+    for role, count in roles:
+        for number in range(1, count + 1):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            username = f'{role}{number:04d}'
+            users.append({
+                'username': username,
+                'email': f'{username}@school.example',
+                'password_hash': password_hash,
+                'role': role,
+                'full_name': name,
+                'phone_number': f'+2547{rng.randrange(10 ** 8):08d}',
+                'base_salary': None if role == 'student' else round(rng.uniform(40000, 90000), -2),
+                'created_at': created_at,
+                'is_active': True
+            })
+    _insert(User, users, batch_size)
+    user_roles = {user_id: role for user_id, role in db.session.query(User.id, User.role)}
+    teacher_ids = [user_id for user_id, role in user_roles.items() if role == 'teacher']
+    counts['users'] = len(users)
+    log(f'{len(users)} users')
+
+    # Timetable: two to five lessons per teacher per weekday
+    timetable = []
+    first_lessons = {}
+    for teacher_id in teacher_ids:
+        subject = rng.choice(SUBJECTS)
+        for day in WEEKDAYS[:5]:
+            starts = sorted(rng.sample(LESSON_STARTS, rng.randint(2, 5)))
+            first_lessons[(teacher_id, day)] = datetime.min.replace(hour=starts[0][0], minute=starts[0][1]).time()
+            for hour, minute in starts:
+                start = datetime.min.replace(hour=hour, minute=minute)
+                timetable.append({
+                    'teacher_id': teacher_id,
+                    'subject': subject,
+                    'day_of_week': day,
+                    'start_time': start.time(),
+                    'end_time': (start + timedelta(minutes=40)).time(),
+                    'room': f'Room {rng.randint(1, 40):03d}',
+                    'class_name': f'Class {rng.randint(7, 12)}{rng.choice("ABCD")}'
+                })
+    _insert(Timetable, timetable, batch_size)
+    counts['timetable'] = len(timetable)
+    log(f'{len(timetable)} timetable rows')
+
+    # Attendance on school days: a few absences, arrivals around the first lesson
+    threshold = late_threshold()
+    attendance = []
+    total_attendance = 0
+    day = first_day
+    while day <= end_date:
+        weekday = WEEKDAYS[day.weekday()]
+        if day.weekday() < 5:
+            for user_id, role in user_roles.items():
+                if rng.random() < 0.04:
+                    attendance.append({'user_id': user_id, 'date': day, 'status': 'absent', 'created_at': created_at})
+                    continue
+                first_lesson = first_lessons.get((user_id, weekday))
+                anchor = datetime.combine(day, first_lesson or datetime.min.replace(hour=8).time())
+                time_in = anchor + timedelta(minutes=rng.gauss(-20, 15))
+                late = first_lesson is not None and time_in > anchor + threshold
+                attendance.append({
+                    'user_id': user_id,
+                    'date': day,
+                    'time_in': time_in,
+                    'time_out': datetime.combine(day, datetime.min.time()) + timedelta(
+                        hours=15, minutes=rng.randint(30, 120)),
+                    'method': rng.choice(['face', 'fingerprint', 'manual']),
+                    'status': 'late' if late else 'present',
+                    'created_at': time_in
+                })
+        if len(attendance) >= batch_size or day == end_date:
+            _insert(Attendance, attendance, batch_size)
+            total_attendance += len(attendance)
+            attendance = []
+        day += timedelta(days=1)
+    counts['attendance'] = total_attendance
+    log(f'{total_attendance} attendance rows')
+
+    months = list(months_between(first_day, end_date))
+    for month, year in months:
+        rebuild_month(month, year, commit=False)
+    log(f'{len(months)} months of performance')
+
+    # Salaries for every month; all but the current one have been paid
+    salaries = 0
+    for month, year in months:
+        salaries += len(run_payroll(month, year).rows)
+        if (year, month) < (end_date.year, end_date.month):
+            db.session.execute(
+                db.update(Salary).where(Salary.month == month, Salary.year == year).values(
+                    paid=True, paid_date=datetime(year, month, 28, 12, 0)
+                ),
+                execution_options={'synchronize_session': False}
+            )
+    counts['salaries'] = salaries
+    log(f'{salaries} salaries')
+
+    notifications = []
+    span = (end_date - first_day).days + 1
+    for user_id in user_roles:
+        for _ in range(notifications_per_user):
+            sent_on = datetime.combine(first_day, datetime.min.time()) + timedelta(
+                days=rng.randrange(span), hours=rng.randint(7, 18))
+            notification_type = rng.choice(['system', 'system', 'email', 'sms'])
+            notifications.append({
+                'user_id': user_id,
+                'title': 'School notice',
+                'message': f'Reminder {rng.randrange(10 ** 6)}: please check the notice board.',
+                'type': notification_type,
+                'sent': notification_type == 'system' or sent_on.date() < end_date,
+                'sent_at': sent_on if notification_type != 'system' else None,
+                'created_at': sent_on
+            })
+    _insert(Notification, notifications, batch_size)
+    counts['notifications'] = len(notifications)
+    log(f'{len(notifications)} notifications')
+
+    requesters = [user_id for user_id, role in user_roles.items() if role != 'student']
+    approvers = [user_id for user_id, role in user_roles.items() if role in ('headteacher', 'deputy')]
+    procurement_rows = []
+    for _ in range(procurements):
+        quantity = rng.randint(1, 200)
+        unit_price = round(rng.uniform(50, 5000), 2)
+        status = rng.choice(['pending', 'approved', 'rejected', 'completed'])
+        procurement_rows.append({
+            'item_name': rng.choice(ITEMS),
+            'description': 'Generated request',
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_amount': quantity * unit_price,
+            'supplier': f'{rng.choice(LAST_NAMES)} Supplies',
+            'requested_by': rng.choice(requesters),
+            'approved_by': rng.choice(approvers) if status != 'pending' else None,
+            'status': status,
+            'created_at': datetime.combine(first_day, datetime.min.time()) + timedelta(days=rng.randrange(span))
+        })
+    _insert(Procurement, procurement_rows, batch_size)
+    counts['procurements'] = len(procurement_rows)
+
+    db.session.commit()
+    log('committed')
+    return SeedResult(counts, time.perf_counter() - started)
@@ -0,0 +1,167 @@
+"""
+Opt-in SQLite production profile
+
+With SQLITE_PROFILE=production and a sqlite:// DATABASE_URL, every
+connection is switched to WAL journaling with synchronous=NORMAL, a busy
+timeout and larger page/mmap caches, and attendance writes are funnelled
+through a single writer thread. The writer drains whatever check-ins have
+queued up while the previous commit was running and commits them as one
+transaction (each job in its own savepoint), so a morning burst costs a
+handful of fsyncs instead of one per request and never contends for the
+write lock with itself.
+
+The writer only serializes writes within one process; run a single web
+process (with threads) per SQLite database when using this profile.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import event
+
+from models import db
+
+
+def enabled(app):
+    return (app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite')
+            and os.getenv('SQLITE_PROFILE', '').lower() == 'production')
+
+
+def configure_engine(engine):
+    """Apply the production pragmas to every new connection of engine"""
+    busy_timeout = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    cache_size_kb = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+    mmap_size = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself so savepoints and BEGIN IMMEDIATE work
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute(f'PRAGMA cache_size=-{cache_size_kb}')
+        cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        # The writer takes the write lock up front: a deferred transaction that
+        # reads first cannot wait for the lock once another commit lands.
+        if connection.get_execution_options().get('sqlite_immediate'):
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        else:
+            connection.exec_driver_sql('BEGIN')
+
+
+class WriteQueue:
+    """Single writer thread that group-commits queued write jobs"""
+
+    def __init__(self, max_batch=None, timeout=None):
+        self.app = None
+        self.max_batch = int(max_batch or os.getenv('WRITE_QUEUE_MAX_BATCH', 200))
+        self.timeout = float(timeout or os.getenv('WRITE_QUEUE_TIMEOUT', 30))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def enabled(self):
+        return self.app is not None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def submit(self, func):
+        """Queue func to run in the writer's transaction; returns a Future
+
+        func runs with the writer's db.session, must not commit, and should
+        return plain values (ORM objects are expired once the batch commits).
+        """
+        self.start()
+        future = Future()
+        self._queue.put((func, future))
+        return future
+
+    def run(self, func):
+        """Run func in the writer and wait for the batch it joined to commit"""
+        return self.submit(func).result(self.timeout)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                batch = [job]
+                stopping = False
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                try:
+                    self._commit(batch)
+                finally:
+                    db.session.remove()
+                if stopping:
+                    return
+
+    def _commit(self, batch):
+        db.session.connection(execution_options={'sqlite_immediate': True})
+        results = []
+        for func, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with db.session.begin_nested():
+                    result = func()
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            results.append((future, result))
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for future, result in results:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs += len(results)
+        for future, result in results:
+            future.set_result(result)
+
+
+write_queue = WriteQueue()
+
+
+def init_app(app):
+    if not enabled(app):
+        return
+    with app.app_context():
+        configure_engine(db.engine)
+    write_queue.init_app(app)
@@ -0,0 +1,193 @@
+"""
+Dashboard statistics cache with write-driven invalidation
+
+Cached values are keyed by the version of every table they depend on.
+Committed ORM writes (including bulk inserts/updates) bump the versions
+of the tables they touched, so a stale value is simply never looked up
+again; the TTL only bounds how long unrelated entries linger.
+
+The default backend lives in process memory and holds at most
+max_entries values, evicting the least recently used, so entries for
+superseded versions age out. Set STATS_CACHE_URL to a redis:// URL to
+share values and versions between worker processes.
+"""
+
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class MemoryBackend:
+    max_entries = 1024
+    shared = False
+
+    def __init__(self, max_entries=None):
+        self._data = OrderedDict()
+        self._versions = {}
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            # Entries for superseded versions are never read again, so they are the first to go
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def versions(self, keys):
+        with self._lock:
+            return [self._versions.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, url, prefix='staff:stats:'):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self._prefix + key, pickle.dumps(value), ex=int(ttl) if ttl else None)
+
+    def versions(self, keys):
+        values = self._client.mget([self._prefix + key for key in keys])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def incr(self, key):
+        return self._client.incr(self._prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+
+def create_backend(url=None):
+    url = url if url is not None else os.getenv('STATS_CACHE_URL', '')
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+class StatsCache:
+    def __init__(self, backend=None, ttl=None):
+        self._backend = backend
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else float(os.getenv('STATS_CACHE_TTL', 60))
+
+    def versions(self, tables):
+        return self.backend.versions([f'version:{table}' for table in tables])
+
+    def bump(self, *tables):
+        """Invalidate everything that depends on the given tables"""
+        for table in tables:
+            self.backend.incr(f'version:{table}')
+
+    def get_or_compute(self, key, depends_on, compute, ttl=None):
+        """Cached value of compute() for key at the current table versions"""
+        versioned_key = f'{key}@' + '.'.join(
+            f'{table}{version}' for table, version in zip(depends_on, self.versions(depends_on))
+        )
+        value = self.backend.get(versioned_key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.backend.set(versioned_key, value, ttl if ttl is not None else self.ttl)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+        }
+
+
+stats_cache = StatsCache()
+
+
+# Invalidation hooks: remember the tables written in a transaction and
+# bump their versions once it commits.
+def _written_tables(session):
+    return session.info.setdefault('stats_cache_tables', set())
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_flushed(session, flush_context, instances):
+    tables = _written_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _written_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions(session):
+    tables = session.info.pop('stats_cache_tables', None)
+    if tables:
+        stats_cache.bump(*sorted(tables))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_versions(session):
+    session.info.pop('stats_cache_tables', None)
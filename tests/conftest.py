@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+from itertools import count
+
+import pytest
+
+# The app reads its configuration at import time
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'test.db')}"
+os.environ['NOTIFICATION_WORKER'] = 'False'
+os.environ['SECRET_KEY'] = 'test-secret-key-long-enough-for-hs256'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, db  # noqa: E402
+from seed import seed_school  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.create_all()
+        seed_school(teachers=5, students=20, days=30, notifications_per_user=1, procurements=5)
+    yield flask_app
+    _directory.cleanup()
+
+
+@pytest.fixture
+def login(app):
+    """Test client logged in as a seeded user (every password is password123)"""
+    def login(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': 'password123'})
+        assert response.status_code == 302
+        return client
+    return login
+
+
+_user_numbers = count(1)
+
+
+@pytest.fixture
+def new_user(app):
+    """Create a user without attendance or timetable and return its id"""
+    from models import User
+
+    def new_user(role='teacher', **fields):
+        number = next(_user_numbers)
+        user = User(username=f'test{role}{number}', email=f'test{role}{number}@school.example',
+                    password_hash='-', role=role, full_name=f'Test {role.title()} {number}', **fields)
+        with app.app_context():
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return new_user
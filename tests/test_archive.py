@@ -0,0 +1,101 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import inspect
+
+from app import db
+from archive import (ArchiveError, academic_year, archive_table, archive_year, attendance_source,
+                     drop_archives, is_archived, restore_year)
+from attendance import AttendanceError, mark_absent, record_check_in
+from models import Attendance, AttendanceArchive, Performance
+from reports import attendance_query
+
+ARCHIVED = [date(2003, 9, 1), date(2004, 2, 2), date(2004, 8, 31)]
+LIVE = date(2004, 9, 1)
+
+
+def test_drop_archives_removes_tables_and_catalog(app):
+    with app.app_context():
+        table = archive_table(2000)
+        table.create(db.engine, checkfirst=True)
+        db.session.add(AttendanceArchive(academic_year=2000, table_name=table.name,
+                                         first_day=date(2000, 9, 1), last_day=date(2001, 8, 31), rows=0))
+        db.session.commit()
+
+        assert drop_archives() == [2000]
+        assert not inspect(db.engine).has_table(table.name)
+        assert AttendanceArchive.query.count() == 0
+
+
+@pytest.fixture
+def old_year(app, new_user):
+    """Attendance of a new teacher in academic year 2003/04 and on the first day of 2004/05"""
+    user_id = new_user()
+    with app.app_context():
+        for day in ARCHIVED + [LIVE]:
+            db.session.add(Attendance(user_id=user_id, date=day, status='present',
+                                      time_in=datetime.combine(day, datetime.min.time())))
+        db.session.commit()
+    yield user_id
+    with app.app_context():
+        if is_archived(ARCHIVED[0]):
+            restore_year(2003)
+        Attendance.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+
+def source_rows(start_date, end_date, user_id):
+    source = attendance_source(start_date, end_date)
+    return [day for (day,) in db.session.query(source.date).filter(
+        source.user_id == user_id, source.date.between(start_date, end_date)).order_by(source.date)]
+
+
+def test_archive_and_restore_keep_reads_whole(app, old_year):
+    with app.app_context():
+        assert academic_year(ARCHIVED[-1]) == 2003 and academic_year(LIVE) == 2004
+        before = source_rows(ARCHIVED[0], LIVE, old_year)
+
+        result = archive_year(2003)
+        assert result.rows >= len(ARCHIVED) and result.months == 12
+        assert inspect(db.engine).has_table(result.table_name)
+        assert all(is_archived(day) for day in ARCHIVED) and not is_archived(LIVE)
+
+        # Live table keeps the next year only, reads across the boundary see both
+        assert [row.date for row in Attendance.query.filter_by(user_id=old_year)] == [LIVE]
+        assert source_rows(ARCHIVED[0], LIVE, old_year) == before == ARCHIVED + [LIVE]
+        assert source_rows(ARCHIVED[1], ARCHIVED[1], old_year) == [ARCHIVED[1]]
+        assert attendance_source(LIVE, LIVE) is Attendance
+        assert [row.date for row in attendance_query(ARCHIVED[0], ARCHIVED[-1])
+                if row.user_id == old_year] == ARCHIVED
+
+        # The year's monthly scores stay online
+        months = {(row.month, row.year) for row in Performance.query.filter_by(teacher_id=old_year)}
+        assert {(day.month, day.year) for day in ARCHIVED} <= months
+
+        result = restore_year(2003)
+        assert result.rows >= len(ARCHIVED)
+        assert not inspect(db.engine).has_table(result.table_name)
+        assert db.session.get(AttendanceArchive, 2003) is None
+        assert sorted(row.date for row in Attendance.query.filter_by(user_id=old_year)) == ARCHIVED + [LIVE]
+
+
+def test_archived_year_is_read_only(app, old_year, new_user):
+    other = new_user()
+    with app.app_context():
+        archive_year(2003)
+        with pytest.raises(AttendanceError, match='archived'):
+            mark_absent(ARCHIVED[1])
+        with pytest.raises(AttendanceError, match='archived'):
+            record_check_in(other, when=datetime.combine(ARCHIVED[1], datetime.min.time()))
+        assert source_rows(ARCHIVED[0], ARCHIVED[-1], other) == []
+
+
+def test_open_or_repeated_years_are_refused(app, old_year):
+    with app.app_context():
+        with pytest.raises(ArchiveError, match='not closed'):
+            archive_year(academic_year(date.today()))
+        with pytest.raises(ArchiveError, match='not archived'):
+            restore_year(2003)
+        archive_year(2003)
+        with pytest.raises(ArchiveError, match='already archived'):
+            archive_year(2003)
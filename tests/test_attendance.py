@@ -0,0 +1,105 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from app import db
+from attendance import mark_absent, record_check_in, record_check_out
+from models import Attendance, Performance, User
+from performance import rebuild_month
+
+
+def get_today(client, etag=None):
+    headers = {'If-None-Match': f'"{etag}"'} if etag else {}
+    return client.get('/api/attendance/today', headers=headers)
+
+
+def test_unchanged_feed_is_not_modified(login):
+    client = login('teacher0001')
+    first = get_today(client)
+    assert first.status_code == 200
+    etag = first.get_etag()[0]
+
+    again = get_today(client, etag)
+    assert again.status_code == 304
+    assert again.get_etag()[0] == etag
+    assert again.get_data() == b''
+
+
+def test_check_in_and_check_out_change_the_feed(app, login, new_user):
+    client = login('teacher0001')
+    etag = get_today(client).get_etag()[0]
+    user_id = new_user()
+    with app.app_context():
+        name = db.session.get(User, user_id).full_name
+        record_check_in(user_id, when=datetime.now())
+
+    checked_in = get_today(client, etag)
+    assert checked_in.status_code == 200
+    [row] = [row for row in checked_in.get_json() if row['user_name'] == name]
+    assert row['time_in'] and row['time_out'] is None
+    etag = checked_in.get_etag()[0]
+
+    with app.app_context():
+        record_check_out(user_id, when=datetime.now())
+    checked_out = get_today(client, etag)
+    assert checked_out.status_code == 200
+    [row] = [row for row in checked_out.get_json() if row['user_name'] == name]
+    assert row['time_out']
+    assert get_today(client, checked_out.get_etag()[0]).status_code == 304
+
+
+@pytest.fixture
+def future_day(app):
+    """A day no user has attendance for yet, cleaned up afterwards"""
+    day = date.today() + timedelta(days=3)
+    yield day
+    with app.app_context():
+        Attendance.query.filter_by(date=day).delete()
+        db.session.commit()
+        rebuild_month(day.month, day.year)
+
+
+def test_mark_absent_fills_in_every_active_user_once(app, new_user, future_day):
+    present = new_user()
+    inactive = new_user(is_active=False)
+    with app.app_context():
+        record_check_in(present, when=datetime.combine(future_day, time(7, 30)))
+        expected = {user_id for (user_id,) in db.session.query(User.id).filter(User.is_active.isnot(False))}
+        expected.discard(present)
+
+        assert mark_absent(future_day) == len(expected)
+        absent = {user_id for (user_id,) in db.session.query(Attendance.user_id).filter_by(
+            date=future_day, status='absent')}
+        assert absent == expected
+        assert inactive not in absent
+        assert Attendance.query.filter_by(user_id=present, date=future_day).one().status != 'absent'
+
+        assert mark_absent(future_day) == 0
+        assert Attendance.query.filter_by(date=future_day).count() == len(expected) + 1
+
+
+def test_mark_absent_updates_performance_and_allows_a_late_check_in(app, new_user, future_day):
+    user_id = new_user()
+    with app.app_context():
+        mark_absent(future_day)
+        performance = Performance.query.filter_by(
+            teacher_id=user_id, month=future_day.month, year=future_day.year).one()
+        assert (performance.days, performance.present_days) == (1, 0)
+
+        attendance = record_check_in(user_id, when=datetime.combine(future_day, time(10)))
+        assert attendance.time_in and attendance.status != 'absent'
+        assert Attendance.query.filter_by(user_id=user_id, date=future_day).count() == 1
+        db.session.refresh(performance)
+        assert (performance.days, performance.present_days) == (1, 1)
+
+
+def test_mark_absent_skips_users_created_after_the_day(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        day = date(2002, 5, 6)
+        try:
+            mark_absent(day)
+            assert Attendance.query.filter_by(user_id=user_id, date=day).count() == 0
+        finally:
+            Attendance.query.filter_by(date=day).delete()
+            db.session.commit()
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from app import db
+from models import Notification, User
+from notifications import NotificationDispatcher
+
+
+class FakeTransport:
+    """Stands in for SMTPSession and SMSClient; fails for addresses in failing"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send(self, to, *message):
+        if to in self.failing:
+            raise OSError('connection refused')
+        self.sent.append(to)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def queued(app, new_user):
+    """Queue an email for a new user; returns (notification id, address)"""
+    def queued():
+        user_id = new_user()
+        with app.app_context():
+            email = db.session.get(User, user_id).email
+            notification = Notification(user_id=user_id, title='Reminder', message='Staff meeting', type='email')
+            db.session.add(notification)
+            db.session.commit()
+            return notification.id, email
+    return queued
+
+
+def dispatcher_with(transport, **options):
+    dispatcher = NotificationDispatcher(**options)
+    dispatcher.smtp = dispatcher.sms = transport
+    return dispatcher
+
+
+def notification(app, notification_id):
+    with app.app_context():
+        row = db.session.get(Notification, notification_id)
+        return row.sent, row.attempts, row.failed_at, row.error
+
+
+def test_delivery_gives_up_after_max_attempts(app, queued, caplog):
+    notification_id, email = queued()
+    transport = FakeTransport(failing=[email])
+    dispatcher = dispatcher_with(transport, max_attempts=2, backoff=0)
+    with app.app_context():
+        dispatcher.drain()
+        sent, attempts, failed_at, error = notification(app, notification_id)
+        assert (sent, attempts, failed_at, error) == (False, 1, None, 'connection refused')
+
+        dispatcher.drain()
+        sent, attempts, failed_at, error = notification(app, notification_id)
+        assert (sent, attempts) == (False, 2)
+        assert failed_at is not None
+        assert f'Giving up on email notification {notification_id} after 2 attempts' in caplog.text
+
+        # A fresh dispatcher, as after a restart, no longer picks the row up
+        transport.failing.clear()
+        dispatcher_with(transport, max_attempts=2, backoff=0).drain()
+        assert email not in transport.sent
+        assert notification(app, notification_id)[0] is False
+
+
+def test_dispatcher_started_with_the_app_delivers_waiting_rows(app, queued, monkeypatch):
+    notification_id, email = queued()
+    monkeypatch.setenv('NOTIFICATION_WORKER', 'True')
+    transport = FakeTransport()
+    dispatcher = dispatcher_with(transport, poll_interval=60)
+    dispatcher.init_app(app)
+    try:
+        deadline = time.monotonic() + 5
+        while notification(app, notification_id)[0] is False and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        dispatcher.stop()
+    assert notification(app, notification_id)[0] is True
+    assert email in transport.sent
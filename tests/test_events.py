@@ -0,0 +1,19 @@
+from events import EventBroker, stream
+
+
+def test_stream_unsubscribes_when_client_leaves_before_first_chunk():
+    broker = EventBroker()
+    response = stream(broker, heartbeat=0.01)
+    response.close()
+    assert broker.subscribers == 0
+
+
+def test_stream_subscribes_while_streaming():
+    broker = EventBroker()
+    response = stream(broker, heartbeat=0.01)
+    assert next(response) == 'retry: 3000\n\n'
+    assert broker.subscribers == 1
+    broker.publish('check_in', {'user_id': 1})
+    assert next(response).startswith('id: 1\n')
+    response.close()
+    assert broker.subscribers == 0
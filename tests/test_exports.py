@@ -0,0 +1,23 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from exports import MIMETYPES, export_formats
+
+
+@pytest.mark.parametrize('report', ['attendance', 'performance', 'salary'])
+@pytest.mark.parametrize('fmt', export_formats())
+def test_export_report(login, report, fmt):
+    response = login('headteacher0001').get(f'/reports/{report}/export/{fmt}')
+
+    assert response.status_code == 200
+    assert response.mimetype == MIMETYPES[fmt]
+    body = response.get_data()
+    if fmt == 'xlsx':
+        workbook = load_workbook(io.BytesIO(body), read_only=True)
+        assert len(workbook.sheetnames) == 1
+    elif fmt == 'pdf':
+        assert body.startswith(b'%PDF')
+    else:
+        assert body.decode().splitlines()[0].startswith(('Date,', 'Name,'))
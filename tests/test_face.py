@@ -0,0 +1,70 @@
+import io
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import face_pipeline
+from app import db
+from face_index import ENCODING_DIM, serialize_encoding
+from face_pipeline import EncodingResult
+from models import User
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Make the face pipeline answer every upload with the given result (None: never finishes)"""
+    submitted = []
+
+    def use(result):
+        def submit(key, image, model=None):
+            submitted.append(key)
+            future = Future()
+            if result is not None:
+                future.set_result(result)
+            return future
+        monkeypatch.setattr(face_pipeline, 'submit', submit)
+        return submitted
+    return use
+
+
+def upload():
+    return {'image': (io.BytesIO(b'not really a jpeg'), 'face.jpg')}
+
+
+def test_identify_encodes_in_the_pipeline(app, login, encoded):
+    encoding = np.linspace(-0.2, 0.2, ENCODING_DIM, dtype=np.float32)
+    with app.app_context():
+        user = User.query.filter_by(username='teacher0001').one()
+        user.face_encoding = serialize_encoding(encoding)
+        db.session.commit()
+        user_id = user.id
+
+    submitted = encoded(EncodingResult(user_id, serialize_encoding(encoding), None))
+    response = login('headteacher0001').post('/api/face/identify', data=upload())
+    assert response.status_code == 200
+    assert response.get_json()['matches'][0]['user_id'] == user_id
+    assert len(submitted) == 1
+
+
+def test_identify_reports_encoding_errors(login, encoded):
+    encoded(EncodingResult(1, None, 'no face detected'))
+    response = login('headteacher0001').post('/api/face/identify', data=upload())
+    assert response.status_code == 422
+    assert response.get_json() == {'error': 'no face detected'}
+
+
+def test_identify_times_out(login, encoded, monkeypatch):
+    monkeypatch.setenv('FACE_ENCODING_TIMEOUT', '0')
+    encoded(None)
+    response = login('headteacher0001').post('/api/face/identify', data=upload())
+    assert response.status_code == 503
+
+
+def test_verify_reports_encoding_errors(login, encoded):
+    encoded(EncodingResult(1, None, 'no face detected'))
+    client = login('headteacher0001')
+    response = client.post('/face-recognition/verify', data=upload())
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert ('error', 'Face verification failed: no face detected') in session['_flashes']
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pytest
+
+from app import db
+from face_index import ENCODING_DIM, FaceIndex, face_index, serialize_encoding
+from models import User
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(0, 0.1, ENCODING_DIM).astype(np.float32)
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """A loaded, empty index that never reloads from the database"""
+    monkeypatch.setenv('FACE_INDEX_RELOAD_SECONDS', '0')
+    index = FaceIndex(tolerance=0.6, initial_capacity=2)
+    index.loaded = True
+    return index
+
+
+def test_empty_index_matches_nothing(index):
+    assert len(index) == 0
+    assert [lookup.matches for lookup in index.identify_many([encoding(1), encoding(2)])] == [[], []]
+    assert index.identify(encoding(1)).matches == []
+    assert index.remove(1) is False
+
+
+def test_identify_many_returns_nearest_within_tolerance(index):
+    for user_id in range(1, 6):
+        index.upsert(user_id, encoding(user_id))
+    assert len(index) == 5  # grown past the initial capacity
+
+    lookups = index.identify_many([encoding(3) + 0.001, encoding(99)], k=2)
+    assert [match.user_id for match in lookups[0].matches] == [3]
+    assert lookups[0].matches[0].distance < 0.05
+    assert lookups[1].matches == []
+
+    everyone = index.identify(encoding(3), k=10, tolerance=10).matches
+    assert [match.user_id for match in everyone][0] == 3
+    assert len(everyone) == 5
+    assert [match.distance for match in everyone] == sorted(match.distance for match in everyone)
+
+
+def test_upsert_replaces_an_encoding(index):
+    index.upsert(1, encoding(1))
+    index.upsert(1, serialize_encoding(encoding(2)))
+    assert len(index) == 1
+    assert index.identify(encoding(1)).matches == []
+    assert index.identify(encoding(2)).matches[0].user_id == 1
+
+
+def test_remove_moves_the_last_row_into_the_hole(index):
+    for user_id in (1, 2, 3):
+        index.upsert(user_id, encoding(user_id))
+    assert index.remove(1) is True
+    assert 1 not in index and len(index) == 2
+    assert index.identify(encoding(1)).matches == []
+    assert index.identify(encoding(3)).matches[0].user_id == 3
+    assert index.identify(encoding(2)).matches[0].user_id == 2
+
+
+def test_upsert_rejects_wrong_dimensions(index):
+    with pytest.raises(ValueError):
+        index.upsert(1, [0.1] * 3)
+
+
+def test_index_reloads_writes_from_other_processes(app, new_user, monkeypatch):
+    monkeypatch.setenv('FACE_INDEX_RELOAD_SECONDS', '60')
+    probe = encoding(12345)
+    user_id = new_user()
+    with app.app_context():
+        face_index.load()
+        # A bulk UPDATE skips this process's ORM hooks, like a write from another process
+        db.session.execute(db.update(User).where(User.id == user_id).values(face_encoding=serialize_encoding(probe)))
+        db.session.commit()
+
+        assert user_id not in [match.user_id for match in face_index.identify(probe, k=5).matches]
+        face_index.loaded_at = time.monotonic() - 61
+        assert face_index.identify(probe).matches[0].user_id == user_id
@@ -0,0 +1,80 @@
+import json
+import sys
+import types
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import face_pipeline
+from app import db
+from face_index import ENCODING_DIM, decode_encoding, face_index
+from models import User
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(0, 0.1, ENCODING_DIM)
+
+
+@pytest.fixture
+def fake_face_recognition(monkeypatch):
+    """face_recognition stand-in: a photo is JSON [[box, seed], ...], one entry per face"""
+    module = types.ModuleType('face_recognition')
+    module.load_image_file = lambda image: json.loads(image.read())
+    module.face_locations = lambda image, model=None: [tuple(box) for box, seed in image]
+    module.face_encodings = lambda image, known_face_locations: [
+        encoding(seed) for box, seed in image if tuple(box) in known_face_locations]
+    monkeypatch.setitem(sys.modules, 'face_recognition', module)
+    # Threads share the stand-in; worker processes would not
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(face_pipeline, 'get_pool', lambda: pool)
+    yield
+    pool.shutdown()
+
+
+def face(seed, size=10):
+    return [[0, size, size, 0], seed]
+
+
+def test_bulk_enroll_reports_every_photo(app, new_user, fake_face_recognition, tmp_path):
+    with app.app_context():
+        usernames = {}
+        for key, active in [('one', True), ('group', True), ('blank', True), ('corrupt', True), ('inactive', False)]:
+            user_id = new_user(is_active=active)
+            usernames[key] = (db.session.get(User, user_id).username, user_id)
+        face_index.load()
+
+    photos = tmp_path / 'photos.zip'
+    with zipfile.ZipFile(photos, 'w') as archive:
+        archive.writestr(f'{usernames["one"][0]}.jpg', json.dumps([face(1)]))
+        # The largest face in a group photo is enrolled
+        archive.writestr(f'{usernames["group"][0]}.JPG', json.dumps([face(2, size=5), face(3, size=50)]))
+        archive.writestr(f'{usernames["blank"][0]}.png', json.dumps([]))
+        archive.writestr(f'{usernames["inactive"][0]}.jpg', json.dumps([face(4)]))
+        archive.writestr('nobody.jpg', json.dumps([face(5)]))
+        archive.writestr(f'broken/{usernames["corrupt"][0]}.jpeg', 'not a photo')
+        archive.writestr('notes.txt', 'ignored')
+        archive.writestr('.hidden.jpg', 'ignored')
+
+    progress = []
+    with app.app_context():
+        report = face_pipeline.bulk_enroll(str(photos), batch_size=2, progress=lambda *done: progress.append(done))
+        stored = {user_id: decode_encoding(encoding) for user_id, encoding in db.session.query(
+            User.id, User.face_encoding).filter(User.id.in_([user_id for _, user_id in usernames.values()]))
+            if encoding is not None}
+
+    assert report.total == 6
+    assert report.enrolled == 3
+    assert sorted(report.failures) == sorted([
+        (usernames['blank'][0], 'no face detected'),
+        ('nobody', 'unknown username'),
+        (usernames['corrupt'][0], 'Expecting value: line 1 column 1 (char 0)'),
+    ])
+    assert progress[-1] == (6, 6)
+
+    one, group, inactive = usernames['one'][1], usernames['group'][1], usernames['inactive'][1]
+    assert set(stored) == {one, group, inactive}
+    np.testing.assert_allclose(stored[group], encoding(3), rtol=1e-6)
+    assert one in face_index and group in face_index
+    assert inactive not in face_index
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import device_token_secret
+from ingest import issue_device_token
+from models import Attendance
+
+YESTERDAY = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def post(app):
+    token = issue_device_token('kiosk-test', device_token_secret())
+
+    def post(body, token=token):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        if isinstance(body, str):
+            return app.test_client().post('/api/attendance/ingest', data=body, headers=headers,
+                                          content_type='application/json')
+        return app.test_client().post('/api/attendance/ingest', json=body, headers=headers)
+    return post
+
+
+def event(event_id, user_id, type, hour):
+    return {'event_id': event_id, 'user_id': user_id, 'type': type,
+            'timestamp': (YESTERDAY + timedelta(hours=hour)).isoformat()}
+
+
+def statuses(response):
+    return [result['status'] for result in response.get_json()['results']]
+
+
+def attendance_rows(app, user_id):
+    with app.app_context():
+        return [(row.time_in, row.time_out) for row in Attendance.query.filter_by(user_id=user_id)]
+
+
+def test_resent_batch_is_applied_once(app, post, new_user):
+    user_id = new_user()
+    batch = {'events': [event(f'in-{user_id}', user_id, 'check_in', 8),
+                        event(f'out-{user_id}', user_id, 'check_out', 16)]}
+
+    assert statuses(post(batch)) == ['applied', 'applied']
+    resent = post(batch)
+    assert resent.status_code == 200
+    assert statuses(resent) == ['duplicate', 'duplicate']
+    assert attendance_rows(app, user_id) == [(YESTERDAY + timedelta(hours=8), YESTERDAY + timedelta(hours=16))]
+
+
+def test_buffered_events_apply_in_time_order(app, post, new_user):
+    user_id = new_user()
+    batch = {'events': [event(f'out-{user_id}', user_id, 'check_out', 15),
+                        event(f'in-{user_id}', user_id, 'check_in', 9)]}
+
+    assert statuses(post(batch)) == ['applied', 'applied']
+    assert attendance_rows(app, user_id) == [(YESTERDAY + timedelta(hours=9), YESTERDAY + timedelta(hours=15))]
+
+
+def test_check_out_without_check_in_is_rejected(app, post, new_user):
+    user_id = new_user()
+    assert statuses(post({'events': [event(f'out-{user_id}', user_id, 'check_out', 15)]})) == ['rejected']
+    assert attendance_rows(app, user_id) == []
+
+
+def test_unknown_user_is_rejected(post):
+    response = post({'events': [event('unknown-user', 10 ** 9, 'check_in', 8)]})
+    assert response.status_code == 200
+    assert response.get_json()['results'][0] == {
+        'event_id': 'unknown-user', 'status': 'rejected', 'error': 'Unknown or inactive user'}
+
+
+def test_invalid_events_are_reported_per_event(post, new_user):
+    user_id = new_user()
+    response = post({'events': ['not an object', {'event_id': 'bad-type', 'user_id': user_id, 'type': 'lunch'},
+                                event(f'ok-{user_id}', user_id, 'check_in', 8)]})
+    assert statuses(response) == ['invalid', 'invalid', 'applied']
+
+
+@pytest.mark.parametrize('body', ['not json', '[{"events": []}]', '42', '{"events": "all"}', '{}'])
+def test_malformed_body_is_rejected(post, body):
+    response = post(body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_missing_token_is_rejected(post):
+    assert post({'events': []}, token=None).status_code == 401
+
+
+def test_expired_token_is_rejected(post):
+    expired = issue_device_token('kiosk-test', device_token_secret(), days=-1)
+    response = post({'events': []}, token=expired)
+    assert response.status_code == 401
+    assert 'expired' in response.get_json()['error']
+
+
+def test_token_signed_with_another_secret_is_rejected(post):
+    forged = issue_device_token('kiosk-test', 'another-secret-that-is-long-enough-for-hs256')
+    assert post({'events': []}, token=forged).status_code == 401
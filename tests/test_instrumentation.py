@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+import instrumentation
+from app import db
+from instrumentation import metrics
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Client of an instrumented app with a one-query and a query-in-a-loop route"""
+    monkeypatch.setenv('INSTRUMENTATION', 'true')
+    monkeypatch.setenv('N_PLUS_ONE_THRESHOLD', '5')
+    instrumented = Flask(__name__)
+    instrumented.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'instrumented.db'}"
+    db.init_app(instrumented)
+    instrumentation.init_app(instrumented)
+
+    @instrumented.route('/one')
+    def one():
+        return str(db.session.execute(sa.text('SELECT 1')).scalar())
+
+    @instrumented.route('/loop')
+    def loop():
+        return str(sum(db.session.execute(sa.text('SELECT :n'), {'n': n}).scalar() for n in range(6)))
+
+    metrics.reset()
+    yield instrumented.test_client()
+    metrics.reset()
+    with instrumented.app_context():
+        db.engine.dispose()
+
+
+def test_request_reports_its_queries(client):
+    response = client.get('/one')
+    assert response.status_code == 200
+    assert 'desc="1 queries"' in response.headers['Server-Timing']
+
+    rendered = metrics.render()
+    assert 'http_requests_total{endpoint="one",method="GET",status="200"} 1' in rendered
+    assert 'http_request_queries_bucket{endpoint="one",le="1"} 1' in rendered
+    assert 'http_request_queries_count{endpoint="one"} 1' in rendered
+    assert 'http_request_duration_seconds_bucket{endpoint="one",le="+Inf"} 1' in rendered
+
+
+def test_repeated_select_is_flagged(client, caplog):
+    with caplog.at_level(logging.WARNING, logger=instrumentation.__name__):
+        client.get('/one')
+        assert 'desc="6 queries"' in client.get('/loop').headers['Server-Timing']
+
+    assert 'Possible N+1 in GET /loop' in caplog.text
+    assert '/one' not in caplog.text
+    assert metrics.n_plus_one == {'loop': 1}
+
+
+def test_slow_queries_are_logged(client, monkeypatch, caplog):
+    monkeypatch.setenv('SLOW_QUERY_MS', '0')
+    with caplog.at_level(logging.WARNING, logger=instrumentation.__name__):
+        client.get('/one')
+    assert 'Slow query' in caplog.text and 'in GET /one' in caplog.text
+    assert 'db_slow_queries_total{endpoint="one"} 1' in metrics.render()
+
+
+def test_metrics_endpoint_is_disabled_by_default(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_endpoint_requires_the_token(app, monkeypatch):
+    monkeypatch.setenv('INSTRUMENTATION', 'true')
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-token')
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE http_requests_total counter' in response.get_data(as_text=True)
+
+
+def test_metrics_endpoint_without_a_token_is_for_management(app, login, monkeypatch):
+    monkeypatch.setenv('INSTRUMENTATION', 'true')
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    assert login('teacher0001').get('/metrics').status_code == 403
+    assert login('headteacher0001').get('/metrics').status_code == 200
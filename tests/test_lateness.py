@@ -0,0 +1,67 @@
+from datetime import date, datetime, time
+
+import pytest
+
+from app import db
+from lateness import ScheduleIndex, reclassify
+from models import Attendance, Timetable
+
+MONDAY = date(2020, 1, 6)
+TUESDAY = date(2020, 1, 7)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+@pytest.fixture
+def teacher(app, new_user):
+    """A teacher whose first Monday lesson is at 9:00, stored with untidy day names"""
+    user_id = new_user()
+    with app.app_context():
+        db.session.add_all([
+            Timetable(teacher_id=user_id, subject='Maths', day_of_week=' monday', start_time=time(10, 0),
+                      end_time=time(11, 0)),
+            Timetable(teacher_id=user_id, subject='Maths', day_of_week='MONDAY ', start_time=time(9, 0),
+                      end_time=time(10, 0)),
+        ])
+        db.session.commit()
+    return user_id
+
+
+def test_classify_against_the_first_lesson(app, teacher, monkeypatch):
+    monkeypatch.setenv('LATE_THRESHOLD_MINUTES', '15')
+    with app.app_context():
+        index = ScheduleIndex(ttl=0)
+        assert index.first_lesson(teacher, MONDAY) == time(9, 0)
+        assert index.classify(teacher, at(MONDAY, 8, 55)) == 'present'
+        assert index.classify(teacher, at(MONDAY, 9, 15)) == 'present'
+        assert index.classify(teacher, at(MONDAY, 9, 16)) == 'late'
+
+
+def test_classify_without_a_lesson_that_day(app, teacher, new_user):
+    with app.app_context():
+        index = ScheduleIndex(ttl=0)
+        assert index.first_lesson(teacher, TUESDAY) is None
+        assert index.classify(teacher, at(TUESDAY, 11)) == 'present'
+        assert index.classify(new_user(), at(MONDAY, 11)) == 'present'
+
+
+def test_reclassify_rewrites_changed_statuses_only(app, teacher):
+    with app.app_context():
+        rows = [
+            Attendance(user_id=teacher, date=MONDAY, time_in=at(MONDAY, 9, 40), status='present'),
+            Attendance(user_id=teacher, date=MONDAY.replace(day=13), time_in=at(MONDAY.replace(day=13), 8, 50),
+                       status='late'),
+            Attendance(user_id=teacher, date=MONDAY.replace(day=20), time_in=at(MONDAY.replace(day=20), 8, 50),
+                       status='present'),
+            Attendance(user_id=teacher, date=MONDAY.replace(day=27), status='absent'),
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        ids = [row.id for row in rows]
+
+        assert reclassify(MONDAY, MONDAY.replace(day=31), batch_size=2) == (3, 2, {(1, 2020)})
+        db.session.commit()
+        statuses = dict(db.session.query(Attendance.id, Attendance.status).filter(Attendance.id.in_(ids)))
+        assert [statuses[attendance_id] for attendance_id in ids] == ['late', 'present', 'present', 'absent']
@@ -0,0 +1,192 @@
+import json
+import logging
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+import attendance
+import migrations
+from app import db
+from attendance import AttendanceError, record_check_in
+from migrations import MIGRATIONS, explain, hot_queries, upgrade
+from models import Attendance, Salary
+
+# The schema of the first release, before any migration
+BASELINE = [
+    """CREATE TABLE user (
+        id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+        password_hash VARCHAR(120) NOT NULL, role VARCHAR(20) NOT NULL, full_name VARCHAR(100) NOT NULL,
+        phone_number VARCHAR(20), face_encoding TEXT, fingerprint_data TEXT, created_at DATETIME,
+        is_active BOOLEAN)""",
+    """CREATE TABLE attendance (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), date DATE NOT NULL,
+        time_in DATETIME, time_out DATETIME, method VARCHAR(20), status VARCHAR(20), created_at DATETIME)""",
+    """CREATE TABLE timetable (
+        id INTEGER PRIMARY KEY, teacher_id INTEGER NOT NULL REFERENCES user (id), subject VARCHAR(50) NOT NULL,
+        day_of_week VARCHAR(20) NOT NULL, start_time TIME NOT NULL, end_time TIME NOT NULL, room VARCHAR(20),
+        class_name VARCHAR(20))""",
+    """CREATE TABLE performance (
+        id INTEGER PRIMARY KEY, teacher_id INTEGER NOT NULL REFERENCES user (id), month INTEGER NOT NULL,
+        year INTEGER NOT NULL, attendance_score FLOAT, punctuality_score FLOAT, overall_score FLOAT,
+        remarks TEXT, created_at DATETIME)""",
+    """CREATE TABLE salary (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), month INTEGER NOT NULL,
+        year INTEGER NOT NULL, base_salary FLOAT NOT NULL, attendance_bonus FLOAT, performance_bonus FLOAT,
+        total_salary FLOAT NOT NULL, paid BOOLEAN, paid_date DATETIME, created_at DATETIME)""",
+    """CREATE TABLE notification (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id), title VARCHAR(100) NOT NULL,
+        message TEXT NOT NULL, type VARCHAR(20), sent BOOLEAN, sent_at DATETIME, created_at DATETIME)""",
+    """CREATE TABLE procurement (
+        id INTEGER PRIMARY KEY, item_name VARCHAR(100) NOT NULL, description TEXT, quantity INTEGER NOT NULL,
+        unit_price FLOAT NOT NULL, total_amount FLOAT NOT NULL, supplier VARCHAR(100),
+        requested_by INTEGER NOT NULL REFERENCES user (id), approved_by INTEGER REFERENCES user (id),
+        status VARCHAR(20), created_at DATETIME)""",
+]
+
+ENCODING = [i / 128 for i in range(128)]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """App context on a database with the baseline schema and some legacy data"""
+    baseline_app = Flask(__name__)
+    baseline_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'baseline.db'}"
+    db.init_app(baseline_app)
+    with baseline_app.app_context():
+        with db.engine.begin() as connection:
+            for statement in BASELINE:
+                connection.execute(sa.text(statement))
+            users = [
+                (1, 'teacher', json.dumps(ENCODING)),
+                (2, 'teacher', '{not json'),
+                (3, 'teacher', json.dumps([0.5] * 12)),
+                (4, 'student', None),
+            ]
+            for user_id, role, encoding in users:
+                connection.execute(sa.text(
+                    "INSERT INTO user (id, username, email, password_hash, role, full_name, face_encoding, is_active) "
+                    "VALUES (:id, :name, :name || '@school.example', '-', :role, :name, :encoding, 1)"
+                ), {'id': user_id, 'name': f'user{user_id}', 'role': role, 'encoding': encoding})
+            connection.execute(sa.text(
+                "INSERT INTO attendance (id, user_id, date, time_in, status) VALUES "
+                "(1, 1, '2024-03-04', '2024-03-04 08:30:00.000000', 'late'), "
+                "(2, 1, '2024-03-04', '2024-03-04 07:50:00.000000', 'present'), "
+                "(3, 1, '2024-03-04', NULL, 'absent'), "
+                "(4, 1, '2024-03-05', '2024-03-05 07:55:00.000000', 'present')"))
+            connection.execute(sa.text(
+                "INSERT INTO salary (id, user_id, month, year, base_salary, total_salary, paid) VALUES "
+                "(1, 1, 3, 2024, 100, 100, 0), (2, 1, 3, 2024, 100, 110, 1), (3, 1, 3, 2024, 100, 120, 0)"))
+            connection.execute(sa.text(
+                "INSERT INTO performance (id, teacher_id, month, year, overall_score) VALUES "
+                "(1, 1, 3, 2024, 5), (2, 1, 3, 2024, 6), (3, 4, 3, 2024, 7)"))
+            connection.execute(sa.text(
+                "INSERT INTO notification (id, user_id, title, message, type, sent) "
+                "VALUES (1, 1, 'Hello', 'Welcome', 'system', 0)"))
+        yield baseline_app
+
+
+def dump():
+    with db.engine.connect() as connection:
+        tables = sa.inspect(connection).get_table_names()
+        return {table: connection.execute(sa.text(f'SELECT * FROM "{table}" ORDER BY 1')).all()
+                for table in tables}
+
+
+def test_upgrade_from_baseline(baseline, caplog):
+    with caplog.at_level(logging.WARNING, logger=migrations.__name__):
+        assert upgrade(verbose=False) == len(MIGRATIONS)
+    assert 'left for review for users 2, 3' in caplog.text
+
+    with db.engine.connect() as connection:
+        version = connection.execute(sa.text('SELECT version FROM schema_version')).scalar()
+        encodings = dict(connection.execute(sa.text('SELECT id, face_encoding FROM user')).all())
+        attendance = connection.execute(sa.text('SELECT id FROM attendance ORDER BY id')).scalars().all()
+        salaries = connection.execute(sa.text('SELECT id FROM salary')).scalars().all()
+        performance = connection.execute(sa.text('SELECT id FROM performance')).scalars().all()
+        inspector = sa.inspect(connection)
+        indexes = {index['name']: index for table in inspector.get_table_names()
+                   for index in inspector.get_indexes(table)}
+        tables = set(inspector.get_table_names())
+        notification_columns = {column['name'] for column in inspector.get_columns('notification')}
+
+    assert version == MIGRATIONS[-1][0]
+
+    # Valid JSON becomes a float32 blob, malformed values are kept as they were
+    assert np.array_equal(np.frombuffer(encodings[1], dtype=np.float32), np.asarray(ENCODING, dtype=np.float32))
+    assert encodings[2] == '{not json'
+    assert json.loads(encodings[3]) == [0.5] * 12
+    assert encodings[4] is None
+
+    # Earliest check-in, the paid salary and the latest staff performance row survive
+    assert attendance == [2, 4]
+    assert salaries == [2]
+    assert performance == [2]
+
+    for name in ('uq_attendance_user_date', 'uq_salary_user_period', 'uq_performance_period_teacher'):
+        assert indexes[name]['unique']
+    for name in ('ix_attendance_date', 'ix_timetable_teacher', 'ix_salary_period', 'ix_notification_sent'):
+        assert name in indexes
+    assert {'ingested_event', 'attendance_archive'} <= tables
+    assert {'attempts', 'failed_at', 'error'} <= notification_columns
+
+
+def test_second_upgrade_changes_nothing(baseline):
+    upgrade(verbose=False)
+    before = dump()
+    assert upgrade(verbose=False) == 0
+    assert dump() == before
+
+
+def test_steps_are_idempotent(baseline):
+    upgrade(verbose=False)
+    before = dump()
+    for version, description, func in MIGRATIONS:
+        with db.engine.begin() as connection:
+            func(connection)
+    assert dump() == before
+
+
+@pytest.mark.parametrize('name, statement', hot_queries(), ids=[name for name, _ in hot_queries()])
+def test_hot_queries_use_an_index(app, name, statement):
+    with app.app_context(), db.engine.connect() as connection:
+        plan = explain(connection, statement)
+    assert any('USING INDEX' in line or 'USING COVERING INDEX' in line for line in plan), plan
+    assert not any(line.startswith('SCAN') for line in plan), plan
+
+
+@pytest.mark.parametrize('model, fields', [
+    (Attendance, {'date': date(2001, 3, 5), 'status': 'absent'}),
+    (Salary, {'month': 3, 'year': 2001, 'base_salary': 1, 'total_salary': 1}),
+])
+def test_one_row_per_user_and_period(app, new_user, model, fields):
+    user_id = new_user()
+    with app.app_context():
+        db.session.add(model(user_id=user_id, **fields))
+        db.session.commit()
+        db.session.add(model(user_id=user_id, **fields))
+        with pytest.raises(sa.exc.IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_concurrent_check_in_sees_the_committed_row(app, new_user, monkeypatch):
+    user_id = new_user()
+    now = datetime.now()
+    classify = attendance.classify
+
+    def racing_classify(*args):
+        # Another request checks the user in after this one looked for a record
+        monkeypatch.setattr(attendance, 'classify', classify)
+        with db.engine.begin() as connection:
+            connection.execute(sa.insert(Attendance), {
+                'user_id': user_id, 'date': now.date(), 'time_in': now, 'status': 'present'})
+        return classify(*args)
+
+    monkeypatch.setattr(attendance, 'classify', racing_classify)
+    with app.app_context():
+        with pytest.raises(AttendanceError, match='Already checked in'):
+            record_check_in(user_id, when=now)
+        assert Attendance.query.filter_by(user_id=user_id).count() == 1
@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    '["a list"]',
+    '{"title": "Hi", "message": "All", "roles": "teacher"}',
+    '{"title": "Hi", "message": "All", "roles": [["teacher"]]}',
+    '{"title": "Hi", "message": "All", "class_names": {"Form 1": true}}',
+    '{"title": "Hi", "message": "All", "user_ids": [{"id": 1}]}',
+    '{"title": "Hi", "message": "All", "user_ids": ["one"]}',
+    '{"title": {"text": "Hi"}, "message": "All", "roles": ["teacher"]}',
+])
+def test_broadcast_rejects_malformed_json(login, body):
+    response = login('headteacher0001').post('/notifications/broadcast', data=body,
+                                             content_type='application/json')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_broadcast_to_a_role(login):
+    response = login('headteacher0001').post('/notifications/broadcast', json={
+        'title': 'Staff meeting', 'message': 'At 4pm', 'roles': ['teacher']
+    })
+    assert response.status_code == 200
@@ -0,0 +1,103 @@
+import pytest
+
+import payroll
+from app import app as flask_app, db
+from models import Salary, User
+from payroll import compute_salary, run_payroll
+from performance import STAFF_ROLES
+
+
+@pytest.fixture
+def month(app):
+    """A month no other test has run payroll for"""
+    yield 2, 2001
+    with app.app_context():
+        Salary.query.filter_by(month=2, year=2001).delete()
+        db.session.commit()
+
+
+def staff_count():
+    return User.query.filter(User.role.in_(STAFF_ROLES)).count()
+
+
+@pytest.mark.parametrize('score, attendance_bonus, performance_bonus', [
+    (9.0, 1000, 500),
+    (8.0, 1000, 500),
+    (7.5, 0, 500),
+    (7.0, 0, 500),
+    (6.9, 0, 0),
+])
+def test_bonus_thresholds(score, attendance_bonus, performance_bonus):
+    assert compute_salary(10000, score) == (
+        attendance_bonus, performance_bonus, 10000 + attendance_bonus + performance_bonus)
+
+
+def test_bonus_thresholds_follow_the_environment(monkeypatch):
+    monkeypatch.setenv('PERFORMANCE_THRESHOLD', '5')
+    monkeypatch.setenv('ATTENDANCE_BONUS_THRESHOLD', '9.5')
+    assert compute_salary(10000, 9.0) == (0, 500, 10500)
+    assert compute_salary(10000, 9.5) == (1000, 500, 11500)
+    assert compute_salary(10000, 4.9) == (0, 0, 10000)
+
+
+def test_dry_run_writes_nothing(app, month):
+    with app.app_context():
+        result = run_payroll(*month, dry_run=True)
+        assert result.dry_run
+        assert len(result.rows) == staff_count()
+        assert Salary.query.filter_by(month=month[0], year=month[1]).count() == 0
+
+
+def test_dry_run_command_writes_nothing(app, month):
+    output = app.test_cli_runner().invoke(
+        args=['run-payroll', '--month', str(month[0]), '--year', str(month[1]), '--dry-run'])
+    assert output.exit_code == 0, output.output
+    with app.app_context():
+        assert f'Computed {staff_count()} salaries for 2/2001' in output.output
+        assert Salary.query.filter_by(month=month[0], year=month[1]).count() == 0
+
+
+def test_dry_run_route_writes_nothing(app, login, month):
+    response = login('bursar0001').get(f'/salary/calculate?month={month[0]}&year={month[1]}&dry_run=1')
+    assert response.status_code == 200
+    with app.app_context():
+        assert len(response.get_json()['rows']) == staff_count()
+        assert Salary.query.filter_by(month=month[0], year=month[1]).count() == 0
+
+
+def test_second_run_skips_everyone(app, month):
+    with app.app_context():
+        first = run_payroll(*month)
+        second = run_payroll(*month)
+        assert len(first.rows) == staff_count() and first.skipped == 0
+        assert second.rows == [] and second.skipped == staff_count()
+        assert Salary.query.filter_by(month=month[0], year=month[1]).count() == staff_count()
+
+
+def test_concurrent_run_reports_conflicts_as_skipped(app, login, month, monkeypatch):
+    with app.app_context():
+        taken = db.session.query(User.id).filter(User.role.in_(STAFF_ROLES)).order_by(User.id).first()[0]
+    load_scores = payroll.load_scores
+
+    def racing_load_scores(*args, **kwargs):
+        # Another run saves a salary after this one checked for existing rows
+        with db.engine.begin() as connection:
+            connection.execute(db.insert(Salary), {
+                'user_id': taken, 'month': month[0], 'year': month[1], 'base_salary': 1,
+                'attendance_bonus': 0, 'performance_bonus': 0, 'total_salary': 1})
+        monkeypatch.setattr(payroll, 'load_scores', load_scores)
+        return load_scores(*args, **kwargs)
+
+    monkeypatch.setattr(payroll, 'load_scores', racing_load_scores)
+    client = login('bursar0001')
+    response = client.get(f'/salary/calculate?month={month[0]}&year={month[1]}')
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        category, message = session['_flashes'][-1]
+    with app.app_context():
+        total = staff_count()
+        assert category == 'success'
+        assert f'{total - 1} created, 1 already calculated' in message
+        salaries = Salary.query.filter_by(month=month[0], year=month[1]).all()
+        assert len(salaries) == total
+        assert [s.base_salary for s in salaries if s.user_id == taken] == [1]
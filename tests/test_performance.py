@@ -0,0 +1,108 @@
+from datetime import date
+
+import pytest
+
+from app import db
+from models import Attendance, Performance, User
+from performance import STAFF_ROLES, compute_scores, empty_score, months_between, rebuild_month
+
+
+def test_performance_rows_are_kept_for_staff_only(app):
+    today = date.today()
+    with app.app_context():
+        student = User.query.filter_by(role='student').first()
+        db.session.add(Performance(teacher_id=student.id, month=today.month, year=today.year))
+        db.session.commit()
+
+        assert rebuild_month(today.month, today.year) > 0
+        roles = {role for (role,) in db.session.query(User.role).join(
+            Performance, Performance.teacher_id == User.id).filter(
+            Performance.month == today.month, Performance.year == today.year)}
+        assert roles and roles <= set(STAFF_ROLES)
+
+
+def test_reports_do_not_write_the_summary(app, login):
+    today = date.today()
+    with app.app_context():
+        Performance.query.filter_by(month=today.month, year=today.year).delete()
+        db.session.commit()
+
+    try:
+        export = login('headteacher0001').get('/reports/performance/export/csv')
+        assert export.status_code == 200
+        payroll = login('bursar0001').get('/salary/calculate?dry_run=1')
+        assert payroll.status_code == 200
+
+        with app.app_context():
+            assert Performance.query.filter_by(month=today.month, year=today.year).count() == 0
+            scores = compute_scores(today.month, today.year, roles=['teacher'])
+            teachers = dict(db.session.query(User.full_name, User.id).filter_by(role='teacher'))
+        for line in export.get_data(as_text=True).splitlines()[1:]:
+            name, days = line.split(',')[:2]
+            user_id = teachers[name]
+            assert int(days) == scores.get(user_id, empty_score(user_id)).days
+    finally:
+        with app.app_context():
+            rebuild_month(today.month, today.year)
+
+
+def per_teacher_score(teacher_id, month, year):
+    """The per-teacher calculation the scoring engine replaced"""
+    attendances = Attendance.query.filter_by(user_id=teacher_id).filter(
+        db.extract('month', Attendance.date) == month,
+        db.extract('year', Attendance.date) == year
+    ).all()
+    if not attendances:
+        return 0.0
+    total_days = len(attendances)
+    present_days = len([a for a in attendances if a.status == 'present'])
+    on_time_days = len([a for a in attendances if a.status != 'late'])
+    return ((present_days / total_days) * 10 + (on_time_days / total_days) * 10) / 2
+
+
+def test_compute_scores_matches_the_per_teacher_calculation(app):
+    with app.app_context():
+        teachers = [user_id for (user_id,) in db.session.query(User.id).filter_by(role='teacher')]
+        months = {(day.month, day.year) for (day,) in db.session.query(Attendance.date).distinct()}
+        assert months
+        for month, year in months:
+            scores = compute_scores(month, year, roles=['teacher'])
+            for teacher_id in teachers:
+                score = scores.get(teacher_id, empty_score(teacher_id)).score
+                assert score == pytest.approx(per_teacher_score(teacher_id, month, year))
+
+
+@pytest.mark.parametrize('query', ['month=13', 'month=0', 'year=99999'])
+def test_reports_reject_invalid_months(login, query):
+    client = login('headteacher0001')
+    assert client.get(f'/reports/performance?{query}').status_code == 302
+    assert client.get(f'/reports/performance/export/csv?{query}').status_code == 302
+    response = login('bursar0001').get(f'/salary/calculate?dry_run=1&{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_commands_reject_invalid_months(app):
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['run-payroll', '--dry-run', '--month', '13']).exit_code == 2
+    assert runner.invoke(args=['rebuild-performance', '--month', '0']).exit_code == 2
+
+
+@pytest.mark.parametrize('first_day, last_day, months', [
+    (date(2024, 4, 1), date(2024, 3, 31), []),
+    (date(2024, 3, 31), date(2024, 3, 1), [(3, 2024)]),
+    (date(2024, 1, 31), date(2024, 3, 1), [(1, 2024), (2, 2024), (3, 2024)]),
+    (date(2023, 11, 15), date(2024, 2, 29), [(11, 2023), (12, 2023), (1, 2024), (2, 2024)]),
+])
+def test_months_between(first_day, last_day, months):
+    assert list(months_between(first_day, last_day)) == months
+
+
+def test_rebuild_all_covers_every_month_with_attendance(app):
+    with app.app_context():
+        first, last = db.session.query(db.func.min(Attendance.date), db.func.max(Attendance.date)).one()
+    output = app.test_cli_runner().invoke(args=['rebuild-performance', '--all'])
+    assert output.exit_code == 0, output.output
+    rebuilt = [line.split()[1].rstrip(':') for line in output.output.splitlines()]
+    assert rebuilt == [f'{month}/{year}' for month, year in months_between(first, last)]
+    assert rebuilt[0] == f'{first.month}/{first.year}' and rebuilt[-1] == f'{last.month}/{last.year}'
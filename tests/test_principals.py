@@ -0,0 +1,81 @@
+import pytest
+
+from app import db
+from models import User
+from principals import load_principal, principal_cache
+
+
+@pytest.fixture
+def client_for(app):
+    """Test client whose session is logged in as the given user id"""
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return client_for
+
+
+def payroll_status(client):
+    return client.get('/salary/calculate?dry_run=1').status_code
+
+
+def test_principal_is_served_from_the_cache(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        first = load_principal(str(user_id))
+        hits = principal_cache.hits
+        assert load_principal(str(user_id)) is first
+        assert principal_cache.hits == hits + 1
+        assert (first.id, first.role, first.is_active) == (user_id, 'teacher', True)
+        assert load_principal('not a number') is None
+
+
+def test_role_change_takes_effect_on_the_next_request(app, new_user, client_for):
+    user_id = new_user()
+    client = client_for(user_id)
+    assert payroll_status(client) == 302
+
+    with app.app_context():
+        db.session.get(User, user_id).role = 'bursar'
+        db.session.commit()
+    assert payroll_status(client) == 200
+
+
+def test_deactivation_takes_effect_on_the_next_request(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        assert load_principal(user_id).is_active
+        db.session.get(User, user_id).is_active = False
+        db.session.commit()
+        assert not load_principal(user_id).is_active
+
+
+def test_bulk_update_clears_the_cache(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        assert load_principal(user_id).role == 'teacher'
+        User.query.filter_by(id=user_id).update({'role': 'deputy'})
+        db.session.commit()
+        assert load_principal(user_id).role == 'deputy'
+
+
+def test_rolled_back_change_keeps_the_cached_principal(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        principal = load_principal(user_id)
+        db.session.get(User, user_id).role = 'bursar'
+        db.session.flush()
+        db.session.rollback()
+        assert load_principal(user_id) is principal
+        assert principal.role == 'teacher'
+
+
+def test_deleted_user_is_no_longer_loaded(app, new_user):
+    user_id = new_user()
+    with app.app_context():
+        assert load_principal(user_id) is not None
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        assert load_principal(user_id) is None
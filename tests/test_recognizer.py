@@ -0,0 +1,44 @@
+import threading
+from collections import namedtuple
+
+import pytest
+from werkzeug.serving import make_server
+
+from app import db, device_token_secret
+from events import attendance_events
+from ingest import issue_device_token
+from models import User
+from recognizer import IngestClient, Recognizer
+
+Camera = namedtuple('Camera', ['camera'])
+Match = namedtuple('Match', ['user_id', 'distance'])
+
+
+@pytest.fixture
+def ingest_url(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/api/attendance/ingest'
+    server.shutdown()
+
+
+def test_face_check_in_is_published_by_the_web_process(app, ingest_url):
+    with app.app_context():
+        user = User(username='recognized', email='recognized@school.example', password_hash='-',
+                    role='teacher', full_name='Recognized Teacher')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        client = IngestClient(ingest_url, issue_device_token('recognizer-test', device_token_secret()))
+        recognizer = Recognizer([], model='hog', ingest=client)
+        subscription = attendance_events.subscribe()
+        try:
+            recognizer.check_in(Camera('gate'), Match(user_id, 0.3))
+            items = subscription.get(timeout=1)
+        finally:
+            subscription.close()
+
+    assert user_id in recognizer.checked_in
+    assert [(event, data['user_id'], data['method']) for _, event, data in items] == [('check_in', user_id, 'face')]
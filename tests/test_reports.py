@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from models import Attendance
+from reports import ReportError, attendance_page, attendance_query, decode_cursor, encode_cursor
+
+END = date.today()
+START = END - timedelta(days=10)
+
+
+def walk(per_page):
+    pages = [attendance_page(START, END, per_page=per_page)]
+    while pages[-1].next_cursor:
+        pages.append(attendance_page(START, END, cursor=pages[-1].next_cursor, per_page=per_page))
+    return pages
+
+
+def test_pages_cover_the_range_once_in_order(app):
+    with app.app_context():
+        expected = [(row.date, row.id) for row in attendance_query(START, END)]
+        pages = walk(per_page=7)
+
+    assert len(expected) > 7 * 3
+    assert all(len(page.rows) == 7 for page in pages[:-1])
+    assert 0 < len(pages[-1].rows) <= 7
+    assert pages[-1].next_cursor is None
+    assert [(row.date, row.id) for page in pages for row in page.rows] == expected
+
+
+def test_cursor_points_past_the_last_row_of_the_page(app):
+    with app.app_context():
+        page = attendance_page(START, END, per_page=5)
+        last = page.rows[-1]
+        assert page.next_cursor == encode_cursor(last)
+        assert decode_cursor(page.next_cursor) == (last.date, last.id)
+        following = attendance_page(START, END, cursor=page.next_cursor, per_page=5)
+    assert (following.rows[0].date, following.rows[0].id) > (last.date, last.id)
+
+
+def test_rows_added_before_the_cursor_do_not_shift_later_pages(app, new_user):
+    with app.app_context():
+        first = attendance_page(START, END, per_page=5)
+        second = attendance_page(START, END, cursor=first.next_cursor, per_page=5)
+
+        added = Attendance(user_id=new_user(), date=START, status='absent')
+        db.session.add(added)
+        db.session.commit()
+        try:
+            assert attendance_page(START, END, cursor=first.next_cursor, per_page=5).rows == second.rows
+        finally:
+            db.session.delete(added)
+            db.session.commit()
+
+
+@pytest.mark.parametrize('cursor', ['_', 'garbage', '2024-13-01_5', '2024-01-01_x', '2024-01-01_1_2'])
+def test_invalid_cursor_is_rejected(app, cursor):
+    with app.app_context(), pytest.raises(ReportError):
+        attendance_page(START, END, cursor=cursor)
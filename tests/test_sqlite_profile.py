@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+
+from app import db
+from models import User
+from sqlite_profile import WriteQueue, configure_engine
+
+
+@pytest.fixture
+def profile_app(tmp_path):
+    """App on its own SQLite database with the production profile applied"""
+    profile_app = Flask(__name__)
+    profile_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'profile.db'}"
+    db.init_app(profile_app)
+    with profile_app.app_context():
+        configure_engine(db.engine)
+        User.__table__.create(db.engine)
+        yield profile_app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def add_user(name):
+    def job():
+        user = User(username=name, email=f'{name}@school.example', password_hash='-',
+                    role='teacher', full_name=name)
+        db.session.add(user)
+        db.session.flush()
+        return user.id
+    return job
+
+
+def hold(writer):
+    """Occupy the writer until the returned event is set, so later jobs queue up"""
+    started, release = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        return release.wait(5)
+    future = writer.submit(job)
+    assert started.wait(5)
+    return future, release
+
+
+def test_connections_use_the_production_pragmas(profile_app):
+    with db.engine.connect() as connection:
+        pragma = lambda name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1
+        assert pragma('busy_timeout') == 5000
+        assert pragma('temp_store') == 2
+
+
+def test_queued_writes_are_group_committed(profile_app):
+    writer = WriteQueue()
+    writer.init_app(profile_app)
+    try:
+        blocker, release = hold(writer)
+        futures = [writer.submit(add_user(f'queued{number}')) for number in range(10)]
+        release.set()
+
+        assert blocker.result(5) is True
+        ids = [future.result(5) for future in futures]
+        assert len(set(ids)) == 10
+        assert (writer.batches, writer.jobs) == (2, 11)
+        assert User.query.count() == 10
+    finally:
+        writer.stop()
+
+
+def test_failed_job_does_not_undo_the_rest_of_its_batch(profile_app):
+    writer = WriteQueue()
+    writer.init_app(profile_app)
+    try:
+        _, release = hold(writer)
+        first = writer.submit(add_user('original'))
+        duplicate = writer.submit(add_user('original'))
+        last = writer.submit(add_user('another'))
+        release.set()
+
+        assert first.result(5) and last.result(5)
+        with pytest.raises(sa.exc.IntegrityError):
+            duplicate.result(5)
+        assert sorted(name for (name,) in db.session.query(User.username)) == ['another', 'original']
+    finally:
+        writer.stop()
@@ -0,0 +1,21 @@
+from stats_cache import MemoryBackend, StatsCache
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    assert backend.get('a') == 1
+    backend.set('c', 3)
+    assert len(backend) == 2
+    assert backend.get('b') is None
+    assert (backend.get('a'), backend.get('c')) == (1, 3)
+
+
+def test_superseded_versions_do_not_accumulate():
+    backend = MemoryBackend(max_entries=8)
+    cache = StatsCache(backend, ttl=0)
+    for version in range(100):
+        assert cache.get_or_compute('dashboard', ['attendance'], lambda: version) == version
+        cache.bump('attendance')
+    assert len(backend) == 8
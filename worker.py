@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Background job runner
+
+Runs the batch work that used to happen inside user requests on an
+APScheduler cron schedule:
+
+    mark_absent              record users without attendance as absent (school days, evening)
+    precompute_performance   rebuild this and last month's Performance rows (nightly)
+    warm_caches              fill the dashboard statistics cache before school opens
+                             (only with a shared cache: STATS_CACHE_URL=redis://...)
+    send_notifications       deliver queued email/SMS every NOTIFICATION_POLL_SECONDS
+
+Start one worker next to the web processes and set NOTIFICATION_WORKER=False
+on the web processes so only the worker delivers notifications:
+
+    python worker.py
+    python worker.py --run mark_absent --date 2024-05-17   # run one job now
+
+A lock file (WORKER_LOCK_FILE) makes a second worker on the same host exit
+instead of running every job twice. Each run logs its duration and counts.
+Schedules are crontab expressions in JOB_<NAME>; an empty value disables
+a job.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# The send_notifications job delivers from this process; the app must not
+# start its own dispatcher thread next to it
+os.environ['NOTIFICATION_WORKER'] = 'False'
+
+from app import app, db, cached_admin_dashboard_stats, cached_bursar_dashboard_stats  # noqa: E402
+from attendance import mark_absent  # noqa: E402
+from performance import rebuild_month  # noqa: E402
+from notifications import notification_dispatcher  # noqa: E402
+from stats_cache import stats_cache  # noqa: E402
+
+logger = logging.getLogger('worker')
+
+SCHEDULES = {
+    'mark_absent': '30 23 * * mon-fri',
+    'precompute_performance': '0 1 * * *',
+    'warm_caches': '30 6 * * mon-fri',
+}
+
+
+# Jobs: each returns a dict of counts for the log
+def mark_absent_job(day=None):
+    day = day or date.today()
+    return {'day': day.isoformat(), 'marked_absent': mark_absent(day)}
+
+
+def precompute_performance_job(day=None):
+    day = day or date.today()
+    previous = day.replace(day=1) - timedelta(days=1)
+    counts = {}
+    for month, year in [(previous.month, previous.year), (day.month, day.year)]:
+        counts[f'{year}-{month:02d}'] = rebuild_month(month, year)
+    return counts
+
+
+def warm_caches_job(day=None):
+    day = day or date.today()
+    if not stats_cache.backend.shared:
+        # The web processes would never see values cached in this one
+        logger.warning('warm_caches skipped: set STATS_CACHE_URL to a redis:// URL to share the cache')
+        return {'entries': 0}
+    # Entries are invalidated by writes, so they can outlive STATS_CACHE_TTL
+    ttl = float(os.getenv('WARM_CACHE_TTL', 10800))
+    cached_admin_dashboard_stats(day, ttl)
+    cached_bursar_dashboard_stats(day.month, day.year, ttl)
+    return {'entries': 2}
+
+
+def send_notifications_job(day=None):
+    failed = notification_dispatcher.failed
+    sent = notification_dispatcher.drain()
+    return {'sent': sent, 'failed': notification_dispatcher.failed - failed}
+
+
+JOBS = {
+    'mark_absent': mark_absent_job,
+    'precompute_performance': precompute_performance_job,
+    'warm_caches': warm_caches_job,
+    'send_notifications': send_notifications_job,
+}
+
+
+def run_job(name, day=None):
+    """Run one job in an app context, logging its duration and counts"""
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            counts = JOBS[name](day)
+        except Exception:
+            db.session.rollback()
+            logger.exception('%s failed after %.1fs', name, time.perf_counter() - started)
+            return None
+        finally:
+            db.session.remove()
+    # Idle notification polls are only worth logging when debugging
+    level = logging.INFO if any(counts.values()) else logging.DEBUG
+    logger.log(level, '%s finished in %.1fs: %s', name, time.perf_counter() - started,
+               ', '.join(f'{key}={value}' for key, value in counts.items()))
+    return counts
+
+
+def trigger(name):
+    if name == 'send_notifications':
+        return IntervalTrigger(seconds=notification_dispatcher.poll_interval)
+    expression = os.getenv(f'JOB_{name.upper()}', SCHEDULES[name]).strip()
+    return CronTrigger.from_crontab(expression) if expression else None
+
+
+def acquire_lock(path):
+    """Hold an exclusive lock on path for the life of the process; None if taken"""
+    handle = open(path, 'a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    handle.seek(0)
+    handle.truncate()
+    handle.write(f'{os.getpid()}\n')
+    handle.flush()
+    return handle
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Background job runner')
+    parser.add_argument('--run', choices=sorted(JOBS), help='Run one job now and exit')
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help='Day for --run (default: today)')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    # run_job logs every run itself
+    logging.getLogger('apscheduler.executors').setLevel(logging.WARNING)
+
+    if args.run:
+        sys.exit(0 if run_job(args.run, args.date) is not None else 1)
+
+    lock = acquire_lock(os.getenv('WORKER_LOCK_FILE', 'worker.lock'))
+    if lock is None:
+        sys.exit('Another worker holds the lock; exiting')
+
+    scheduler = BlockingScheduler(job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 3600})
+    for name in JOBS:
+        job_trigger = trigger(name)
+        if job_trigger is None:
+            logger.info('%s is disabled', name)
+            continue
+        if name == 'warm_caches' and not stats_cache.backend.shared:
+            logger.info('%s is disabled: the statistics cache is per process without STATS_CACHE_URL', name)
+            continue
+        scheduler.add_job(run_job, job_trigger, args=[name], id=name, name=name)
+        logger.info('%s scheduled: %s', name, job_trigger)
+
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        notification_dispatcher.smtp.close()
+
+
+if __name__ == '__main__':
+    main()